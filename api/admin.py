@@ -0,0 +1,55 @@
+from fastapi import APIRouter
+
+from api.invoke import dispatcher, idempotency_store
+from core.metrics import registry
+from core.response import error, success
+from services.ai.completion_budget import get_completion_budget
+from services.ai.response_cache import get_response_cache
+from services.ai.token_usage import get_usage_ledger
+
+router = APIRouter()
+
+
+@router.get("/admin/stats", summary="Runtime Stats", tags=["admin"])
+async def admin_stats():
+    """
+    进程内各类有界存储的容量与淘汰统计（每个 worker 独立）。
+    """
+    response_cache = get_response_cache()
+
+    return success(
+        data={
+            "state_repo": dispatcher.state_repo.stats(),
+            "idempotency": idempotency_store.stats(),
+            "session_queue": (
+                dispatcher.session_queue.stats() if dispatcher.session_queue else None
+            ),
+            "response_cache": response_cache.stats() if response_cache else None,
+            "latency": registry.snapshot(),
+        }
+    )
+
+
+@router.get("/admin/usage", summary="Token Usage", tags=["admin"])
+async def admin_usage(top: int = 20):
+    """
+    token 用量与估算费用：按事件类型、prompt 模板、会话（用量最高的 top 个）汇总。
+    """
+    return success(data=get_usage_ledger().report(top_sessions=top))
+
+
+@router.get("/admin/usage/{session_id}", summary="Session Token Usage", tags=["admin"])
+async def admin_session_usage(session_id: str):
+    usage = get_usage_ledger().session(session_id)
+    if usage is None:
+        return error(message=f"no usage recorded for session {session_id}", code=404)
+    return success(data=usage)
+
+
+@router.get("/admin/max-tokens", summary="Adaptive max_tokens", tags=["admin"])
+async def admin_max_tokens():
+    """
+    各事件类型 / prompt 版本的输出长度样本与当前自适应 max_tokens。
+    """
+    budget = get_completion_budget()
+    return success(data={"enabled": budget.enabled, "budgets": budget.report()})
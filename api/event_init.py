@@ -10,9 +10,9 @@ service = EventInitService()
 
 
 @router.post("/init", response_model=ApiResponse)
-def init_dnd_event() -> ApiResponse:
+async def init_dnd_event() -> ApiResponse:
     try:
-        result = service.init_dnd_event()
+        result = await service.init_dnd_event()
         return success(data=result.model_dump())
     except ValueError as exc:
         return error(message=str(exc), code=1)
@@ -11,9 +11,9 @@ service = EventNovelService()
 
 
 @router.post("/novel", response_model=ApiResponse)
-def novel(request: NovelRequest) -> ApiResponse:
+async def novel(request: NovelRequest) -> ApiResponse:
     try:
-        result = service.generate(request)
+        result = await service.generate(request)
         return success(data=result.model_dump())
     except ValueError as e:
         return error(message=str(e), code=1)
@@ -1,5 +1,13 @@
-from fastapi import APIRouter
+import json
+from collections.abc import AsyncIterator
+from time import perf_counter
+from typing import Any
 
+from fastapi import APIRouter, Header
+from fastapi.responses import StreamingResponse
+
+from core.exceptions import AppException
+from core.metrics import registry as metrics
 from core.response import error, success
 from events.dispatcher import EventDispatcher
 from events.handlers.init_handler import InitEventHandler
@@ -8,26 +16,144 @@ from events.handlers.combat_handler import CombatEventHandler
 from events.handlers.puzzle_handler import PuzzleEventHandler
 from events.handlers.end_handler import EndEventHandler
 from events.types import EventType
+from repositories.factory import build_state_repository
 from schemas.base import ApiResponse
-from schemas.invoke import InvokeRequest
+from schemas.invoke import InvokeRequest, InvokeResponseData
+from services.idempotency import get_idempotency_store
+from services.session_queue import get_session_queue
 
 router = APIRouter()
 
-dispatcher = EventDispatcher()
+dispatcher = EventDispatcher(
+    state_repo=build_state_repository(),
+    session_queue=get_session_queue(),
+)
 dispatcher.register(EventType.INIT, InitEventHandler())
 dispatcher.register(EventType.DECISION, DecisionEventHandler())
 dispatcher.register(EventType.COMBAT, CombatEventHandler())
 dispatcher.register(EventType.PUZZLE, PuzzleEventHandler())
 dispatcher.register(EventType.END, EndEventHandler())
 
+idempotency_store = get_idempotency_store()
 
 
 @router.post("/invoke", response_model=ApiResponse)
-def invoke(request: InvokeRequest) -> ApiResponse:
+async def invoke(
+    request: InvokeRequest,
+    idempotency_key: str | None = Header(default=None, alias="Idempotency-Key"),
+) -> ApiResponse:
+    """
+    重复提交同一回合（相同 Idempotency-Key，或相同 session / 事件 / 选项 / context）
+    时直接返回已存储的结果，meta.idempotent_replay 为 true。
+
+    同一会话的回合按到达顺序排队执行；排队数超过 SESSION_QUEUE_MAX_DEPTH
+    时返回 code=429。快照版本在回合中被其他写入方更新时返回 code=409。
+    """
+    labels = {"endpoint": "invoke", "event_type": request.event_type.value}
+    in_flight = metrics.gauge("invoke_in_flight", **labels)
+    in_flight.inc()
+    start = perf_counter()
+    try:
+        response = await _invoke(request, idempotency_key)
+    finally:
+        in_flight.dec()
+
+    _record_request(labels, response.code, perf_counter() - start)
+    return response
+
+
+async def _invoke(request: InvokeRequest, idempotency_key: str | None) -> ApiResponse:
     try:
-        result = dispatcher.dispatch(request)
+        key = idempotency_store.build_key(request, idempotency_key)
+        if key is None:
+            result = await dispatcher.adispatch(request)
+        else:
+            result = await idempotency_store.run(
+                key, lambda: dispatcher.adispatch(request)
+            )
         return success(data=result)
+    except AppException as exc:
+        return error(message=exc.message, code=exc.code)
     except ValueError as exc:
         return error(message=str(exc), code=1)
     except Exception as exc:
-        return error(message=f"Invoke failed: {exc}", code=1)
\ No newline at end of file
+        return error(message=f"Invoke failed: {exc}", code=1)
+
+
+@router.post("/invoke/stream")
+async def invoke_stream(
+    request: InvokeRequest,
+    idempotency_key: str | None = Header(default=None, alias="Idempotency-Key"),
+) -> StreamingResponse:
+    """
+    /invoke 的 SSE 流式版本。
+
+    帧格式：
+    - event: scene   data: {"delta": "..."}，场景文本增量，可出现多次
+    - event: result  data: 与 /invoke 相同的 ApiResponse（data 为 InvokeResponseData）
+    - event: error   data: 与 /invoke 相同的 error ApiResponse
+
+    幂等规则与 /invoke 相同；命中已存储结果时只发送 result 帧。
+    """
+    return StreamingResponse(
+        _stream_frames(request, idempotency_key),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def _stream_frames(
+    request: InvokeRequest,
+    idempotency_key: str | None = None,
+) -> AsyncIterator[str]:
+    labels = {"endpoint": "invoke_stream", "event_type": request.event_type.value}
+    in_flight = metrics.gauge("invoke_in_flight", **labels)
+    in_flight.inc()
+    start = perf_counter()
+    response: ApiResponse | None = None
+    try:
+        key = idempotency_store.build_key(request, idempotency_key)
+        stored = idempotency_store.get(key) if key is not None else None
+        if stored is not None:
+            response = success(data=stored)
+            yield _sse_frame("result", response)
+            return
+
+        async for item in dispatcher.astream(request):
+            if isinstance(item, InvokeResponseData):
+                if key is not None:
+                    idempotency_store.put(key, item)
+                response = success(data=item)
+                yield _sse_frame("result", response)
+            else:
+                yield _sse_frame("scene", {"delta": item})
+    except AppException as exc:
+        response = error(message=exc.message, code=exc.code)
+        yield _sse_frame("error", response)
+    except ValueError as exc:
+        response = error(message=str(exc), code=1)
+        yield _sse_frame("error", response)
+    except Exception as exc:
+        response = error(message=f"Invoke failed: {exc}", code=1)
+        yield _sse_frame("error", response)
+    finally:
+        in_flight.dec()
+        # 没有产出最终帧（客户端中途断开）按失败计
+        _record_request(
+            labels,
+            response.code if response is not None else 1,
+            perf_counter() - start,
+        )
+
+
+def _record_request(labels: dict[str, str], code: int, seconds: float) -> None:
+    metrics.inc("invoke_requests_total", code=str(code), **labels)
+    metrics.observe("invoke_request_seconds", seconds, **labels)
+
+
+def _sse_frame(event: str, data: Any) -> str:
+    if isinstance(data, ApiResponse):
+        body = data.model_dump_json()
+    else:
+        body = json.dumps(data, ensure_ascii=False)
+    return f"event: {event}\ndata: {body}\n\n"
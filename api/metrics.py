@@ -0,0 +1,74 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from api.invoke import dispatcher, idempotency_store
+from core.metrics import CollectedSample, registry
+from services.ai.response_cache import get_response_cache
+
+router = APIRouter()
+
+_STATE_GAUGES = ("sessions", "approx_bytes", "pending_snapshots", "pending_events")
+_STATE_COUNTERS = ("evicted_ttl", "evicted_lru", "flushed_items", "flush_errors")
+
+
+def _collect_runtime() -> list[CollectedSample]:
+    """
+    抓取时读取各有界存储的现有统计，请求路径上不额外计数。
+    """
+    samples: list[CollectedSample] = []
+
+    state_stats = dispatcher.state_repo.stats()
+    backend = {"backend": str(state_stats.get("backend"))}
+    for key in _STATE_GAUGES:
+        if key in state_stats:
+            samples.append(("gauge", f"session_store_{key}", backend, state_stats[key]))
+    for key in _STATE_COUNTERS:
+        if key in state_stats:
+            samples.append(("counter", f"session_store_{key}_total", backend, state_stats[key]))
+
+    response_cache = get_response_cache()
+    if response_cache is not None:
+        cache_stats = response_cache.stats()
+        samples.extend(
+            [
+                ("gauge", "llm_response_cache_entries", {}, cache_stats["size"]),
+                ("counter", "llm_response_cache_hits_total", {}, cache_stats["hits"]),
+                ("counter", "llm_response_cache_misses_total", {}, cache_stats["misses"]),
+                ("gauge", "llm_response_cache_hit_ratio", {}, cache_stats["hit_ratio"]),
+            ]
+        )
+
+    idempotency_stats = idempotency_store.stats()
+    samples.extend(
+        [
+            ("gauge", "idempotency_entries", {}, idempotency_stats["size"]),
+            ("gauge", "idempotency_in_flight", {}, idempotency_stats["in_flight"]),
+            ("counter", "idempotency_replays_total", {}, idempotency_stats["replays"]),
+        ]
+    )
+
+    if dispatcher.session_queue is not None:
+        queue_stats = dispatcher.session_queue.stats()
+        samples.extend(
+            [
+                ("gauge", "session_queue_active_sessions", {}, queue_stats["sessions"]),
+                ("gauge", "session_queue_waiting", {}, queue_stats["queued"]),
+                ("counter", "session_queue_rejected_total", {}, queue_stats["rejected"]),
+            ]
+        )
+
+    return samples
+
+
+registry.register_collector(_collect_runtime)
+
+
+@router.get("/metrics", summary="Prometheus Metrics", tags=["health"])
+async def metrics() -> PlainTextResponse:
+    """
+    Prometheus 文本格式指标（每个 worker 独立）。
+    """
+    return PlainTextResponse(
+        registry.render_prometheus(),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
@@ -109,9 +109,21 @@ class Settings(BaseSettings):
 
     # Logging
     log_level: str = Field(default="INFO")
+    log_raw_output_sample_rate: float = Field(default=0.1)
+    log_raw_output_max_chars: int = Field(default=2000)
+
+    # Metrics
+    metrics_enabled: bool = Field(default=True)
 
     # Database
     duckdb_path: str = Field(default="data/app.duckdb")
+    state_backend: str = Field(default="memory")
+    state_write_behind: bool = Field(default=True)
+    state_flush_interval_seconds: float = Field(default=0.5)
+    state_flush_batch_size: int = Field(default=500)
+    state_write_queue_max: int = Field(default=10000)
+    state_write_queue_wait_seconds: float = Field(default=1.0)
+    state_flush_max_retries: int = Field(default=5)
 
     # LLM
     deepseek_api_key: str = Field(default="")
@@ -120,6 +132,46 @@ class Settings(BaseSettings):
     deepseek_model: str = Field(default="deepseek-chat")
     deepseek_timeout: int = Field(default=60)
 
+    # LLM response cache (temperature=0 only)
+    llm_cache_enabled: bool = Field(default=True)
+    llm_cache_backend: str = Field(default="memory")
+    llm_cache_max_entries: int = Field(default=1024)
+    llm_cache_ttl_seconds: int = Field(default=3600)
+    llm_cache_dir: str = Field(default="data/llm_cache")
+
+    # LLM pricing, per 1M tokens (cost estimates only)
+    llm_price_prompt_per_mtok: float = Field(default=0.27)
+    llm_price_cached_prompt_per_mtok: float = Field(default=0.07)
+    llm_price_completion_per_mtok: float = Field(default=1.10)
+
+    # Adaptive max_tokens (percentile of observed completion tokens + margin)
+    llm_adaptive_max_tokens: bool = Field(default=True)
+    llm_max_tokens_percentile: float = Field(default=0.95)
+    llm_max_tokens_margin: float = Field(default=0.25)
+    llm_max_tokens_min_samples: int = Field(default=20)
+    llm_max_tokens_window: int = Field(default=200)
+    llm_max_tokens_floor: int = Field(default=64)
+
+    # Prompt budget (estimated tokens per section, 0 = unlimited)
+    prompt_history_budget_tokens: int = Field(default=1500)
+    prompt_state_flags_budget_tokens: int = Field(default=300)
+    prompt_context_budget_tokens: int = Field(default=400)
+
+    # Session store
+    event_log_max_events: int = Field(default=64)
+    session_max_sessions: int = Field(default=10000)
+    session_max_bytes: int = Field(default=256 * 1024 * 1024)
+    session_default_ttl_seconds: int = Field(default=1800)
+    session_ttl_grace_seconds: int = Field(default=600)
+    session_store_stripes: int = Field(default=16)
+
+    # /invoke idempotency
+    idempotency_max_entries: int = Field(default=2048)
+    idempotency_ttl_seconds: int = Field(default=600)
+
+    # Per-session turn queue (waiting turns beyond the running one)
+    session_queue_max_depth: int = Field(default=2)
+
     # Event routing config
     init_allowed_next_events_raw: str = Field(
         default="decision,combat,puzzle"
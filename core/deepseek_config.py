@@ -12,6 +12,33 @@ load_dotenv(PROJECT_ROOT / ".env")
 DEFAULT_BASE_URL = "https://api.deepseek.com/v1"
 DEFAULT_MODEL = "deepseek-chat"
 DEFAULT_TIMEOUT = 60
+DEFAULT_CONNECT_TIMEOUT = 10.0
+DEFAULT_MAX_CONNECTIONS = 200
+DEFAULT_MAX_KEEPALIVE_CONNECTIONS = 50
+DEFAULT_KEEPALIVE_EXPIRY = 30.0
+
+
+def _read_int(name: str, default: int) -> int:
+    raw = os.getenv(name, str(default)).strip()
+    try:
+        return int(raw)
+    except ValueError:
+        return default
+
+
+def _read_float(name: str, default: float) -> float:
+    raw = os.getenv(name, str(default)).strip()
+    try:
+        return float(raw)
+    except ValueError:
+        return default
+
+
+def _read_bool(name: str, default: bool) -> bool:
+    raw = os.getenv(name, "").strip().lower()
+    if not raw:
+        return default
+    return raw in {"1", "true", "yes", "on"}
 
 
 @dataclass(frozen=True)
@@ -21,6 +48,13 @@ class DeepSeekConfig:
     model: str = DEFAULT_MODEL
     timeout: int = DEFAULT_TIMEOUT
 
+    # 异步连接池（AsyncDeepSeekProvider 使用）
+    connect_timeout: float = DEFAULT_CONNECT_TIMEOUT
+    max_connections: int = DEFAULT_MAX_CONNECTIONS
+    max_keepalive_connections: int = DEFAULT_MAX_KEEPALIVE_CONNECTIONS
+    keepalive_expiry: float = DEFAULT_KEEPALIVE_EXPIRY
+    http2: bool = False
+
     @classmethod
     def from_env(cls) -> "DeepSeekConfig":
         api_key = os.getenv("DEEPSEEK_API_KEY", "").strip()
@@ -30,15 +64,23 @@ class DeepSeekConfig:
         base_url = os.getenv("DEEPSEEK_BASE_URL", DEFAULT_BASE_URL).strip()
         model = os.getenv("DEEPSEEK_MODEL", DEFAULT_MODEL).strip()
 
-        timeout_raw = os.getenv("DEEPSEEK_TIMEOUT", str(DEFAULT_TIMEOUT)).strip()
-        try:
-            timeout = int(timeout_raw)
-        except ValueError:
-            timeout = DEFAULT_TIMEOUT
-
         return cls(
             api_key=api_key,
             base_url=base_url or DEFAULT_BASE_URL,
             model=model or DEFAULT_MODEL,
-            timeout=timeout,
-        )
\ No newline at end of file
+            timeout=_read_int("DEEPSEEK_TIMEOUT", DEFAULT_TIMEOUT),
+            connect_timeout=_read_float(
+                "DEEPSEEK_CONNECT_TIMEOUT", DEFAULT_CONNECT_TIMEOUT
+            ),
+            max_connections=_read_int(
+                "DEEPSEEK_MAX_CONNECTIONS", DEFAULT_MAX_CONNECTIONS
+            ),
+            max_keepalive_connections=_read_int(
+                "DEEPSEEK_MAX_KEEPALIVE_CONNECTIONS",
+                DEFAULT_MAX_KEEPALIVE_CONNECTIONS,
+            ),
+            keepalive_expiry=_read_float(
+                "DEEPSEEK_KEEPALIVE_EXPIRY", DEFAULT_KEEPALIVE_EXPIRY
+            ),
+            http2=_read_bool("DEEPSEEK_HTTP2", False),
+        )
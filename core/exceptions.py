@@ -21,6 +21,33 @@ class AppException(Exception):
         super().__init__(message)
 
 
+class StateConflictError(AppException):
+    """
+    会话状态写入冲突：同一会话已有回合在进行，或快照版本已被其他回合更新。
+    """
+
+    def __init__(self, message: str = "session state conflict", code: int = 409):
+        super().__init__(message, code)
+
+
+class SessionBusyError(AppException):
+    """
+    同一会话排队等待的回合已达上限，直接拒绝而不是继续排队。
+    """
+
+    def __init__(self, message: str = "session is busy", code: int = 429):
+        super().__init__(message, code)
+
+
+class StateBackpressureError(AppException):
+    """
+    状态写回队列已满（后端落盘跟不上或持续失败），拒绝本次写入而不是阻塞事件循环。
+    """
+
+    def __init__(self, message: str = "state store is overloaded", code: int = 503):
+        super().__init__(message, code)
+
+
 async def app_exception_handler(request: Request, exc: AppException) -> JSONResponse:
     logger.warning("AppException occurred: %s", exc.message)
     return JSONResponse(
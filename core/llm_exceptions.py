@@ -15,4 +15,8 @@ class LLMSchemaValidationError(LLMOutputError):
 
 
 class LLMInvokeError(LLMOutputError):
-    """LLM 调用过程失败。"""
\ No newline at end of file
+    """LLM 调用过程失败。"""
+
+
+class LLMTruncatedOutputError(LLMJsonParseError):
+    """LLM 输出在 JSON 闭合前结束（通常是 max_tokens 不够）。"""
@@ -1,29 +1,105 @@
+import atexit
 import logging
+import queue
+import random
+from logging.handlers import QueueHandler, QueueListener
 from typing import Optional
 
 from core.config import settings
 
 
 _LOGGING_CONFIGURED = False
+_LISTENER: Optional[QueueListener] = None
+_QUEUE_HANDLER: Optional[QueueHandler] = None
 
 
 def setup_logging(level: Optional[str] = None) -> None:
-    global _LOGGING_CONFIGURED
+    """
+    非阻塞日志管线：
+
+    - 根 logger 只挂一个 QueueHandler，请求线程里只做格式化参数合并 + 入队
+    - 后台 QueueListener 线程负责真正写 stderr
+    - 进程退出（或 shutdown_logging）时停止监听线程并刷出剩余日志
+    """
+    global _LOGGING_CONFIGURED, _LISTENER, _QUEUE_HANDLER
 
     if _LOGGING_CONFIGURED:
         return
 
     log_level = (level or settings.log_level or "INFO").upper()
 
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(
+        logging.Formatter(
+            fmt="%(asctime)s | %(levelname)s | %(name)s | %(message)s",
+            datefmt="%Y-%m-%d %H:%M:%S",
+        )
+    )
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    _QUEUE_HANDLER = QueueHandler(log_queue)
+    # 入队前只合并 message（含异常堆栈），完整格式交给监听线程里的 handler
+    _QUEUE_HANDLER.setFormatter(logging.Formatter("%(message)s"))
+    _LISTENER = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+
     logging.basicConfig(
         level=getattr(logging, log_level, logging.INFO),
-        format="%(asctime)s | %(levelname)s | %(name)s | %(message)s",
-        datefmt="%Y-%m-%d %H:%M:%S",
+        handlers=[_QUEUE_HANDLER],
     )
 
+    _LISTENER.start()
+    atexit.register(shutdown_logging)
+
     _LOGGING_CONFIGURED = True
 
 
+def shutdown_logging() -> None:
+    """
+    停止后台监听线程并刷出队列；之后的日志改为直接同步输出，不会丢失。
+    """
+    global _LISTENER
+
+    if _LISTENER is None:
+        return
+
+    listener, _LISTENER = _LISTENER, None
+    listener.stop()
+
+    root = logging.getLogger()
+    if _QUEUE_HANDLER in root.handlers:
+        root.removeHandler(_QUEUE_HANDLER)
+    for handler in listener.handlers:
+        root.addHandler(handler)
+
+
 def get_logger(name: str) -> logging.Logger:
     setup_logging()
-    return logging.getLogger(name)
\ No newline at end of file
+    return logging.getLogger(name)
+
+
+def log_sampled_debug(
+    logger: logging.Logger,
+    title: str,
+    text: str,
+    *,
+    sample_rate: Optional[float] = None,
+    max_chars: Optional[int] = None,
+) -> None:
+    """
+    按采样率在 DEBUG 级别记录大段文本（如模型原始输出），超长部分截断。
+
+    DEBUG 未开启或未命中采样时直接返回，不做任何字符串处理。
+    """
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+
+    rate = settings.log_raw_output_sample_rate if sample_rate is None else sample_rate
+    if rate <= 0 or (rate < 1 and random.random() >= rate):
+        return
+
+    limit = settings.log_raw_output_max_chars if max_chars is None else max_chars
+    size = len(text)
+    if limit and size > limit:
+        text = f"{text[:limit]}...(truncated, {size} chars)"
+
+    logger.debug("%s (%s chars)\n%s", title, size, text)
@@ -0,0 +1,405 @@
+import logging
+import math
+import threading
+from bisect import bisect_left
+from contextvars import ContextVar
+from threading import Lock
+from time import perf_counter
+from typing import Any, Callable, Optional, TypeVar
+
+from core.config import settings
+from core.logging import get_logger
+
+
+logger = get_logger(__name__)
+
+T = TypeVar("T")
+
+# 秒；覆盖从亚毫秒的本地阶段到数十秒的模型调用
+DEFAULT_BUCKETS: tuple[float, ...] = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+
+
+Labels = tuple[tuple[str, str], ...]
+# (kind, name, labels, value)
+CollectedSample = tuple[str, str, dict[str, str], float]
+
+
+class _Shards:
+    """
+    每个线程一份分片：写入只碰本线程的分片，不加锁；
+    读取（抓取指标）时汇总所有分片。只有线程第一次写入时登记分片才加锁。
+    """
+
+    __slots__ = ("_factory", "_local", "_all", "_lock")
+
+    def __init__(self, factory: Callable[[], Any]) -> None:
+        self._factory = factory
+        self._local = threading.local()
+        self._all: list[Any] = []
+        self._lock = Lock()
+
+    def mine(self) -> Any:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._factory()
+            self._local.shard = shard
+            with self._lock:
+                self._all.append(shard)
+        return shard
+
+    def all(self) -> list[Any]:
+        return list(self._all)
+
+
+class Counter:
+    """
+    分片计数器；Gauge 复用同一实现（允许 dec）。
+    """
+
+    __slots__ = ("_shards",)
+
+    def __init__(self) -> None:
+        self._shards = _Shards(lambda: [0.0])
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._shards.mine()[0] += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        self._shards.mine()[0] -= amount
+
+    @property
+    def value(self) -> float:
+        return sum(shard[0] for shard in self._shards.all())
+
+
+class _HistogramShard:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, size: int) -> None:
+        self.counts = [0] * size
+        self.sum = 0.0
+        self.count = 0
+
+
+class Histogram:
+    """
+    固定桶直方图：counts[i] 为落在 (buckets[i-1], buckets[i]] 的次数，
+    最后一格是 +Inf。按线程分片，observe 不加锁。
+    """
+
+    __slots__ = ("buckets", "_shards")
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self.buckets = buckets
+        size = len(buckets) + 1
+        self._shards = _Shards(lambda: _HistogramShard(size))
+
+    def observe(self, value: float) -> None:
+        shard = self._shards.mine()
+        shard.counts[bisect_left(self.buckets, value)] += 1
+        shard.sum += value
+        shard.count += 1
+
+    def snapshot(self) -> dict[str, Any]:
+        counts = [0] * (len(self.buckets) + 1)
+        total = 0.0
+        count = 0
+        for shard in self._shards.all():
+            for index, bucket_count in enumerate(shard.counts):
+                counts[index] += bucket_count
+            total += shard.sum
+            count += shard.count
+
+        cumulative: dict[str, int] = {}
+        running = 0
+        for bound, bucket_count in zip((*self.buckets, "+Inf"), counts):
+            running += bucket_count
+            cumulative[str(bound)] = running
+
+        return {"buckets": cumulative, "sum": total, "count": count}
+
+
+class MetricsRegistry:
+    """
+    进程内指标注册表：按 (name, labels) 维护计数器 / gauge / 直方图。
+
+    - 写入路径只做一次字典查找 + 本线程分片累加，不持锁
+    - 新建指标（首次出现的 name + labels 组合）才加锁
+    - collector：抓取时才读取的指标（如会话数、缓存命中数），
+      返回 (kind, name, labels, value) 列表，kind 为 counter / gauge
+    """
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self._buckets = buckets
+        self._counters: dict[tuple[str, Labels], Counter] = {}
+        self._gauges: dict[tuple[str, Labels], Counter] = {}
+        self._histograms: dict[tuple[str, Labels], Histogram] = {}
+        self._collectors: list[Callable[[], list[CollectedSample]]] = []
+        self._lock = Lock()
+
+    def _get(self, table: dict, name: str, labels: dict[str, str], factory: Callable[[], Any]):
+        key = (name, tuple(sorted(labels.items())))
+        metric = table.get(key)
+        if metric is None:
+            with self._lock:
+                metric = table.get(key)
+                if metric is None:
+                    metric = factory()
+                    table[key] = metric
+        return metric
+
+    def counter(self, name: str, **labels: str) -> Counter:
+        return self._get(self._counters, name, labels, Counter)
+
+    def gauge(self, name: str, **labels: str) -> Counter:
+        return self._get(self._gauges, name, labels, Counter)
+
+    def histogram(self, name: str, **labels: str) -> Histogram:
+        return self._get(
+            self._histograms, name, labels, lambda: Histogram(self._buckets)
+        )
+
+    def inc(self, name: str, amount: float = 1.0, **labels: str) -> None:
+        self.counter(name, **labels).inc(amount)
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        self.histogram(name, **labels).observe(value)
+
+    def register_collector(self, collector: Callable[[], list[CollectedSample]]) -> None:
+        self._collectors.append(collector)
+
+    def snapshot(self) -> list[dict[str, Any]]:
+        """
+        直方图快照（JSON 友好），供 admin 接口展示。
+        """
+        return [
+            {"name": name, "labels": dict(labels), **histogram.snapshot()}
+            for (name, labels), histogram in list(self._histograms.items())
+        ]
+
+    def render_prometheus(self) -> str:
+        """
+        Prometheus 文本格式（0.0.4）。
+        """
+        lines: list[str] = []
+
+        def emit(kind: str, samples: list[tuple[str, Labels | dict, float]]) -> None:
+            seen: set[str] = set()
+            for name, labels, value in sorted(samples, key=lambda item: item[0]):
+                if name not in seen:
+                    seen.add(name)
+                    lines.append(f"# TYPE {name} {kind}")
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+        counters = [
+            (name, labels, metric.value) for (name, labels), metric in list(self._counters.items())
+        ]
+        gauges = [
+            (name, labels, metric.value) for (name, labels), metric in list(self._gauges.items())
+        ]
+        for collector in self._collectors:
+            try:
+                samples = collector()
+            except Exception:
+                logger.exception("metrics collector failed")
+                continue
+            for kind, name, labels, value in samples:
+                (counters if kind == "counter" else gauges).append((name, labels, value))
+
+        emit("counter", counters)
+        emit("gauge", gauges)
+
+        seen: set[str] = set()
+        for (name, labels), histogram in sorted(
+            list(self._histograms.items()), key=lambda item: item[0][0]
+        ):
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# TYPE {name} histogram")
+            data = histogram.snapshot()
+            for bound, count in data["buckets"].items():
+                bucket_labels = dict(labels)
+                bucket_labels["le"] = bound
+                lines.append(f"{name}_bucket{_format_labels(bucket_labels)} {count}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(data['sum'])}")
+            lines.append(f"{name}_count{_format_labels(labels)} {data['count']}")
+
+        return "\n".join(lines) + "\n"
+
+    def clear(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Labels | dict[str, str]) -> str:
+    items = labels.items() if isinstance(labels, dict) else labels
+    if not items:
+        return ""
+    body = ",".join(f'{key}="{_escape_label(str(value))}"' for key, value in items)
+    return "{" + body + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+
+registry = MetricsRegistry()
+
+_current_turn: ContextVar[Optional["TurnTimings"]] = ContextVar(
+    "current_turn_timings",
+    default=None,
+)
+
+
+class TurnTimings:
+    """
+    一个事件回合内各阶段的耗时。
+
+    with 块内通过 stage() / timed() 记录的阶段都归到当前回合；
+    退出时写入直方图：
+    - event_stage_seconds{event_type, stage}
+    - event_turn_seconds{event_type}
+    并在 DEBUG 日志里按 trace_id 输出本回合的逐阶段耗时。
+    trace_id 只进日志，不作为直方图标签（基数无界）。
+    """
+
+    __slots__ = ("event_type", "trace_id", "stages", "_start", "_token")
+
+    def __init__(self, event_type: str) -> None:
+        self.event_type = event_type
+        self.trace_id: str | None = None
+        self.stages: list[tuple[str, float]] = []
+        self._start = 0.0
+        self._token = None
+
+    def add(self, stage: str, seconds: float) -> None:
+        self.stages.append((stage, seconds))
+
+    def set_trace_id(self, trace_id: str | None) -> None:
+        self.trace_id = trace_id
+
+    def __enter__(self) -> "TurnTimings":
+        self._token = _current_turn.set(self)
+        self._start = perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        total = perf_counter() - self._start
+        try:
+            _current_turn.reset(self._token)
+        except ValueError:
+            # 异步生成器可能在另一个上下文里被关闭
+            _current_turn.set(None)
+
+        for stage, seconds in self.stages:
+            registry.observe(
+                "event_stage_seconds",
+                seconds,
+                event_type=self.event_type,
+                stage=stage,
+            )
+        registry.observe("event_turn_seconds", total, event_type=self.event_type)
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "turn timings event_type=%s trace_id=%s total=%.4fs %s",
+                self.event_type,
+                self.trace_id,
+                total,
+                " ".join(f"{stage}={seconds:.4f}s" for stage, seconds in self.stages),
+            )
+
+
+class _NullTurn:
+    __slots__ = ()
+
+    def set_trace_id(self, trace_id: str | None) -> None:
+        return None
+
+    def __enter__(self) -> "_NullTurn":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        return None
+
+
+class _Span:
+    __slots__ = ("timings", "stage", "start")
+
+    def __init__(self, timings: TurnTimings, stage: str) -> None:
+        self.timings = timings
+        self.stage = stage
+        self.start = 0.0
+
+    def __enter__(self) -> None:
+        self.start = perf_counter()
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.timings.add(self.stage, perf_counter() - self.start)
+
+
+_NULL_TURN = _NullTurn()
+
+
+def track_turn(event_type: str) -> TurnTimings | _NullTurn:
+    """
+    开始记录一个回合；METRICS_ENABLED=false 时返回空实现，
+    回合内的 stage() / timed() 也随之退化为直接执行。
+    """
+    if not settings.metrics_enabled:
+        return _NULL_TURN
+    return TurnTimings(event_type)
+
+
+def stage(name: str) -> _Span | _NullTurn:
+    """
+    with stage("build_prompt"): ... 记录一段代码块的耗时。
+    """
+    timings = _current_turn.get()
+    if timings is None:
+        return _NULL_TURN
+    return _Span(timings, name)
+
+
+def timed(name: str, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """
+    timed("parse_json", parse_json_object, raw_text)：记录单次调用的耗时。
+    """
+    timings = _current_turn.get()
+    if timings is None:
+        return fn(*args, **kwargs)
+
+    start = perf_counter()
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        timings.add(name, perf_counter() - start)
@@ -0,0 +1,140 @@
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+from threading import Lock
+
+import duckdb
+
+from core.logging import get_logger
+
+
+logger = get_logger(__name__)
+
+
+# (version, statements)，只追加，不修改已发布的版本
+MIGRATIONS: list[tuple[int, list[str]]] = [
+    (
+        1,
+        [
+            """
+            CREATE TABLE IF NOT EXISTS session_snapshots (
+                session_id VARCHAR PRIMARY KEY,
+                event_type VARCHAR NOT NULL,
+                ai_state VARCHAR NOT NULL,
+                last_output VARCHAR NOT NULL,
+                updated_at TIMESTAMP NOT NULL DEFAULT current_timestamp
+            )
+            """,
+            "CREATE SEQUENCE IF NOT EXISTS session_events_seq",
+            """
+            CREATE TABLE IF NOT EXISTS session_events (
+                id BIGINT PRIMARY KEY DEFAULT nextval('session_events_seq'),
+                session_id VARCHAR NOT NULL,
+                event_type VARCHAR NOT NULL,
+                scene_summary VARCHAR NOT NULL DEFAULT '',
+                selected_option_text VARCHAR NOT NULL DEFAULT '',
+                result_summary VARCHAR NOT NULL DEFAULT '',
+                created_at TIMESTAMP NOT NULL DEFAULT current_timestamp
+            )
+            """,
+            """
+            CREATE INDEX IF NOT EXISTS idx_session_events_session
+            ON session_events (session_id, id)
+            """,
+        ],
+    ),
+    (
+        2,
+        [
+            "ALTER TABLE session_snapshots ADD COLUMN IF NOT EXISTS version BIGINT DEFAULT 0",
+            "UPDATE session_snapshots SET version = 1 WHERE version IS NULL OR version = 0",
+        ],
+    ),
+    (
+        3,
+        [
+            # 随事件写入增量维护的会话摘要（含折叠记忆），读取时不再重放日志
+            """
+            CREATE TABLE IF NOT EXISTS session_summaries (
+                session_id VARCHAR PRIMARY KEY,
+                total_events BIGINT NOT NULL,
+                event_counts VARCHAR NOT NULL,
+                choice_count BIGINT NOT NULL,
+                journey VARCHAR NOT NULL,
+                memory VARCHAR NOT NULL,
+                updated_at TIMESTAMP NOT NULL DEFAULT current_timestamp
+            )
+            """,
+        ],
+    ),
+]
+
+
+class DuckDBClient:
+    """
+    DuckDB 连接的最小封装。
+
+    - 进程内只持有一个写连接，写操作串行并包在事务里
+    - 读操作每次从写连接派生独立 cursor，互不阻塞
+    - 启动时按 schema_version 执行未应用的迁移
+
+    注意：DuckDB 文件同一时间只允许一个进程以读写模式打开，
+    多个 gunicorn worker 同时打开同一个文件会因文件锁失败。
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        if path != ":memory:":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+
+        self._conn = duckdb.connect(path)
+        self._write_lock = Lock()
+
+    @contextmanager
+    def writer(self) -> Iterator[duckdb.DuckDBPyConnection]:
+        """
+        串行化的写事务，异常时回滚。
+        """
+        with self._write_lock:
+            self._conn.begin()
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.rollback()
+                raise
+            else:
+                self._conn.commit()
+
+    @contextmanager
+    def reader(self) -> Iterator[duckdb.DuckDBPyConnection]:
+        cursor = self._conn.cursor()
+        try:
+            yield cursor
+        finally:
+            cursor.close()
+
+    def migrate(self) -> int:
+        """
+        执行未应用的迁移，返回当前 schema 版本。
+        """
+        with self.writer() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)"
+            )
+            row = conn.execute("SELECT max(version) FROM schema_version").fetchone()
+            current = row[0] or 0
+
+            for version, statements in MIGRATIONS:
+                if version <= current:
+                    continue
+                for statement in statements:
+                    conn.execute(statement)
+                conn.execute("INSERT INTO schema_version VALUES (?)", [version])
+                logger.info("duckdb schema migrated to version %s", version)
+                current = version
+
+        return current
+
+    def close(self) -> None:
+        with self._write_lock:
+            self._conn.close()
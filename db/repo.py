@@ -0,0 +1,155 @@
+import duckdb
+
+
+def upsert_snapshots(
+    conn: duckdb.DuckDBPyConnection,
+    rows: list[tuple[str, str, str, str, int]],
+) -> None:
+    """
+    rows: (session_id, event_type, ai_state_json, last_output_json, version)
+    """
+    conn.executemany(
+        """
+        INSERT INTO session_snapshots
+            (session_id, event_type, ai_state, last_output, version, updated_at)
+        VALUES (?, ?, ?, ?, ?, current_timestamp)
+        ON CONFLICT (session_id) DO UPDATE SET
+            event_type = excluded.event_type,
+            ai_state = excluded.ai_state,
+            last_output = excluded.last_output,
+            version = excluded.version,
+            updated_at = excluded.updated_at
+        """,
+        rows,
+    )
+
+
+def insert_events(
+    conn: duckdb.DuckDBPyConnection,
+    rows: list[tuple[str, str, str, str, str]],
+) -> None:
+    """
+    rows: (session_id, event_type, scene_summary, selected_option_text, result_summary)
+    """
+    conn.executemany(
+        """
+        INSERT INTO session_events
+            (session_id, event_type, scene_summary, selected_option_text, result_summary)
+        VALUES (?, ?, ?, ?, ?)
+        """,
+        rows,
+    )
+
+
+def fetch_snapshot(
+    conn: duckdb.DuckDBPyConnection,
+    session_id: str,
+) -> tuple[str, str, str, int] | None:
+    """
+    返回 (event_type, ai_state_json, last_output_json, version)。
+    """
+    return conn.execute(
+        """
+        SELECT event_type, ai_state, last_output, version
+        FROM session_snapshots
+        WHERE session_id = ?
+        """,
+        [session_id],
+    ).fetchone()
+
+
+def fetch_snapshot_versions(
+    conn: duckdb.DuckDBPyConnection,
+    session_ids: list[str],
+) -> dict[str, int]:
+    """
+    批量读取快照版本：{session_id: version}，没有快照的会话不出现。
+    """
+    rows = conn.execute(
+        """
+        SELECT session_id, version
+        FROM session_snapshots
+        WHERE session_id IN (SELECT unnest(?::VARCHAR[]))
+        """,
+        [session_ids],
+    ).fetchall()
+    return {session_id: version or 0 for session_id, version in rows}
+
+
+def fetch_events(
+    conn: duckdb.DuckDBPyConnection,
+    session_id: str,
+    limit: int | None,
+) -> list[tuple[str, str, str, str]]:
+    """
+    按时间顺序返回最近 limit 条事件（None 为全部）：
+    (event_type, scene_summary, selected_option_text, result_summary)
+    """
+    if limit is None:
+        return conn.execute(
+            """
+            SELECT event_type, scene_summary, selected_option_text, result_summary
+            FROM session_events
+            WHERE session_id = ?
+            ORDER BY id
+            """,
+            [session_id],
+        ).fetchall()
+
+    return conn.execute(
+        """
+        SELECT event_type, scene_summary, selected_option_text, result_summary
+        FROM (
+            SELECT id, event_type, scene_summary, selected_option_text, result_summary
+            FROM session_events
+            WHERE session_id = ?
+            ORDER BY id DESC
+            LIMIT ?
+        )
+        ORDER BY id
+        """,
+        [session_id, limit],
+    ).fetchall()
+
+
+def upsert_summaries(
+    conn: duckdb.DuckDBPyConnection,
+    rows: list[tuple[str, int, str, int, str, str]],
+) -> None:
+    """
+    rows: (session_id, total_events, event_counts_json, choice_count, journey, memory_json)
+    """
+    conn.executemany(
+        """
+        INSERT INTO session_summaries
+            (session_id, total_events, event_counts, choice_count, journey, memory, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, current_timestamp)
+        ON CONFLICT (session_id) DO UPDATE SET
+            total_events = excluded.total_events,
+            event_counts = excluded.event_counts,
+            choice_count = excluded.choice_count,
+            journey = excluded.journey,
+            memory = excluded.memory,
+            updated_at = excluded.updated_at
+        """,
+        rows,
+    )
+
+
+def fetch_summaries(
+    conn: duckdb.DuckDBPyConnection,
+    session_ids: list[str],
+) -> dict[str, tuple[int, str, int, str, str]]:
+    """
+    批量读取会话摘要：
+    {session_id: (total_events, event_counts_json, choice_count, journey, memory_json)}
+    """
+    rows = conn.execute(
+        """
+        SELECT session_id, total_events, event_counts, choice_count, journey, memory
+        FROM session_summaries
+        WHERE session_id IN (SELECT unnest(?::VARCHAR[]))
+        """,
+        [session_ids],
+    ).fetchall()
+    return {row[0]: tuple(row[1:]) for row in rows}
@@ -1,16 +1,49 @@
+import asyncio
 from abc import ABC, abstractmethod
+from collections.abc import AsyncIterator
 
+from repositories.state_repository import StateRepository
 from schemas.invoke import InvokeRequest, InvokeResponseData
 
 
 class BaseEventHandler(ABC):
     """
     所有事件处理器的统一接口约定。
+
+    - handle：同步实现（必须）
+    - ahandle：异步实现（可选）。未覆盖时回退为在线程池中执行 handle，
+      保证旧的同步 handler 仍可挂在异步 /invoke 链路上。
+    - astream：流式实现（可选）。先产出若干 str 文本增量，
+      最后产出一个完整的 InvokeResponseData。未覆盖时只产出最终结果。
+    - bind_state_repo：注册到 dispatcher 时注入共享的会话仓储。
     """
 
+    state_repo: StateRepository | None = None
+
+    def bind_state_repo(self, state_repo: StateRepository) -> None:
+        """
+        注入会话仓储，所有 handler 读写同一份会话状态。
+        """
+        self.state_repo = state_repo
+
     @abstractmethod
     def handle(self, request: InvokeRequest) -> InvokeResponseData:
         """
         接收统一事件请求，返回统一事件 data 结构。
         """
-        raise NotImplementedError
\ No newline at end of file
+        raise NotImplementedError
+
+    async def ahandle(self, request: InvokeRequest) -> InvokeResponseData:
+        """
+        异步入口，默认适配到同步 handle。
+        """
+        return await asyncio.to_thread(self.handle, request)
+
+    async def astream(
+        self,
+        request: InvokeRequest,
+    ) -> AsyncIterator[str | InvokeResponseData]:
+        """
+        流式入口，默认不产出中间文本，只产出最终结果。
+        """
+        yield await self.ahandle(request)
@@ -1,6 +1,12 @@
+from collections.abc import AsyncIterator
+from contextlib import aclosing
+
 from events.base import BaseEventHandler
 from events.types import EventType
+from repositories.memory_state_repository import MemoryStateRepository
+from repositories.state_repository import StateRepository
 from schemas.invoke import InvokeRequest, InvokeResponseData
+from services.session_queue import SessionTurnQueue
 
 
 class EventDispatcher:
@@ -11,15 +17,25 @@ class EventDispatcher:
     - 维护 event_type -> handler 的映射
     - 根据请求中的 event.type 找到对应 handler
     - 调用 handler 并返回统一事件响应结构
+    - 持有唯一的会话仓储，注册时注入给每个 handler
+    - 传入 session_queue 时，异步分发按 session_id 串行排队
+      （同一会话的回合依次执行，不同会话并行）
     """
 
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        state_repo: StateRepository | None = None,
+        session_queue: SessionTurnQueue | None = None,
+    ) -> None:
         self._handlers: dict[EventType, BaseEventHandler] = {}
+        self.state_repo = state_repo or MemoryStateRepository()
+        self.session_queue = session_queue
 
     def register(self, event_type: EventType, handler: BaseEventHandler) -> None:
         """
-        注册事件处理器。
+        注册事件处理器，并注入共享的会话仓储。
         """
+        handler.bind_state_repo(self.state_repo)
         self._handlers[event_type] = handler
 
     def get_handler(self, event_type: EventType) -> BaseEventHandler | None:
@@ -32,8 +48,49 @@ class EventDispatcher:
         """
         分发事件请求到对应 handler。
         """
+        handler = self._require_handler(request)
+        return handler.handle(request)
+
+    async def adispatch(self, request: InvokeRequest) -> InvokeResponseData:
+        """
+        异步分发事件请求到对应 handler。
+
+        只实现了同步 handle 的 handler 会由 BaseEventHandler.ahandle
+        自动回退到线程池执行。
+        """
+        handler = self._require_handler(request)
+        if self.session_queue is None:
+            return await handler.ahandle(request)
+
+        async with self.session_queue.turn(request.session_id):
+            return await handler.ahandle(request)
+
+    def astream(
+        self,
+        request: InvokeRequest,
+    ) -> AsyncIterator[str | InvokeResponseData]:
+        """
+        流式分发：返回 handler 的流式迭代器。
+
+        排队时整个流（直到最终结果产出或客户端断开）都占用该会话。
+        """
+        handler = self._require_handler(request)
+        if self.session_queue is None:
+            return handler.astream(request)
+        return self._serialized_stream(handler, request)
+
+    async def _serialized_stream(
+        self,
+        handler: BaseEventHandler,
+        request: InvokeRequest,
+    ) -> AsyncIterator[str | InvokeResponseData]:
+        async with self.session_queue.turn(request.session_id):
+            async with aclosing(handler.astream(request)) as stream:
+                async for item in stream:
+                    yield item
+
+    def _require_handler(self, request: InvokeRequest) -> BaseEventHandler:
         handler = self.get_handler(request.event_type)
         if handler is None:
             raise ValueError(f"No handler registered for event type: {request.event_type}")
-
-        return handler.handle(request)
\ No newline at end of file
+        return handler
\ No newline at end of file
@@ -3,23 +3,17 @@ import uuid
 from pydantic import ValidationError
 
 from core.config import settings
-from core.llm_exceptions import (
-    LLMEmptyResponseError,
-    LLMInvokeError,
-    LLMJsonParseError,
-    LLMSchemaValidationError,
-)
-from events.base import BaseEventHandler
-from prompts.combat_prompt import render_combat_prompt
-from repositories.memory_state_repository import MemoryStateRepository
+from core.llm_exceptions import LLMSchemaValidationError
+from core.metrics import stage, timed
+from events.llm_handler import EventTurn, LLMEventHandler
+from prompts.combat_prompt import COMBAT_SYSTEM_PROMPT, render_combat_prompt
 from schemas.combat import CombatRequest, CombatResponse
 from schemas.init import InitTime
 from schemas.invoke import InvokeRequest, InvokeResponseData
-from services.ai.deepseek_client import DeepSeekProvider
 from utils.json_parser import parse_json_object
 
 
-class CombatEventHandler(BaseEventHandler):
+class CombatEventHandler(LLMEventHandler):
     """
     COMBAT 事件处理器。
 
@@ -35,74 +29,55 @@ class CombatEventHandler(BaseEventHandler):
     9. 保存最小状态快照
     """
 
-    _state_repo = MemoryStateRepository()
+    event_label = "COMBAT"
+    system_prompt = COMBAT_SYSTEM_PROMPT
+    max_tokens = 1200
 
-    def __init__(self) -> None:
-        self.provider = DeepSeekProvider()
-        self.state_repo = self._state_repo
+    def _prepare(self, request: InvokeRequest) -> EventTurn:
+        combat_request = timed("from_invoke", CombatRequest.from_invoke, request)
+        combat_request = timed("normalize_time", self._normalize_time, combat_request)
+
+        prompt = timed("build_prompt", self._build_prompt, combat_request)
+
+        return EventTurn(request=combat_request, prompt=prompt)
+
+    def _finalize(self, turn: EventTurn, raw_text: str) -> InvokeResponseData:
+        combat_request: CombatRequest = turn.request
+
+        data = timed("parse_json", parse_json_object, raw_text)
+        data = timed("normalize_output", self._normalize_model_output, combat_request, data)
 
-    def handle(self, request: InvokeRequest) -> InvokeResponseData:
         try:
-            combat_request = CombatRequest.from_invoke(request)
-            combat_request = self._normalize_time(combat_request)
-
-            prompt = self._build_prompt(combat_request)
-
-            try:
-                raw_text = self.provider.complete_prompt(
-                    prompt,
-                    temperature=0,
-                    max_tokens=1200,
-                )
-                print("===== COMBAT LLM RAW OUTPUT START =====")
-                print(raw_text)
-                print("===== COMBAT LLM RAW OUTPUT END =====")
-            except Exception as exc:
-                raise LLMInvokeError(f"DeepSeek invoke failed: {exc}") from exc
-
-            if not raw_text or not raw_text.strip():
-                raise LLMEmptyResponseError("DeepSeek returned empty content")
-
-            data = parse_json_object(raw_text)
-            data = self._normalize_model_output(combat_request, data)
-
-            try:
-                combat_response = CombatResponse.model_validate(data)
-            except ValidationError as exc:
-                raise LLMSchemaValidationError(
-                    f"CombatResponse validation failed: {exc}"
-                ) from exc
-
-            response_payload = {
-                "result": combat_response.payload.result.model_dump(),
-                "scene": combat_response.payload.scene.model_dump(),
-                "options": [
-                    item.model_dump() for item in combat_response.payload.options
-                ],
-            }
-
-            self._save_state(combat_request, combat_response, response_payload)
-
-            print(self.state_repo.get_snapshot(combat_request.session.session_id))
-
-            return InvokeResponseData(
-                event=combat_response.event,
-                ai_state=combat_response.ai_state.model_dump(),
-                payload=response_payload,
-                routing=combat_response.routing.model_dump(),
-                context=combat_response.context.model_dump(),
-                meta=combat_response.meta.model_dump(),
+            combat_response = timed("model_validate", CombatResponse.model_validate, data)
+        except ValidationError as exc:
+            raise LLMSchemaValidationError(
+                f"CombatResponse validation failed: {exc}"
+            ) from exc
+
+        response_payload = {
+            "result": combat_response.payload.result.model_dump(),
+            "scene": combat_response.payload.scene.model_dump(),
+            "options": [
+                item.model_dump() for item in combat_response.payload.options
+            ],
+        }
+
+        with stage("save_state"):
+            self._save_state(
+                combat_request,
+                combat_response,
+                response_payload,
+                expected_version=turn.state_version,
             )
 
-        except (
-            LLMEmptyResponseError,
-            LLMJsonParseError,
-            LLMSchemaValidationError,
-            LLMInvokeError,
-        ):
-            raise
-        except Exception as exc:
-            raise RuntimeError(f"COMBAT handler failed: {exc}") from exc
+        return InvokeResponseData(
+            event=combat_response.event,
+            ai_state=combat_response.ai_state.model_dump(),
+            payload=response_payload,
+            routing=combat_response.routing.model_dump(),
+            context=combat_response.context.model_dump(),
+            meta=combat_response.meta.model_dump(),
+        )
 
     def _normalize_time(self, request: CombatRequest) -> CombatRequest:
         hard_limit_seconds = request.time.hard_limit_seconds
@@ -124,39 +99,18 @@ class CombatEventHandler(BaseEventHandler):
         )
 
         augmented_context = self._build_augmented_context(request)
-        if augmented_context:
-            prompt = f"{prompt}\n\n【补充上下文】\n{augmented_context}"
-
-        return prompt
+        return self._append_augmented_context(prompt, augmented_context)
 
     def _build_augmented_context(self, request: CombatRequest) -> str:
         """
         增强上下文预留入口。
 
         当前策略：
-        - 优先读取状态仓储中的上一次快照
-        - 拼接最小必要历史信息，帮助模型保持连续性
+        - 注入固定大小的会话记忆块（剧情梗概 + 分层历史），帮助模型保持连续性，
+          长度不随回合数增长
         - 不改动主协议，只作为 prompt 补充文本
         """
-        parts: list[str] = []
-
-        snapshot = self.state_repo.get_snapshot(request.session.session_id)
-        if snapshot:
-            prev_event_type = snapshot.get("event_type")
-            ai_state = snapshot.get("ai_state") or {}
-            last_output = snapshot.get("last_output") or {}
-            prev_context = last_output.get("context") or {}
-
-            if prev_event_type:
-                parts.append(f"上一事件类型：{prev_event_type}")
-            if ai_state.get("memory_summary"):
-                parts.append(f"上一阶段剧情摘要：{ai_state['memory_summary']}")
-            if prev_context.get("current_scene_summary"):
-                parts.append(
-                    f"上一阶段场景摘要：{prev_context['current_scene_summary']}"
-                )
-
-        return "\n".join(parts).strip()
+        return self._build_session_memory(request.session.session_id)
 
     def _normalize_model_output(
         self,
@@ -290,6 +244,7 @@ class CombatEventHandler(BaseEventHandler):
         request: CombatRequest,
         response: CombatResponse,
         response_payload: dict,
+        expected_version: int | None = None,
     ) -> None:
         """
         保存最小会话快照，供后续 LOOP 阶段继续使用。
@@ -311,4 +266,13 @@ class CombatEventHandler(BaseEventHandler):
             event_type=event_type,
             ai_state=ai_state,
             last_output=last_output,
+            ttl_seconds=self._session_ttl(request),
+            expected_version=expected_version,
+        )
+
+        self._record_event(
+            session_id,
+            event_type,
+            request.context.current_scene_summary,
+            response_payload,
         )
\ No newline at end of file
@@ -3,23 +3,18 @@ from typing import Any
 
 from pydantic import ValidationError
 
-from core.llm_exceptions import (
-    LLMEmptyResponseError,
-    LLMInvokeError,
-    LLMJsonParseError,
-    LLMSchemaValidationError,
-)
-from events.base import BaseEventHandler
-from prompts.end_prompt import render_end_prompt
-from repositories.memory_state_repository import MemoryStateRepository
+from core.llm_exceptions import LLMSchemaValidationError
+from core.metrics import stage, timed
+from events.llm_handler import EventTurn, LLMEventHandler
+from prompts.end_prompt import END_SYSTEM_PROMPT, render_end_prompt
+from repositories.state_repository import EventRecord
 from schemas.end import EndRequest, EndResponse
 from schemas.init import InitTime
 from schemas.invoke import InvokeRequest, InvokeResponseData
-from services.ai.deepseek_client import DeepSeekProvider
 from utils.json_parser import parse_json_object
 
 
-class EndEventHandler(BaseEventHandler):
+class EndEventHandler(LLMEventHandler):
     """
     END 事件处理器。
 
@@ -35,76 +30,77 @@ class EndEventHandler(BaseEventHandler):
     9. 保存最终状态快照
     """
 
-    _state_repo = MemoryStateRepository()
+    event_label = "END"
+    system_prompt = END_SYSTEM_PROMPT
+    max_tokens = 1400
+    stream_text_path = ("payload", "epilogue", "scene")
 
-    def __init__(self) -> None:
-        self.provider = DeepSeekProvider()
-        self.state_repo = self._state_repo
+    def _prepare(self, request: InvokeRequest) -> EventTurn:
+        end_request = timed("from_invoke", EndRequest.from_invoke, request)
+        end_request = timed("normalize_time", self._normalize_time, end_request)
 
-    def handle(self, request: InvokeRequest) -> InvokeResponseData:
-        try:
-            end_request = EndRequest.from_invoke(request)
-            end_request = self._normalize_time(end_request)
-
-            history_events = self._collect_history_events(end_request)
-            prompt = self._build_prompt(end_request, history_events)
+        history_events, journey = timed(
+            "collect_history", self._collect_history_events, end_request
+        )
+        prompt = timed(
+            "build_prompt",
+            self._build_prompt,
+            end_request,
+            history_events,
+            history_from_log=journey is not None,
+        )
 
-            try:
-                raw_text = self.provider.complete_prompt(
-                    prompt,
-                    temperature=0,
-                    max_tokens=1400,
-                )
-                print("===== END LLM RAW OUTPUT START =====")
-                print(raw_text)
-                print("===== END LLM RAW OUTPUT END =====")
-            except Exception as exc:
-                raise LLMInvokeError(f"DeepSeek invoke failed: {exc}") from exc
-
-            if not raw_text or not raw_text.strip():
-                raise LLMEmptyResponseError("DeepSeek returned empty content")
-
-            data = parse_json_object(raw_text)
-            data = self._normalize_model_output(end_request, data, history_events)
-
-            try:
-                end_response = EndResponse.model_validate(data)
-            except ValidationError as exc:
-                raise LLMSchemaValidationError(
-                    f"EndResponse validation failed: {exc}"
-                ) from exc
-
-            response_payload = {
-                "ending": end_response.payload.ending.model_dump(),
-                "epilogue": end_response.payload.epilogue.model_dump(),
-                "key_choices": [
-                    item.model_dump() for item in end_response.payload.key_choices
-                ],
-                "novel_summary": end_response.payload.novel_summary.model_dump(),
-            }
+        return EventTurn(
+            request=end_request,
+            prompt=prompt,
+            extras={"history_events": history_events, "journey": journey},
+        )
 
-            self._save_state(end_request, end_response, response_payload)
+    def _finalize(self, turn: EventTurn, raw_text: str) -> InvokeResponseData:
+        end_request: EndRequest = turn.request
+        history_events = turn.extras["history_events"]
+
+        data = timed("parse_json", parse_json_object, raw_text)
+        with stage("normalize_output"):
+            data = self._normalize_model_output(
+                end_request,
+                data,
+                history_events,
+                journey=turn.extras.get("journey"),
+            )
 
-            print(self.state_repo.get_snapshot(end_request.session.session_id))
+        try:
+            end_response = timed("model_validate", EndResponse.model_validate, data)
+        except ValidationError as exc:
+            raise LLMSchemaValidationError(
+                f"EndResponse validation failed: {exc}"
+            ) from exc
+
+        response_payload = {
+            "ending": end_response.payload.ending.model_dump(),
+            "epilogue": end_response.payload.epilogue.model_dump(),
+            "key_choices": [
+                item.model_dump() for item in end_response.payload.key_choices
+            ],
+            "novel_summary": end_response.payload.novel_summary.model_dump(),
+        }
 
-            return InvokeResponseData(
-                event=end_response.event,
-                ai_state=end_response.ai_state.model_dump(),
-                payload=response_payload,
-                routing=end_response.routing.model_dump(),
-                context=end_response.context.model_dump(),
-                meta=end_response.meta.model_dump(),
+        with stage("save_state"):
+            self._save_state(
+                end_request,
+                end_response,
+                response_payload,
+                expected_version=turn.state_version,
             )
 
-        except (
-            LLMEmptyResponseError,
-            LLMJsonParseError,
-            LLMSchemaValidationError,
-            LLMInvokeError,
-        ):
-            raise
-        except Exception as exc:
-            raise RuntimeError(f"END handler failed: {exc}") from exc
+        return InvokeResponseData(
+            event=end_response.event,
+            ai_state=end_response.ai_state.model_dump(),
+            payload=response_payload,
+            routing=end_response.routing.model_dump(),
+            context=end_response.context.model_dump(),
+            meta=end_response.meta.model_dump(),
+        )
 
     def _normalize_time(self, request: EndRequest) -> EndRequest:
         hard_limit_seconds = request.time.hard_limit_seconds
@@ -123,56 +119,51 @@ class EndEventHandler(BaseEventHandler):
         self,
         request: EndRequest,
         history_events: list[dict[str, Any]],
+        history_from_log: bool = False,
     ) -> str:
+        """
+        历史来自会话事件日志时，用固定大小的会话记忆代替逐条历史；
+        客户端显式传入的 history_events 仍逐条渲染（受 token 预算约束）。
+        """
+        augmented_context = self._build_augmented_context(request)
+        if history_from_log and augmented_context:
+            return render_end_prompt(
+                request,
+                history_events=history_events,
+                history_text=augmented_context,
+            )
+
         prompt = render_end_prompt(
             request,
             history_events=history_events,
         )
-
-        augmented_context = self._build_augmented_context(request)
-        if augmented_context:
-            prompt = f"{prompt}\n\n【补充上下文】\n{augmented_context}"
-
-        return prompt
+        return self._append_augmented_context(prompt, augmented_context)
 
     def _build_augmented_context(self, request: EndRequest) -> str:
         """
         END 的补充上下文入口。
 
         当前策略：
-        - 读取最近一次快照，补充上一阶段摘要
+        - 注入固定大小的会话记忆块（剧情梗概 + 分层历史）
         - 不改主协议，只作为 prompt 补充文本
         """
-        parts: list[str] = []
-
-        snapshot = self.state_repo.get_snapshot(request.session.session_id)
-        if snapshot:
-            prev_event_type = snapshot.get("event_type")
-            ai_state = snapshot.get("ai_state") or {}
-            last_output = snapshot.get("last_output") or {}
-            prev_context = last_output.get("context") or {}
-
-            if prev_event_type:
-                parts.append(f"上一事件类型：{prev_event_type}")
-            if ai_state.get("memory_summary"):
-                parts.append(f"上一阶段剧情摘要：{ai_state['memory_summary']}")
-            if prev_context.get("current_scene_summary"):
-                parts.append(
-                    f"上一阶段场景摘要：{prev_context['current_scene_summary']}"
-                )
-
-        return "\n".join(parts).strip()
+        return self._build_session_memory(request.session.session_id)
 
-    def _collect_history_events(self, request: EndRequest) -> list[dict[str, Any]]:
+    def _collect_history_events(
+        self,
+        request: EndRequest,
+    ) -> tuple[list[dict[str, Any]], str | None]:
         """
         收集 END 用于总结整局的最小历史链。
 
-        当前仓储只有“最近一次快照”，所以这里采用保底策略：
-        1. 优先从 request.context.history_events 读取（如果你在 end schema 里预留了该字段）
-        2. 否则回退到 state_repo 中最后一次快照
-        3. 再不行就只用当前 context 生成最小历史
+        返回 (history_events, journey)，journey 为事件日志预先拼好的
+        玩家旅程文本，仅当历史来自事件日志时返回。
 
-        这样可以先让 END 跑通，后续你若把完整事件链写入仓储，这里再升级即可。
+        读取顺序：
+        1. 优先从 request.context.history_events 读取（客户端显式传入）
+        2. 否则读取 state_repo 的会话事件日志（所有 handler 每回合追加）
+        3. 再回退到 state_repo 中最后一次快照
+        4. 再不行就只用当前 context 生成最小历史
         """
         history_events = getattr(request.context, "history_events", None)
         if isinstance(history_events, list) and history_events:
@@ -183,9 +174,17 @@ class EndEventHandler(BaseEventHandler):
                 elif isinstance(item, dict):
                     normalized.append(item)
             if normalized:
-                return normalized
+                return normalized, None
 
-        snapshot = self.state_repo.get_snapshot(request.session.session_id)
+        session_id = request.session.session_id
+        logged_events = [
+            record.to_dict() for record in self.state_repo.iter_events(session_id)
+        ]
+        if logged_events:
+            summary = self.state_repo.get_event_summary(session_id)
+            return logged_events, (summary.journey if summary else None)
+
+        snapshot = self.state_repo.get_snapshot(session_id)
         if snapshot:
             last_output = snapshot.get("last_output") or {}
             payload = last_output.get("payload") or {}
@@ -204,7 +203,7 @@ class EndEventHandler(BaseEventHandler):
                     "selected_option_text": selected_option_text,
                     "result_summary": self._extract_result_summary(payload),
                 }
-            ]
+            ], None
 
         return [
             {
@@ -213,54 +212,7 @@ class EndEventHandler(BaseEventHandler):
                 "selected_option_text": "",
                 "result_summary": "",
             }
-        ]
-
-    def _extract_selected_option_text(self, payload: dict[str, Any]) -> str:
-        if not isinstance(payload, dict):
-            return ""
-
-        decision = payload.get("decision")
-        if isinstance(decision, dict) and decision.get("selected_option_text"):
-            return str(decision["selected_option_text"]).strip()
-
-        attempt = payload.get("attempt")
-        if isinstance(attempt, dict) and attempt.get("selected_option_text"):
-            return str(attempt["selected_option_text"]).strip()
-
-        combat = payload.get("combat")
-        if isinstance(combat, dict) and combat.get("selected_option_text"):
-            return str(combat["selected_option_text"]).strip()
-
-        result = payload.get("result")
-        if isinstance(result, dict) and result.get("player_action"):
-            return str(result["player_action"]).strip()
-
-        return ""
-
-    def _extract_result_summary(self, payload: dict[str, Any]) -> str:
-        if not isinstance(payload, dict):
-            return ""
-
-        result = payload.get("result")
-        if isinstance(result, dict):
-            for key in ("summary", "outcome", "resolution"):
-                value = result.get(key)
-                if isinstance(value, str) and value.strip():
-                    return value.strip()
-
-        scene = payload.get("scene")
-        if isinstance(scene, dict):
-            summary = scene.get("summary")
-            if isinstance(summary, str) and summary.strip():
-                return summary.strip()
-
-        epilogue = payload.get("epilogue")
-        if isinstance(epilogue, dict):
-            scene_text = epilogue.get("scene")
-            if isinstance(scene_text, str) and scene_text.strip():
-                return scene_text.strip()
-
-        return ""
+        ], None
 
     def _has_real_history_choice(self, history_events: list[dict[str, Any]]) -> bool:
             for item in history_events:
@@ -320,6 +272,7 @@ class EndEventHandler(BaseEventHandler):
         request: EndRequest,
         data: dict,
         history_events: list[dict[str, Any]],
+        journey: str | None = None,
     ) -> dict:
         """
         END 专用轻量归一化策略：
@@ -421,7 +374,7 @@ class EndEventHandler(BaseEventHandler):
         has_real_choice = self._has_real_history_choice(history_events)
         if has_real_choice:
             if not novel_summary.get("player_journey"):
-                novel_summary["player_journey"] = self._build_player_journey_text(
+                novel_summary["player_journey"] = journey or self._build_player_journey_text(
                     history_events=history_events,
                     fallback_scene=request.context.current_scene_summary,
                 )
@@ -482,20 +435,9 @@ class EndEventHandler(BaseEventHandler):
         parts: list[str] = []
 
         for item in history_events:
-            scene = str(item.get("scene_summary", "")).strip()
-            choice = str(item.get("selected_option_text", "")).strip()
-            result = str(item.get("result_summary", "")).strip()
-
-            seg = []
-            if scene:
-                seg.append(scene)
-            if choice:
-                seg.append(f"你做出了“{choice}”这一选择")
-            if result:
-                seg.append(result)
-
-            if seg:
-                parts.append("，".join(seg))
+            segment = EventRecord.from_dict(item).journey_segment()
+            if segment:
+                parts.append(segment)
 
         if not parts:
             return f"玩家在旅程末段持续推动局势前进，并最终抵达“{fallback_scene}”所指向的终局场景。"
@@ -507,6 +449,7 @@ class EndEventHandler(BaseEventHandler):
         request: EndRequest,
         response: EndResponse,
         response_payload: dict,
+        expected_version: int | None = None,
     ) -> None:
         """
         保存最终会话快照，供后续 NOVEL 接口复用。
@@ -528,4 +471,13 @@ class EndEventHandler(BaseEventHandler):
             event_type=event_type,
             ai_state=ai_state,
             last_output=last_output,
+            ttl_seconds=self._session_ttl(request),
+            expected_version=expected_version,
+        )
+
+        self._record_event(
+            session_id,
+            event_type,
+            request.context.current_scene_summary,
+            response_payload,
         )
\ No newline at end of file
@@ -1,23 +1,17 @@
 from pydantic import ValidationError
 
-from core.llm_exceptions import (
-    LLMEmptyResponseError,
-    LLMInvokeError,
-    LLMJsonParseError,
-    LLMSchemaValidationError,
-)
-from events.base import BaseEventHandler
-from prompts.init_prompt import render_init_prompt
-from repositories.memory_state_repository import MemoryStateRepository
+from core.llm_exceptions import LLMSchemaValidationError
+from core.metrics import stage, timed
+from events.llm_handler import EventTurn, LLMEventHandler
+from prompts.init_prompt import INIT_SYSTEM_PROMPT, render_init_prompt
 from schemas.init import InitRequest, InitResponse, InitTime
 from schemas.invoke import InvokeRequest, InvokeResponseData
-from services.ai.deepseek_client import DeepSeekProvider
 from utils.json_parser import parse_json_object
 
 from core.config import settings
 
 
-class InitEventHandler(BaseEventHandler):
+class InitEventHandler(LLMEventHandler):
     """
     INIT 事件处理器。
 
@@ -38,71 +32,55 @@ class InitEventHandler(BaseEventHandler):
     - 未来也可在成功后把关键摘要写入 db9.ai
     """
 
-    _state_repo = MemoryStateRepository()
+    event_label = "INIT"
+    system_prompt = INIT_SYSTEM_PROMPT
+    max_tokens = 1200
+    stream_text_path = ("payload", "opening", "scene")
 
-    def __init__(self) -> None:
-        self.provider = DeepSeekProvider()
-        self.state_repo = self._state_repo
+    def _prepare(self, request: InvokeRequest) -> EventTurn:
+        init_request = timed("from_invoke", InitRequest.from_invoke, request)
+        init_request = timed("normalize_time", self._normalize_time, init_request)
+
+        prompt = timed("build_prompt", self._build_prompt, init_request)
+
+        return EventTurn(request=init_request, prompt=prompt)
+
+    def _finalize(self, turn: EventTurn, raw_text: str) -> InvokeResponseData:
+        init_request: InitRequest = turn.request
+
+        data = timed("parse_json", parse_json_object, raw_text)
+        data = timed("normalize_output", self._normalize_model_output, data)
 
-    def handle(self, request: InvokeRequest) -> InvokeResponseData:
         try:
-            init_request = InitRequest.from_invoke(request)
-            init_request = self._normalize_time(init_request)
-
-            prompt = self._build_prompt(init_request)
-
-            try:
-                # raw_text = self.provider.complete_prompt(
-                #     prompt,
-                #     temperature=0,
-                #     max_tokens=600,
-                # )
-                raw_text = self.provider.complete_prompt(
-                    prompt,
-                    temperature=0,
-                    max_tokens=1200,
-                )
-                print("===== LLM RAW OUTPUT START =====")
-                print(raw_text)
-                print("===== LLM RAW OUTPUT END =====")
-            except Exception as exc:
-                raise LLMInvokeError(f"DeepSeek invoke failed: {exc}") from exc
-
-            if not raw_text or not raw_text.strip():
-                raise LLMEmptyResponseError("DeepSeek returned empty content")
-
-            data = parse_json_object(raw_text)
-            data = self._normalize_model_output(data)
-
-            try:
-                init_response = InitResponse.model_validate(data)
-            except ValidationError as exc:
-                raise LLMSchemaValidationError(f"InitResponse validation failed: {exc}") from exc
-
-            response_payload = {
-                "mainline": init_response.payload.mainline.model_dump(),
-                "opening": init_response.payload.opening.model_dump(),
-                "start_hint": init_response.payload.start_hint.model_dump(),
-                "options": [item.model_dump() for item in init_response.payload.options],
-            }
-
-            self._save_state(init_request, init_response, response_payload)
-
-            print(self.state_repo.get_snapshot(init_request.session.session_id)) # wait
-
-            return InvokeResponseData(
-                event=init_response.event,
-                ai_state=init_response.ai_state.model_dump(),
-                payload=response_payload,
-                routing=init_response.routing.model_dump(),
-                context=init_response.context.model_dump(),
-                meta=init_response.meta.model_dump(),
-            )   
-
-        except (LLMEmptyResponseError, LLMJsonParseError, LLMSchemaValidationError, LLMInvokeError):
-            raise
-        except Exception as exc:
-            raise RuntimeError(f"INIT handler failed: {exc}") from exc
+            init_response = timed("model_validate", InitResponse.model_validate, data)
+        except ValidationError as exc:
+            raise LLMSchemaValidationError(
+                f"InitResponse validation failed: {exc}"
+            ) from exc
+
+        response_payload = {
+            "mainline": init_response.payload.mainline.model_dump(),
+            "opening": init_response.payload.opening.model_dump(),
+            "start_hint": init_response.payload.start_hint.model_dump(),
+            "options": [item.model_dump() for item in init_response.payload.options],
+        }
+
+        with stage("save_state"):
+            self._save_state(
+                init_request,
+                init_response,
+                response_payload,
+                expected_version=turn.state_version,
+            )
+
+        return InvokeResponseData(
+            event=init_response.event,
+            ai_state=init_response.ai_state.model_dump(),
+            payload=response_payload,
+            routing=init_response.routing.model_dump(),
+            context=init_response.context.model_dump(),
+            meta=init_response.meta.model_dump(),
+        )
 
     def _normalize_time(self, request: InitRequest) -> InitRequest:
         hard_limit_seconds = request.time.hard_limit_seconds
@@ -124,10 +102,7 @@ class InitEventHandler(BaseEventHandler):
         )
 
         augmented_context = self._build_augmented_context(request)
-        if augmented_context:
-            prompt = f"{prompt}\n\n【补充上下文】\n{augmented_context}"
-
-        return prompt
+        return self._append_augmented_context(prompt, augmented_context)
 
     def _build_augmented_context(self, request: InitRequest) -> str:
         """
@@ -185,6 +160,7 @@ class InitEventHandler(BaseEventHandler):
         request: InitRequest,
         response: InitResponse,
         response_payload: dict,
+        expected_version: int | None = None,
     ) -> None:
         """
         保存最小会话快照，供后续 LOOP 阶段使用。
@@ -204,4 +180,13 @@ class InitEventHandler(BaseEventHandler):
             event_type=event_type,
             ai_state=ai_state,
             last_output=last_output,
+            ttl_seconds=self._session_ttl(request),
+            expected_version=expected_version,
+        )
+
+        self._record_event(
+            session_id,
+            event_type,
+            response.context.current_scene_summary,
+            response_payload,
         )
\ No newline at end of file
@@ -3,23 +3,17 @@ import uuid
 from pydantic import ValidationError
 
 from core.config import settings
-from core.llm_exceptions import (
-    LLMEmptyResponseError,
-    LLMInvokeError,
-    LLMJsonParseError,
-    LLMSchemaValidationError,
-)
-from events.base import BaseEventHandler
-from prompts.puzzle_prompt import render_puzzle_prompt
-from repositories.memory_state_repository import MemoryStateRepository
+from core.llm_exceptions import LLMSchemaValidationError
+from core.metrics import stage, timed
+from events.llm_handler import EventTurn, LLMEventHandler
+from prompts.puzzle_prompt import PUZZLE_SYSTEM_PROMPT, render_puzzle_prompt
 from schemas.init import InitTime
 from schemas.invoke import InvokeRequest, InvokeResponseData
 from schemas.puzzle import PuzzleRequest, PuzzleResponse
-from services.ai.deepseek_client import DeepSeekProvider
 from utils.json_parser import parse_json_object
 
 
-class PuzzleEventHandler(BaseEventHandler):
+class PuzzleEventHandler(LLMEventHandler):
     """
     PUZZLE 事件处理器。
 
@@ -36,80 +30,61 @@ class PuzzleEventHandler(BaseEventHandler):
     10. 保存最小状态快照
     """
 
-    _state_repo = MemoryStateRepository()
+    event_label = "PUZZLE"
+    system_prompt = PUZZLE_SYSTEM_PROMPT
+    max_tokens = 1200
 
-    def __init__(self) -> None:
-        self.provider = DeepSeekProvider()
-        self.state_repo = self._state_repo
+    def _prepare(self, request: InvokeRequest) -> EventTurn:
+        puzzle_request = timed("from_invoke", PuzzleRequest.from_invoke, request)
+        puzzle_request = timed("normalize_time", self._normalize_time, puzzle_request)
 
-    def handle(self, request: InvokeRequest) -> InvokeResponseData:
-        try:
-            puzzle_request = PuzzleRequest.from_invoke(request)
-            puzzle_request = self._normalize_time(puzzle_request)
+        prompt = timed("build_prompt", self._build_prompt, puzzle_request)
 
-            prompt = self._build_prompt(puzzle_request)
+        return EventTurn(request=puzzle_request, prompt=prompt)
 
-            try:
-                raw_text = self.provider.complete_prompt(
-                    prompt,
-                    temperature=0,
-                    max_tokens=1200,
-                )
-                print("===== PUZZLE LLM RAW OUTPUT START =====")
-                print(raw_text)
-                print("===== PUZZLE LLM RAW OUTPUT END =====")
-            except Exception as exc:
-                raise LLMInvokeError(f"DeepSeek invoke failed: {exc}") from exc
-
-            if not raw_text or not raw_text.strip():
-                raise LLMEmptyResponseError("DeepSeek returned empty content")
-
-            data = parse_json_object(raw_text)
-            data = self._normalize_model_output(puzzle_request, data)
-
-            try:
-                puzzle_response = PuzzleResponse.model_validate(data)
-            except ValidationError as exc:
-                raise LLMSchemaValidationError(
-                    f"PuzzleResponse validation failed: {exc}"
-                ) from exc
-
-            response_payload = {
-                "puzzle": (
-                    puzzle_response.payload.puzzle.model_dump()
-                    if puzzle_response.payload.puzzle is not None
-                    else None
-                ),
-                "attempt": puzzle_response.payload.attempt.model_dump(),
-                "result": puzzle_response.payload.result.model_dump(),
-                "scene": puzzle_response.payload.scene.model_dump(),
-                "options": [
-                    item.model_dump() for item in puzzle_response.payload.options
-                ],
-            }
-
-            self._save_state(puzzle_request, puzzle_response, response_payload)
-
-            print(self.state_repo.get_snapshot(puzzle_request.session.session_id))
-
-            return InvokeResponseData(
-                event=puzzle_response.event,
-                ai_state=puzzle_response.ai_state.model_dump(),
-                payload=response_payload,
-                routing=puzzle_response.routing.model_dump(),
-                context=puzzle_response.context.model_dump(),
-                meta=puzzle_response.meta.model_dump(),
+    def _finalize(self, turn: EventTurn, raw_text: str) -> InvokeResponseData:
+        puzzle_request: PuzzleRequest = turn.request
+
+        data = timed("parse_json", parse_json_object, raw_text)
+        data = timed("normalize_output", self._normalize_model_output, puzzle_request, data)
+
+        try:
+            puzzle_response = timed("model_validate", PuzzleResponse.model_validate, data)
+        except ValidationError as exc:
+            raise LLMSchemaValidationError(
+                f"PuzzleResponse validation failed: {exc}"
+            ) from exc
+
+        response_payload = {
+            "puzzle": (
+                puzzle_response.payload.puzzle.model_dump()
+                if puzzle_response.payload.puzzle is not None
+                else None
+            ),
+            "attempt": puzzle_response.payload.attempt.model_dump(),
+            "result": puzzle_response.payload.result.model_dump(),
+            "scene": puzzle_response.payload.scene.model_dump(),
+            "options": [
+                item.model_dump() for item in puzzle_response.payload.options
+            ],
+        }
+
+        with stage("save_state"):
+            self._save_state(
+                puzzle_request,
+                puzzle_response,
+                response_payload,
+                expected_version=turn.state_version,
             )
 
-        except (
-            LLMEmptyResponseError,
-            LLMJsonParseError,
-            LLMSchemaValidationError,
-            LLMInvokeError,
-        ):
-            raise
-        except Exception as exc:
-            raise RuntimeError(f"PUZZLE handler failed: {exc}") from exc
+        return InvokeResponseData(
+            event=puzzle_response.event,
+            ai_state=puzzle_response.ai_state.model_dump(),
+            payload=response_payload,
+            routing=puzzle_response.routing.model_dump(),
+            context=puzzle_response.context.model_dump(),
+            meta=puzzle_response.meta.model_dump(),
+        )
 
     def _normalize_time(self, request: PuzzleRequest) -> PuzzleRequest:
         hard_limit_seconds = request.time.hard_limit_seconds
@@ -131,39 +106,18 @@ class PuzzleEventHandler(BaseEventHandler):
         )
 
         augmented_context = self._build_augmented_context(request)
-        if augmented_context:
-            prompt = f"{prompt}\n\n【补充上下文】\n{augmented_context}"
-
-        return prompt
+        return self._append_augmented_context(prompt, augmented_context)
 
     def _build_augmented_context(self, request: PuzzleRequest) -> str:
         """
         增强上下文预留入口。
 
         当前策略：
-        - 优先读取状态仓储中的上一次快照
-        - 拼接最小必要历史信息，帮助模型保持连续性
+        - 注入固定大小的会话记忆块（剧情梗概 + 分层历史），帮助模型保持连续性，
+          长度不随回合数增长
         - 不改动主协议，只作为 prompt 补充文本
         """
-        parts: list[str] = []
-
-        snapshot = self.state_repo.get_snapshot(request.session.session_id)
-        if snapshot:
-            prev_event_type = snapshot.get("event_type")
-            ai_state = snapshot.get("ai_state") or {}
-            last_output = snapshot.get("last_output") or {}
-            prev_context = last_output.get("context") or {}
-
-            if prev_event_type:
-                parts.append(f"上一事件类型：{prev_event_type}")
-            if ai_state.get("memory_summary"):
-                parts.append(f"上一阶段剧情摘要：{ai_state['memory_summary']}")
-            if prev_context.get("current_scene_summary"):
-                parts.append(
-                    f"上一阶段场景摘要：{prev_context['current_scene_summary']}"
-                )
-
-        return "\n".join(parts).strip()
+        return self._build_session_memory(request.session.session_id)
 
     def _normalize_model_output(
         self,
@@ -369,6 +323,7 @@ class PuzzleEventHandler(BaseEventHandler):
         request: PuzzleRequest,
         response: PuzzleResponse,
         response_payload: dict,
+        expected_version: int | None = None,
     ) -> None:
         """
         保存最小会话快照，供后续 LOOP 阶段继续使用。
@@ -390,4 +345,13 @@ class PuzzleEventHandler(BaseEventHandler):
             event_type=event_type,
             ai_state=ai_state,
             last_output=last_output,
+            ttl_seconds=self._session_ttl(request),
+            expected_version=expected_version,
+        )
+
+        self._record_event(
+            session_id,
+            event_type,
+            request.context.current_scene_summary,
+            response_payload,
         )
\ No newline at end of file
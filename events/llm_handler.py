@@ -0,0 +1,561 @@
+import asyncio
+from collections.abc import AsyncIterator
+from contextlib import aclosing
+from dataclasses import dataclass, field
+from functools import lru_cache
+from threading import Lock
+from typing import Any
+
+from core.config import settings
+from core.exceptions import StateBackpressureError, StateConflictError
+from core.logging import get_logger, log_sampled_debug
+from core.metrics import registry as metrics
+from core.metrics import stage, track_turn
+from core.llm_exceptions import (
+    LLMEmptyResponseError,
+    LLMInvokeError,
+    LLMJsonParseError,
+    LLMSchemaValidationError,
+    LLMTruncatedOutputError,
+)
+from events.base import BaseEventHandler
+from prompts.budget import estimate_tokens, fit_text
+from repositories.memory_state_repository import MemoryStateRepository
+from repositories.session_memory import SessionMemory
+from repositories.state_repository import EventRecord, StateRepository
+from schemas.invoke import InvokeRequest, InvokeResponseData
+from services.ai.completion_budget import get_completion_budget, template_version
+from services.ai.deepseek_client import (
+    get_async_deepseek_provider,
+    get_deepseek_provider,
+)
+from services.ai.token_usage import TokenUsage, collect_usage, get_usage_ledger
+from utils.json_stream import IncrementalJsonParser
+
+
+logger = get_logger(__name__)
+
+
+@dataclass
+class EventTurn:
+    """
+    一次事件处理在 LLM 调用前准备好的中间结果。
+
+    - request：事件专用请求（InitRequest / DecisionRequest ...）
+    - prompt：最终发送给模型的 prompt
+    - extras：事件私有的附加数据（如 END 的 history_events）
+    - state_version：回合开始时读到的快照版本，保存时用于 compare-and-swap
+    - max_tokens：本回合的输出预算（自适应），None 时用 handler 的 max_tokens
+    - call_usage：最后一次模型调用的用量，用于统计输出长度分布
+    """
+
+    request: Any
+    prompt: str
+    extras: dict[str, Any] = field(default_factory=dict)
+    state_version: int | None = None
+    max_tokens: int | None = None
+    call_usage: TokenUsage | None = None
+
+
+class TurnClaims:
+    """
+    进程内的“回合进行中”登记表。
+
+    同一会话同一时间只允许一个回合进入 LLM 调用；后到的回合
+    在 prompt 构建和模型调用之前就被拒绝，不会白白生成一次。
+    """
+
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self._active: set[str] = set()
+
+    def claim(self, session_id: str) -> bool:
+        with self._lock:
+            if session_id in self._active:
+                return False
+            self._active.add(session_id)
+            return True
+
+    def release(self, session_id: str) -> None:
+        with self._lock:
+            self._active.discard(session_id)
+
+    def __len__(self) -> int:
+        return len(self._active)
+
+
+@lru_cache(maxsize=16)
+def _system_prompt_tokens(system_prompt: str | None) -> int:
+    # system prompt 是静态的，每个事件类型只估算一次
+    return estimate_tokens(system_prompt)
+
+
+class LLMEventHandler(BaseEventHandler):
+    """
+    基于 LLM 的事件处理器公共流程。
+
+    handle / ahandle 共用同一套阶段：
+    1. _prepare：InvokeRequest -> 事件请求 -> prompt
+    2. _complete / _acomplete：调用 DeepSeek（同步 / 异步）
+    3. _finalize：JSON parse -> 归一化 -> schema 校验 -> 保存状态 -> 返回
+       （在 state_repo.batch() 内执行，快照与事件日志一次提交）
+
+    整个回合包在 track_turn() 里，各阶段通过 core.metrics 的
+    stage() / timed() 记录耗时（METRICS_ENABLED=false 时不记录）。
+
+    模型输出只有在 _finalize 成功后才写入响应缓存（_remember_response）。
+
+    astream 在第 2 步改为流式调用，并把 stream_text_path 指向的
+    场景文本边生成边产出；顶层 JSON 闭合后立即停止读取，
+    最终结果仍走同一个 _finalize。
+
+    回合内所有模型调用的 token 用量写入 result.meta["usage"]，
+    并按会话 / 事件类型 / prompt_template 汇总到 UsageLedger。
+
+    子类只需实现 _prepare / _finalize，并声明 event_label / system_prompt /
+    max_tokens / stream_text_path。
+
+    prompt 布局按 DeepSeek 前缀缓存设计：system_prompt 是逐字节稳定的
+    规则 + 输出结构（所有请求共用，命中缓存），turn.prompt 只放本次请求的
+    动态输入。命中的 token 数见 meta.usage.cached_tokens。
+
+    动态输入里会随对局增长的部分（END 的历史事件、state_flags、补充上下文）
+    各有 PROMPT_*_BUDGET_TOKENS 预算，超出时截断或丢弃低优先级内容；
+    本地估算的输入 token 数见 meta.prompt_tokens_estimate。
+
+    输出预算：handler 的 max_tokens 是上限，非流式调用实际使用按本事件
+    （及 system_prompt 版本）历史输出长度算出的自适应预算（见 CompletionBudget）。
+    输出因预算不足被截断（JSON 不完整）时，放大到上限重试一次。
+    流式调用已经把文本推给了客户端，无法重试，始终使用上限。
+
+    state_repo 由 dispatcher 注册时统一注入；单独实例化时
+    使用一个私有的内存仓储。
+
+    并发控制（乐观并发）：
+    - 回合开始先登记会话（turn_claims），同一会话已有回合在进行时
+      直接抛 StateConflictError，不构建 prompt、不调用 LLM
+    - 登记成功后读取快照版本，_finalize 保存快照时作为 expected_version，
+      版本已被本进程内其他写入方更新时同样以冲突失败
+    - 校验范围取决于仓储：内存仓储与 write-behind（校验内存前端，落盘时
+      原样覆盖后端版本）只覆盖本进程；直接使用 DuckDB 仓储时在提交事务内
+      校验，其他进程的写入也会被发现
+    """
+
+    event_label: str = "LLM"
+    system_prompt: str | None = None
+    temperature: float = 0
+    max_tokens: int = 1200
+    stream_text_path: tuple[str, ...] = ("payload", "scene", "summary")
+
+    # 所有 LLM handler 共享，会话级互斥与事件类型无关
+    turn_claims = TurnClaims()
+
+    _passthrough_errors = (
+        StateConflictError,
+        StateBackpressureError,
+        LLMEmptyResponseError,
+        LLMJsonParseError,
+        LLMSchemaValidationError,
+        LLMInvokeError,
+    )
+
+    def __init__(self, state_repo: StateRepository | None = None) -> None:
+        self.provider = get_deepseek_provider()
+        self.async_provider = get_async_deepseek_provider()
+        self.state_repo = state_repo or MemoryStateRepository()
+
+    def handle(self, request: InvokeRequest) -> InvokeResponseData:
+        session_id, state_version = self._begin_turn(request)
+        try:
+            with track_turn(self.event_label.lower()) as timings, collect_usage() as usage:
+                turn = self._prepare(request)
+                turn.state_version = state_version
+                turn.max_tokens = self._resolve_max_tokens()
+                raw_text = self._complete(turn)
+                try:
+                    with self.state_repo.batch():
+                        result = self._finalize(turn, raw_text)
+                except LLMTruncatedOutputError:
+                    if not self._widen_max_tokens(turn):
+                        raise
+                    raw_text = self._complete(turn)
+                    with self.state_repo.batch():
+                        result = self._finalize(turn, raw_text)
+                timings.set_trace_id(result.meta.get("trace_id"))
+                self._record_usage(session_id, turn, result, usage)
+                self._remember_response(self.provider, turn, raw_text)
+                return result
+        except self._passthrough_errors as exc:
+            self._record_failure(exc)
+            raise
+        except Exception as exc:
+            self._record_failure(exc)
+            raise RuntimeError(f"{self.event_label} handler failed: {exc}") from exc
+        finally:
+            self._end_turn(session_id)
+
+    async def ahandle(self, request: InvokeRequest) -> InvokeResponseData:
+        session_id, state_version = await self._abegin_turn(request)
+        try:
+            with track_turn(self.event_label.lower()) as timings, collect_usage() as usage:
+                turn = self._prepare(request)
+                turn.state_version = state_version
+                turn.max_tokens = self._resolve_max_tokens()
+                raw_text = await self._acomplete(turn)
+                try:
+                    with self.state_repo.batch():
+                        result = self._finalize(turn, raw_text)
+                except LLMTruncatedOutputError:
+                    if not self._widen_max_tokens(turn):
+                        raise
+                    raw_text = await self._acomplete(turn)
+                    with self.state_repo.batch():
+                        result = self._finalize(turn, raw_text)
+                timings.set_trace_id(result.meta.get("trace_id"))
+                self._record_usage(session_id, turn, result, usage)
+                self._remember_response(self.async_provider, turn, raw_text)
+                return result
+        except self._passthrough_errors as exc:
+            self._record_failure(exc)
+            raise
+        except Exception as exc:
+            self._record_failure(exc)
+            raise RuntimeError(f"{self.event_label} handler failed: {exc}") from exc
+        finally:
+            self._end_turn(session_id)
+
+    async def astream(
+        self,
+        request: InvokeRequest,
+    ) -> AsyncIterator[str | InvokeResponseData]:
+        session_id, state_version = await self._abegin_turn(request)
+        try:
+            with track_turn(self.event_label.lower()) as timings, collect_usage() as usage:
+                turn = self._prepare(request)
+                turn.state_version = state_version
+                parser = IncrementalJsonParser(text_paths=(self.stream_text_path,))
+                chunks: list[str] = []
+
+                stream = self.async_provider.stream_prompt(
+                    turn.prompt,
+                    system_prompt=self.system_prompt,
+                    temperature=self.temperature,
+                    max_tokens=self.max_tokens,
+                )
+
+                try:
+                    with stage("complete_prompt"), collect_usage() as call_usage:
+                        async with aclosing(stream):
+                            async for chunk in stream:
+                                chunks.append(chunk)
+                                for event in parser.feed(chunk):
+                                    if event.kind == "text":
+                                        yield event.data
+                                if parser.done:
+                                    # 顶层对象已闭合，后续 token 不再需要
+                                    break
+                except self._passthrough_errors:
+                    raise
+                except Exception as exc:
+                    raise LLMInvokeError(f"DeepSeek stream failed: {exc}") from exc
+                turn.call_usage = call_usage
+
+                raw_text = self._check_raw_text("".join(chunks))
+                with self.state_repo.batch():
+                    result = self._finalize(turn, raw_text)
+                timings.set_trace_id(result.meta.get("trace_id"))
+                self._record_usage(session_id, turn, result, usage)
+                self._remember_response(self.async_provider, turn, raw_text)
+            yield result
+        except self._passthrough_errors as exc:
+            self._record_failure(exc)
+            raise
+        except Exception as exc:
+            self._record_failure(exc)
+            raise RuntimeError(f"{self.event_label} handler failed: {exc}") from exc
+        finally:
+            self._end_turn(session_id)
+
+    def _prepare(self, request: InvokeRequest) -> EventTurn:
+        raise NotImplementedError
+
+    def _finalize(self, turn: EventTurn, raw_text: str) -> InvokeResponseData:
+        raise NotImplementedError
+
+    def _complete(self, turn: EventTurn) -> str:
+        try:
+            with stage("complete_prompt"), collect_usage() as call_usage:
+                raw_text = self.provider.complete_prompt(
+                    turn.prompt,
+                    system_prompt=self.system_prompt,
+                    temperature=self.temperature,
+                    max_tokens=turn.max_tokens or self.max_tokens,
+                )
+        except Exception as exc:
+            raise LLMInvokeError(f"DeepSeek invoke failed: {exc}") from exc
+
+        turn.call_usage = call_usage
+        return self._check_raw_text(raw_text)
+
+    async def _acomplete(self, turn: EventTurn) -> str:
+        try:
+            with stage("complete_prompt"), collect_usage() as call_usage:
+                raw_text = await self.async_provider.complete_prompt(
+                    turn.prompt,
+                    system_prompt=self.system_prompt,
+                    temperature=self.temperature,
+                    max_tokens=turn.max_tokens or self.max_tokens,
+                )
+        except Exception as exc:
+            raise LLMInvokeError(f"DeepSeek invoke failed: {exc}") from exc
+
+        turn.call_usage = call_usage
+        return self._check_raw_text(raw_text)
+
+    def _remember_response(self, provider: Any, turn: EventTurn, raw_text: str) -> None:
+        """
+        _finalize 校验通过的输出才回填响应缓存，
+        截断 / 非法 / 被中断的输出不会被后续相同请求复用。
+        """
+        provider.remember_response(
+            turn.prompt,
+            raw_text,
+            system_prompt=self.system_prompt,
+            temperature=self.temperature,
+        )
+
+    def _resolve_max_tokens(self) -> int:
+        """
+        本回合的输出预算：历史输出长度的高分位 + 余量，不超过 max_tokens。
+        """
+        return get_completion_budget().max_tokens(
+            self.event_label.lower(),
+            self.prompt_version,
+            ceiling=self.max_tokens,
+        )
+
+    def _widen_max_tokens(self, turn: EventTurn) -> bool:
+        """
+        输出被截断后放大预算；已经是上限时返回 False，由调用方原样抛出。
+        """
+        retry = get_completion_budget().retry_budget(
+            self.event_label.lower(),
+            turn.max_tokens or self.max_tokens,
+            ceiling=self.max_tokens,
+        )
+        if retry is None:
+            return False
+        turn.max_tokens = retry
+        return True
+
+    def _append_augmented_context(self, prompt: str, augmented_context: str) -> str:
+        """
+        把补充上下文追加到 prompt 末尾，超出 PROMPT_CONTEXT_BUDGET_TOKENS 时截断。
+        """
+        if not augmented_context:
+            return prompt
+
+        augmented_context = fit_text(
+            augmented_context,
+            settings.prompt_context_budget_tokens,
+            section="augmented_context",
+        )
+        return f"{prompt}\n\n【补充上下文】\n{augmented_context}"
+
+    def _build_session_memory(self, session_id: str) -> str:
+        """
+        固定大小的会话记忆块：
+
+        - 上一事件类型（快照）
+        - 剧情梗概：模型上回合重写的 ai_state.memory_summary
+        - 早前经过 / 最近回合：事件日志折叠出的 SessionMemory
+        """
+        parts: list[str] = []
+        story_summary = ""
+
+        snapshot = self.state_repo.get_snapshot(session_id)
+        if snapshot:
+            if snapshot.get("event_type"):
+                parts.append(f"上一事件类型：{snapshot['event_type']}")
+            story_summary = (snapshot.get("ai_state") or {}).get("memory_summary") or ""
+
+        summary = self.state_repo.get_event_summary(session_id)
+        memory = summary.memory if summary is not None else SessionMemory()
+        block = memory.render(story_summary)
+        if block:
+            parts.append(f"【会话记忆】\n{block}")
+
+        return "\n".join(parts)
+
+    def _estimate_prompt_tokens(self, turn: EventTurn) -> int:
+        """
+        本回合输入的估算 token 数（system + user），写入 meta.prompt_tokens_estimate。
+        """
+        return _system_prompt_tokens(self.system_prompt) + estimate_tokens(turn.prompt)
+
+    def _begin_turn(self, request: InvokeRequest) -> tuple[str | None, int | None]:
+        """
+        登记会话回合并读取当前快照版本；请求里没有 session_id 时不做并发控制。
+        """
+        session_id = request.session_id
+        if not session_id:
+            return None, None
+
+        if not self.turn_claims.claim(session_id):
+            raise StateConflictError(
+                f"session {session_id} already has a turn in progress"
+            )
+
+        try:
+            return session_id, self.state_repo.get_version(session_id)
+        except BaseException:
+            self.turn_claims.release(session_id)
+            raise
+
+    async def _abegin_turn(self, request: InvokeRequest) -> tuple[str | None, int | None]:
+        """
+        异步入口先在线程里 preload 会话（写回仓储可能要从后端回填），
+        之后回合内的仓储读写都只碰内存，不阻塞事件循环。
+        """
+        if request.session_id:
+            await asyncio.to_thread(self.state_repo.preload, request.session_id)
+        return self._begin_turn(request)
+
+    def _end_turn(self, session_id: str | None) -> None:
+        if session_id:
+            self.turn_claims.release(session_id)
+
+    @property
+    def prompt_template(self) -> str:
+        """
+        用量汇总里的 prompt 模板名，默认与 prompts/ 下的模块名一致。
+        """
+        return f"{self.event_label.lower()}_prompt"
+
+    @property
+    def prompt_version(self) -> str:
+        """
+        system_prompt 的版本号；prompt 改动后输出长度分布重新统计。
+        """
+        return template_version(self.system_prompt)
+
+    def _record_usage(
+        self,
+        session_id: str | None,
+        turn: EventTurn,
+        result: InvokeResponseData,
+        usage: TokenUsage,
+    ) -> None:
+        """
+        本回合的 token 用量（及本地估算的输入 token 数、输出预算）写入 meta，
+        计入全局用量汇总，最后一次调用的输出长度计入 CompletionBudget。
+        缓存命中的回合没有模型调用，calls 为 0，不计入汇总。
+        """
+        result.meta["usage"] = usage.to_dict()
+        result.meta["prompt_tokens_estimate"] = self._estimate_prompt_tokens(turn)
+        result.meta["max_tokens"] = turn.max_tokens or self.max_tokens
+        get_completion_budget().record(
+            self.event_label.lower(),
+            self.prompt_version,
+            turn.call_usage,
+        )
+        get_usage_ledger().record(
+            session_id=session_id,
+            event_type=self.event_label.lower(),
+            template=self.prompt_template,
+            usage=usage,
+        )
+
+    def _record_failure(self, exc: Exception) -> None:
+        """
+        按 handler + 异常类型计数（JSON 解析失败 / schema 校验失败 / 上游错误 ...）。
+        """
+        metrics.inc(
+            "event_handler_errors_total",
+            event_type=self.event_label.lower(),
+            kind=type(exc).__name__,
+        )
+
+    def _session_ttl(self, request: Any) -> float:
+        """
+        会话空闲 TTL：本局时长上限 + 宽限期。
+        """
+        time_info = getattr(request, "time", None)
+        hard_limit = getattr(time_info, "hard_limit_seconds", None) or 0
+        return hard_limit + settings.session_ttl_grace_seconds
+
+    def _record_event(
+        self,
+        session_id: str,
+        event_type: str,
+        scene_summary: str,
+        response_payload: dict[str, Any],
+    ) -> None:
+        """
+        把本次事件的最小历史追加到会话事件日志，供 END 读取整局历史。
+        """
+        self.state_repo.append_event(
+            session_id,
+            EventRecord(
+                event_type=event_type,
+                scene_summary=(scene_summary or "").strip(),
+                selected_option_text=self._extract_selected_option_text(response_payload),
+                result_summary=self._extract_result_summary(response_payload),
+            ),
+        )
+
+    def _extract_selected_option_text(self, payload: dict[str, Any]) -> str:
+        if not isinstance(payload, dict):
+            return ""
+
+        decision = payload.get("decision")
+        if isinstance(decision, dict) and decision.get("selected_option_text"):
+            return str(decision["selected_option_text"]).strip()
+
+        attempt = payload.get("attempt")
+        if isinstance(attempt, dict) and attempt.get("selected_option_text"):
+            return str(attempt["selected_option_text"]).strip()
+
+        combat = payload.get("combat")
+        if isinstance(combat, dict) and combat.get("selected_option_text"):
+            return str(combat["selected_option_text"]).strip()
+
+        result = payload.get("result")
+        if isinstance(result, dict) and result.get("player_action"):
+            return str(result["player_action"]).strip()
+
+        return ""
+
+    def _extract_result_summary(self, payload: dict[str, Any]) -> str:
+        if not isinstance(payload, dict):
+            return ""
+
+        result = payload.get("result")
+        if isinstance(result, dict):
+            for key in ("summary", "outcome", "resolution"):
+                value = result.get(key)
+                if isinstance(value, str) and value.strip():
+                    return value.strip()
+
+        scene = payload.get("scene")
+        if isinstance(scene, dict):
+            summary = scene.get("summary")
+            if isinstance(summary, str) and summary.strip():
+                return summary.strip()
+
+        for key in ("epilogue", "opening"):
+            section = payload.get(key)
+            if isinstance(section, dict):
+                scene_text = section.get("scene")
+                if isinstance(scene_text, str) and scene_text.strip():
+                    return scene_text.strip()
+
+        return ""
+
+    def _check_raw_text(self, raw_text: str) -> str:
+        log_sampled_debug(logger, f"{self.event_label} LLM raw output", raw_text or "")
+
+        if not raw_text or not raw_text.strip():
+            raise LLMEmptyResponseError("DeepSeek returned empty content")
+
+        return raw_text
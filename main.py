@@ -1,21 +1,39 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 
+from api.admin import router as admin_router
 from api.health import router as health_router
-from api.invoke import router as invoke_router
+from api.invoke import dispatcher, router as invoke_router
+from api.metrics import router as metrics_router
 from api.event_init import router as event_init_router
 from api.event_novel import router as event_novel_router
 from core.config import settings
 from core.exceptions import register_exception_handlers
-from core.logging import get_logger, setup_logging
+from core.logging import get_logger, setup_logging, shutdown_logging
 from fastapi.middleware.cors import CORSMiddleware
+from services.ai.deepseek_client import get_async_deepseek_provider
 
 setup_logging()
 logger = get_logger(__name__)
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # 关闭共享的 DeepSeek 连接池
+    await get_async_deepseek_provider().aclose()
+    # 提交 / 关闭会话仓储
+    dispatcher.state_repo.close()
+    # 刷出日志队列
+    shutdown_logging()
+
+
 app = FastAPI(
     title=settings.app_name,
     version=settings.app_version,
     debug=settings.debug,
+    lifespan=lifespan,
 )
 
 app.add_middleware(
@@ -31,6 +49,8 @@ app.include_router(health_router)
 app.include_router(invoke_router)
 app.include_router(event_init_router)
 app.include_router(event_novel_router)
+app.include_router(admin_router)
+app.include_router(metrics_router)
 
 
 logger.info("FastAPI application initialized")
\ No newline at end of file
@@ -0,0 +1,93 @@
+import math
+import re
+from collections.abc import Callable
+
+from core.metrics import registry as metrics
+
+
+# DeepSeek 官方换算：1 个中文字符约 0.6 token，1 个英文字符约 0.3 token
+_CJK_TOKENS_PER_CHAR = 0.6
+_OTHER_TOKENS_PER_CHAR = 0.3
+
+_CJK_RE = re.compile(r"[\u2e80-\u9fff\uac00-\ud7af\uf900-\ufaff\ufe30-\ufe4f\uff00-\uffef]")
+
+
+def estimate_tokens(text: str | None) -> int:
+    """
+    本地估算文本的 token 数（不加载分词器），用于 prompt 预算，
+    误差在一成左右；实际用量以响应里的 usage 为准。
+    """
+    if not text:
+        return 0
+
+    size = len(text)
+    if text.isascii():
+        return math.ceil(size * _OTHER_TOKENS_PER_CHAR)
+
+    cjk = len(_CJK_RE.findall(text))
+    return math.ceil(cjk * _CJK_TOKENS_PER_CHAR + (size - cjk) * _OTHER_TOKENS_PER_CHAR)
+
+
+def _record_trim(section: str) -> None:
+    metrics.inc("prompt_sections_trimmed_total", section=section)
+
+
+def fit_text(text: str, budget: int, *, section: str = "text") -> str:
+    """
+    超出预算时截断文本尾部，并以“…”结尾。
+    """
+    if budget <= 0 or estimate_tokens(text) <= budget:
+        return text
+
+    _record_trim(section)
+
+    keep = len(text)
+    while keep > 0:
+        keep = int(keep * 0.9)
+        candidate = text[:keep].rstrip() + "…"
+        if estimate_tokens(candidate) <= budget:
+            return candidate
+    return ""
+
+
+def fit_lines(
+    lines: list[str],
+    budget: int,
+    *,
+    keep: str,
+    omitted_note: Callable[[int], str],
+    section: str,
+) -> list[str]:
+    """
+    按行装入预算：
+
+    - keep="newest"：从最后一行往前装，丢弃最早的行（历史事件）
+    - keep="oldest"：从第一行往后装，丢弃靠后的行（状态标记）
+
+    有行被丢弃时，在丢弃的一侧补一行 omitted_note(丢弃行数)，
+    说明行本身的 token 也计入预算。
+    """
+    if budget <= 0:
+        return lines
+
+    costs = [estimate_tokens(line) + 1 for line in lines]
+    if sum(costs) <= budget:
+        return lines
+
+    _record_trim(section)
+
+    note_cost = estimate_tokens(omitted_note(len(lines))) + 1
+    remaining = budget - note_cost
+    order = range(len(lines) - 1, -1, -1) if keep == "newest" else range(len(lines))
+
+    kept: list[int] = []
+    for index in order:
+        if costs[index] > remaining:
+            break
+        remaining -= costs[index]
+        kept.append(index)
+
+    kept.sort()
+    note = omitted_note(len(lines) - len(kept))
+    body = [lines[index] for index in kept]
+    return [note, *body] if keep == "newest" else [*body, note]
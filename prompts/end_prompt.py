@@ -1,10 +1,11 @@
 from core.config import settings
 from schemas.end import EndRequest
+from prompts.budget import fit_lines
+from prompts.engine import PromptTemplate
+from prompts.helpers import format_state_flags, join_terms, safe_text
 
 
-END_PROMPT_TEMPLATE = """All outputs must be in {language}.
-
-You MUST follow all requirements strictly.
+END_SYSTEM_PROMPT = """You MUST follow all requirements strictly.
 
 你是一个5分钟短局叙事游戏的DM。
 
@@ -100,107 +101,92 @@ END 是终局事件，因此 routing 必须固定为结束态。
 48. novel_summary 必须优先使用“发生了什么 → 玩家做了什么或推动了什么 → 结果如何”的摘要式表达
 49. novel_summary 不得过度使用抽象哲思、意识流、象征化表达，除非这些内容在历史事件中已有明确依据
 
-输入：
-- total_seconds: {hard_limit_seconds}
-- elapsed_seconds: {elapsed_active_seconds}
-- remaining_seconds: {remaining_seconds}
-- difficulty: {difficulty}
-- player_count: {player_count}
-- run_seed: {run_seed}
-- language: {language}
-- IMPORTANT: output language must strictly follow the language field
-- max_scene_chars: {max_chars_scene}
-- forbidden_terms: {forbidden_terms}
-- tone_bias: {tone_bias}
-- theme_bias: {theme_bias}
-- npc_bias: {npc_bias}
-- client_platform: {client_platform}
-- client_locale: {client_locale}
-
-当前状态输入：
-- current_scene_summary: {current_scene_summary}
-- state_flags:
-{state_flags_text}
-
-整局历史事件摘要（必须重点参考）：
-{history_events_text}
-
 输出示例结构：
-{{
-  "event": {{
+{
+  "event": {
     "type": "end"
-  }},
-  "ai_state": {{
+  },
+  "ai_state": {
     "world_seed": "string",
     "title": "string",
     "tone": "string",
     "memory_summary": "string",
     "arc_progress": 100
-  }},
-  "payload": {{
-    "ending": {{
+  },
+  "payload": {
+    "ending": {
       "title": "string",
       "outcome": "string"
-    }},
-    "epilogue": {{
+    },
+    "epilogue": {
       "scene": "string",
       "closing_line": "string"
-    }},
+    },
     "key_choices": [
-      {{
+      {
         "event_type": "decision",
         "choice_text": "string",
         "impact": "string"
-      }}
+      }
     ],
-    "novel_summary": {{
+    "novel_summary": {
       "story_overview": "string",
       "player_journey": "string",
       "final_outcome": "string"
-    }}
-  }},
-  "routing": {{
+    }
+  },
+  "routing": {
     "next_event_type": "end",
     "should_end": true
-  }},
-  "context": {{
+  },
+  "context": {
     "current_scene_summary": "string",
     "available_options": [],
-    "state_flags": {{}}
-  }},
-  "meta": {{
+    "state_flags": {}
+  },
+  "meta": {
     "trace_id": "string"
-  }}
-}}
-
-现在开始，只输出 JSON。
+  }
+}
 """
 
+END_INPUT_TEMPLATE = PromptTemplate(
+    """All outputs must be in {language}.
 
-def _safe_text(value: str | None, default: str = "无") -> str:
-    if value is None:
-        return default
-    value = str(value).strip()
-    return value if value else default
-
+输入：
+- total_seconds: {hard_limit_seconds}
+- elapsed_seconds: {elapsed_active_seconds}
+- remaining_seconds: {remaining_seconds}
+- difficulty: {difficulty}
+- player_count: {player_count}
+- run_seed: {run_seed}
+- language: {language}
+- IMPORTANT: output language must strictly follow the language field
+- max_scene_chars: {max_chars_scene}
+- forbidden_terms: {forbidden_terms}
+- tone_bias: {tone_bias}
+- theme_bias: {theme_bias}
+- npc_bias: {npc_bias}
+- client_platform: {client_platform}
+- client_locale: {client_locale}
 
-def _join_terms(terms: list[str]) -> str:
-    if not terms:
-        return "无"
-    normalized = [str(term).strip() for term in terms if str(term).strip()]
-    return "、".join(normalized) if normalized else "无"
+当前状态输入：
+- current_scene_summary: {current_scene_summary}
+- state_flags:
+{state_flags_text}
 
+整局历史事件摘要（必须重点参考）：
+{history_events_text}
 
-def _format_state_flags(state_flags: dict) -> str:
-    if not state_flags:
-        return "{}"
-    pairs = []
-    for k, v in state_flags.items():
-        pairs.append(f'- "{k}": {repr(v)}')
-    return "\n".join(pairs)
+现在开始，只输出 JSON。
+"""
+)
 
 
-def _format_history_events(history_events: list[dict] | None) -> str:
+def _format_history_events(
+    history_events: list[dict] | None,
+    budget_tokens: int = 0,
+) -> str:
     if not history_events:
         return "- 无历史事件记录，请基于当前上下文生成一个完整终局总结"
 
@@ -218,14 +204,32 @@ def _format_history_events(history_events: list[dict] | None) -> str:
             f"result={result}"
         )
 
+    # 超出预算时保留最近的事件，最早的事件先被省略
+    lines = fit_lines(
+        lines,
+        budget_tokens,
+        keep="newest",
+        omitted_note=lambda count: f"- （更早的 {count} 个事件已省略）",
+        section="history_events",
+    )
     return "\n".join(lines)
 
 
 def render_end_prompt(
     request: EndRequest,
     history_events: list[dict] | None = None,
+    history_text: str | None = None,
 ) -> str:
-    return END_PROMPT_TEMPLATE.format(
+    """
+    history_text：预先整理好的历史文本（如会话记忆块），传入时不再逐条渲染 history_events。
+    """
+    if history_text is None:
+        history_text = _format_history_events(
+            history_events,
+            settings.prompt_history_budget_tokens,
+        )
+
+    return END_INPUT_TEMPLATE.render(
         hard_limit_seconds=request.time.hard_limit_seconds,
         elapsed_active_seconds=request.time.elapsed_active_seconds,
         remaining_seconds=request.time.remaining_seconds,
@@ -234,13 +238,16 @@ def render_end_prompt(
         run_seed=request.seed.run_seed,
         language=request.constraints.language,
         max_chars_scene=request.constraints.max_chars_scene,
-        forbidden_terms=_join_terms(request.constraints.forbidden_terms),
-        tone_bias=_safe_text(request.slots.tone_bias),
-        theme_bias=_safe_text(request.slots.theme_bias),
-        npc_bias=_safe_text(request.slots.npc_bias),
-        client_platform=_safe_text(request.client_context.platform),
-        client_locale=_safe_text(request.client_context.locale),
+        forbidden_terms=join_terms(request.constraints.forbidden_terms),
+        tone_bias=safe_text(request.slots.tone_bias),
+        theme_bias=safe_text(request.slots.theme_bias),
+        npc_bias=safe_text(request.slots.npc_bias),
+        client_platform=safe_text(request.client_context.platform),
+        client_locale=safe_text(request.client_context.locale),
         current_scene_summary=request.context.current_scene_summary,
-        state_flags_text=_format_state_flags(request.context.state_flags),
-        history_events_text=_format_history_events(history_events),
+        state_flags_text=format_state_flags(
+            request.context.state_flags,
+            settings.prompt_state_flags_budget_tokens,
+        ),
+        history_events_text=history_text,
     )
\ No newline at end of file
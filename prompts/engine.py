@@ -0,0 +1,53 @@
+from string import Formatter
+from typing import Any
+
+
+class PromptTemplate:
+    """
+    预编译的 prompt 模板。
+
+    导入时用 str.format 的语法解析一次，拆成字面量片段和槽位；
+    render 只把槽位填进片段列表，再做一次 join，不再逐次扫描模板文本。
+
+    - 语法与 str.format 相同（{name} 为槽位，{{ / }} 为字面量花括号）
+    - 不支持格式说明 / 转换（{name:>4} / {name!r}），编译时报错
+    - 缺少槽位值时抛 KeyError，与 str.format 一致
+    """
+
+    __slots__ = ("text", "fields", "_parts", "_slots")
+
+    def __init__(self, text: str) -> None:
+        self.text = text
+
+        parts: list[str] = []
+        slots: list[tuple[int, str]] = []
+        literal: list[str] = []
+
+        for literal_text, field_name, format_spec, conversion in Formatter().parse(text):
+            if literal_text:
+                literal.append(literal_text)
+            if field_name is None:
+                continue
+
+            if not field_name or format_spec or conversion:
+                raise ValueError(f"unsupported prompt slot: {{{field_name}}}")
+
+            if literal:
+                parts.append("".join(literal))
+                literal = []
+            slots.append((len(parts), field_name))
+            parts.append("")
+
+        if literal:
+            parts.append("".join(literal))
+
+        self._parts = parts
+        self._slots = tuple(slots)
+        self.fields = frozenset(name for _, name in slots)
+
+    def render(self, **values: Any) -> str:
+        parts = self._parts.copy()
+        for index, name in self._slots:
+            value = values[name]
+            parts[index] = value if isinstance(value, str) else str(value)
+        return "".join(parts)
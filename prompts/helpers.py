@@ -0,0 +1,113 @@
+from functools import lru_cache
+from typing import Any
+
+from prompts.budget import fit_lines
+
+
+_FLAG_VALUE_MAX_CHARS = 120
+
+
+def safe_text(value: str | None, default: str = "无") -> str:
+    if value is None:
+        return default
+    value = str(value).strip()
+    return value if value else default
+
+
+def join_terms(terms: list[str]) -> str:
+    if not terms:
+        return "无"
+    normalized = [str(term).strip() for term in terms if str(term).strip()]
+    return "、".join(normalized) if normalized else "无"
+
+
+def format_options(options: list) -> str:
+    if not options:
+        return "- 无"
+    return "\n".join(f"- id={item.id}, text={item.text}" for item in options)
+
+
+def format_state_flags(state_flags: dict, budget_tokens: int = 0) -> str:
+    """
+    budget_tokens > 0 时：单个值过长先截断，仍超预算则丢弃靠后的标记。
+    """
+    if not state_flags:
+        return "{}"
+    pairs = []
+    for k, v in state_flags.items():
+        value = repr(v)
+        if budget_tokens and len(value) > _FLAG_VALUE_MAX_CHARS:
+            value = value[:_FLAG_VALUE_MAX_CHARS] + "…"
+        pairs.append(f'- "{k}": {value}')
+
+    if budget_tokens:
+        pairs = fit_lines(
+            pairs,
+            budget_tokens,
+            keep="oldest",
+            omitted_note=lambda count: f"- …（其余 {count} 项已省略）",
+            section="state_flags",
+        )
+    return "\n".join(pairs)
+
+
+def resolve_selected_option_text(request: Any) -> str:
+    option_map = {item.id: item.text for item in request.context.available_options}
+    return option_map[request.payload.selected_option_id]
+
+
+INIT_FALLBACK_EVENTS = ("decision", "combat", "puzzle")
+LOOP_FALLBACK_EVENTS = ("decision", "combat", "puzzle", "end")
+
+
+@lru_cache(maxsize=64)
+def _normalize_event_types(
+    source: tuple[str, ...] | str,
+    fallback: tuple[str, ...],
+) -> tuple[tuple[str, ...], str]:
+    items = source.split(",") if isinstance(source, str) else source
+
+    normalized: list[str] = []
+    seen: set[str] = set()
+
+    for item in items:
+        value = str(item).strip().lower()
+        if value and value not in seen:
+            normalized.append(value)
+            seen.add(value)
+
+    if not normalized:
+        normalized = list(fallback)
+
+    return tuple(normalized), ", ".join(normalized)
+
+
+def _resolve_event_types(
+    allowed_next_event_types: list[str] | None,
+    default_raw: str,
+    fallback: tuple[str, ...],
+) -> tuple[tuple[str, ...], str]:
+    source = tuple(allowed_next_event_types) if allowed_next_event_types else default_raw
+    return _normalize_event_types(source, fallback)
+
+
+def allowed_next_event_types(
+    allowed_next_event_types: list[str] | None,
+    default_raw: str,
+    fallback: tuple[str, ...],
+) -> tuple[str, ...]:
+    """
+    归一化（小写、去空、去重）后的可选下一事件类型。
+
+    default_raw 是配置里的原始 CSV（如 settings.loop_allowed_next_events_raw）。
+    结果按原始值缓存：配置不变时每回合直接复用，配置改动后自然换成新的缓存项。
+    """
+    return _resolve_event_types(allowed_next_event_types, default_raw, fallback)[0]
+
+
+def join_allowed_event_types(
+    allowed_next_event_types: list[str] | None,
+    default_raw: str,
+    fallback: tuple[str, ...],
+) -> str:
+    return _resolve_event_types(allowed_next_event_types, default_raw, fallback)[1]
@@ -2,11 +2,17 @@ import random
 
 from schemas.init import InitRequest
 from core.config import settings
+from prompts.engine import PromptTemplate
+from prompts.helpers import (
+    INIT_FALLBACK_EVENTS,
+    allowed_next_event_types as resolve_allowed_next_event_types,
+    join_allowed_event_types,
+    join_terms,
+    safe_text,
+)
 
 
-INIT_PROMPT_TEMPLATE = """All outputs must be in {language}.
-
-You MUST follow all requirements strictly.
+INIT_SYSTEM_PROMPT = """You MUST follow all requirements strictly.
 
 你是一个5分钟短局叙事游戏的DM。
 
@@ -59,128 +65,93 @@ You MUST follow all requirements strictly.
 20. routing.next_event_type 必须从 allowed_next_event_types 中选择
 21. INIT 不应直接结束，should_end 必须为 false
 
-输入：
-- total_seconds: {hard_limit_seconds}
-- elapsed_seconds: {elapsed_active_seconds}
-- remaining_seconds: {remaining_seconds}
-- difficulty: {difficulty}
-- player_count: {player_count}
-- run_seed: {run_seed}
-- language: {language}
-- IMPORTANT: output language must strictly follow the language field
-- max_scene_chars: {max_chars_scene}
-- max_option_chars: {max_chars_option}
-- forbidden_terms: {forbidden_terms}
-- tone_bias: {tone_bias}
-- theme_bias: {theme_bias}
-- npc_bias: {npc_bias}
-
-可建议的下一事件类型（必须从中选择）：
-{allowed_next_event_types}
-
-输出示例中的 next_event_type 样例值（仅示例，不代表固定写死）：
-{sample_next_event_type}
-
 输出示例结构：
-{{
-  "event": {{
+{
+  "event": {
     "type": "init"
-  }},
-  "ai_state": {{
+  },
+  "ai_state": {
     "world_seed": "string",
     "title": "string",
     "tone": "string",
     "memory_summary": "string",
     "arc_progress": 0
-  }},
-  "payload": {{
-    "mainline": {{
+  },
+  "payload": {
+    "mainline": {
       "premise": "string",
       "player_role": "string",
       "primary_goal": "string",
       "stakes": "string"
-    }},
-    "opening": {{
+    },
+    "opening": {
       "scene": "string",
       "npc_line": "string"
-    }},
-    "start_hint": {{
+    },
+    "start_hint": {
       "how_to_play_next": "string"
-    }},
+    },
     "options": [
-      {{ "id": 1, "text": "string" }},
-      {{ "id": 2, "text": "string" }}
+      { "id": 1, "text": "string" },
+      { "id": 2, "text": "string" }
     ]
-  }},
-  "routing": {{
-    "next_event_type": "{sample_next_event_type}",
+  },
+  "routing": {
+    "next_event_type": "decision",
     "should_end": false
-  }},
-  "context": {{
+  },
+  "context": {
     "current_scene_summary": "string",
     "available_options": [
-      {{ "id": 1, "text": "string" }},
-      {{ "id": 2, "text": "string" }}
+      { "id": 1, "text": "string" },
+      { "id": 2, "text": "string" }
     ],
-    "state_flags": {{}}
-  }},
-  "meta": {{
+    "state_flags": {}
+  },
+  "meta": {
     "trace_id": "string"
-  }}
-}}
-
-现在开始，只输出 JSON。
+  }
+}
 """
 
+INIT_INPUT_TEMPLATE = PromptTemplate(
+    """All outputs must be in {language}.
 
-def _safe_text(value: str | None, default: str = "无") -> str:
-    if value is None:
-        return default
-    value = str(value).strip()
-    return value if value else default
-
-
-def _join_terms(terms: list[str]) -> str:
-    if not terms:
-        return "无"
-    normalized = [str(term).strip() for term in terms if str(term).strip()]
-    return "、".join(normalized) if normalized else "无"
-
-
-def _normalize_event_name(name: str) -> str:
-    return str(name).strip().lower()
-
-
-def _get_allowed_next_event_types(
-    allowed_next_event_types: list[str] | None = None,
-) -> list[str]:
-    source = allowed_next_event_types or settings.init_allowed_next_events
-
-    normalized: list[str] = []
-    seen: set[str] = set()
-
-    for item in source:
-        value = _normalize_event_name(item)
-        if value and value not in seen:
-            normalized.append(value)
-            seen.add(value)
-
-    if not normalized:
-        normalized = ["decision", "combat", "puzzle"]
+输入：
+- total_seconds: {hard_limit_seconds}
+- elapsed_seconds: {elapsed_active_seconds}
+- remaining_seconds: {remaining_seconds}
+- difficulty: {difficulty}
+- player_count: {player_count}
+- run_seed: {run_seed}
+- language: {language}
+- IMPORTANT: output language must strictly follow the language field
+- max_scene_chars: {max_chars_scene}
+- max_option_chars: {max_chars_option}
+- forbidden_terms: {forbidden_terms}
+- tone_bias: {tone_bias}
+- theme_bias: {theme_bias}
+- npc_bias: {npc_bias}
 
-    return normalized
+可建议的下一事件类型（必须从中选择）：
+{allowed_next_event_types}
 
+输出示例中的 next_event_type 样例值（仅示例，不代表固定写死）：
+{sample_next_event_type}
 
-def _join_allowed_event_types(
-    allowed_next_event_types: list[str] | None = None,
-) -> str:
-    return ", ".join(_get_allowed_next_event_types(allowed_next_event_types))
+现在开始，只输出 JSON。
+"""
+)
 
 
 def _sample_next_event_type(
     allowed_next_event_types: list[str] | None = None,
 ) -> str:
-    candidates = _get_allowed_next_event_types(allowed_next_event_types)
+    candidates = resolve_allowed_next_event_types(
+        allowed_next_event_types,
+        settings.init_allowed_next_events_raw,
+        INIT_FALLBACK_EVENTS,
+    )
     return random.choice(candidates)
 
 
@@ -190,7 +161,7 @@ def render_init_prompt(
 ) -> str:
     sample_next_event_type = _sample_next_event_type(allowed_next_event_types)
 
-    return INIT_PROMPT_TEMPLATE.format(
+    return INIT_INPUT_TEMPLATE.render(
         hard_limit_seconds=request.time.hard_limit_seconds,
         elapsed_active_seconds=request.time.elapsed_active_seconds,
         remaining_seconds=request.time.remaining_seconds,
@@ -200,10 +171,14 @@ def render_init_prompt(
         language=request.constraints.language,
         max_chars_scene=request.constraints.max_chars_scene,
         max_chars_option=request.constraints.max_chars_option,
-        forbidden_terms=_join_terms(request.constraints.forbidden_terms),
-        tone_bias=_safe_text(request.slots.tone_bias),
-        theme_bias=_safe_text(request.slots.theme_bias),
-        npc_bias=_safe_text(request.slots.npc_bias),
-        allowed_next_event_types=_join_allowed_event_types(allowed_next_event_types),
+        forbidden_terms=join_terms(request.constraints.forbidden_terms),
+        tone_bias=safe_text(request.slots.tone_bias),
+        theme_bias=safe_text(request.slots.theme_bias),
+        npc_bias=safe_text(request.slots.npc_bias),
+        allowed_next_event_types=join_allowed_event_types(
+            allowed_next_event_types,
+            settings.init_allowed_next_events_raw,
+            INIT_FALLBACK_EVENTS,
+        ),
         sample_next_event_type=sample_next_event_type,
-    )
\ No newline at end of file
+    )
@@ -1,10 +1,18 @@
 from core.config import settings
 from schemas.puzzle import PuzzleRequest
+from prompts.engine import PromptTemplate
+from prompts.helpers import (
+    LOOP_FALLBACK_EVENTS,
+    format_options,
+    format_state_flags,
+    join_allowed_event_types,
+    join_terms,
+    resolve_selected_option_text,
+    safe_text,
+)
 
 
-PUZZLE_PROMPT_TEMPLATE = DECISION_PROMPT_TEMPLATE = PUZZLE_PROMPT_TEMPLATE = """All outputs must be in {language}.
-
-You MUST follow all requirements strictly。
+PUZZLE_SYSTEM_PROMPT = """You MUST follow all requirements strictly。
 
 你是一个5分钟短局叙事游戏的DM。
 
@@ -159,7 +167,65 @@ options 必须包含不同层级的尝试：
 
 🚫 禁止继续扩展新 puzzle 或进入冗余 decision
 
+输出示例结构：
+{
+  "event": {
+    "type": "puzzle"
+  },
+  "ai_state": {
+    "world_seed": "string",
+    "title": "string",
+    "tone": "string",
+    "memory_summary": "string",
+    "arc_progress": 20
+  },
+  "payload": {
+    "puzzle": {
+      "title": "string",
+      "riddle": "string",
+      "hint_level": 0,
+      "key_fact": "string"
+    },
+    "attempt": {
+      "selected_option_id": 1,
+      "selected_option_text": "string",
+      "is_correct": false
+    },
+    "result": {
+      "outcome": "string",
+      "consequence": "string",
+      "failure_level": "minor",
+      "enemy_triggered": false
+    },
+    "scene": {
+      "summary": "string",
+      "npc_line": "string"
+    },
+    "options": [
+      { "id": 1, "text": "string" },
+      { "id": 2, "text": "string" }
+    ]
+  },
+  "routing": {
+    "next_event_type": "puzzle",
+    "should_end": false
+  },
+  "context": {
+    "current_scene_summary": "string",
+    "available_options": [
+      { "id": 1, "text": "string" },
+      { "id": 2, "text": "string" }
+    ],
+    "state_flags": {}
+  },
+  "meta": {
+    "trace_id": "string"
+  }
+}
+"""
 
+PUZZLE_INPUT_TEMPLATE = PromptTemplate(
+    """All outputs must be in {language}.
 
 输入：
 - total_seconds: {hard_limit_seconds}
@@ -191,137 +257,18 @@ options 必须包含不同层级的尝试：
 可建议的下一事件类型（必须从中选择）：
 {allowed_next_event_types}
 
-输出示例结构：
-{{
-  "event": {{
-    "type": "puzzle"
-  }},
-  "ai_state": {{
-    "world_seed": "string",
-    "title": "string",
-    "tone": "string",
-    "memory_summary": "string",
-    "arc_progress": 20
-  }},
-  "payload": {{
-    "puzzle": {{
-      "title": "string",
-      "riddle": "string",
-      "hint_level": 0,
-      "key_fact": "string"
-    }},
-    "attempt": {{
-      "selected_option_id": {selected_option_id},
-      "selected_option_text": "{selected_option_text}",
-      "is_correct": false
-    }},
-    "result": {{
-      "outcome": "string",
-      "consequence": "string",
-      "failure_level": "minor",
-      "enemy_triggered": false
-    }},
-    "scene": {{
-      "summary": "string",
-      "npc_line": "string"
-    }},
-    "options": [
-      {{ "id": 1, "text": "string" }},
-      {{ "id": 2, "text": "string" }}
-    ]
-  }},
-  "routing": {{
-    "next_event_type": "puzzle",
-    "should_end": false
-  }},
-  "context": {{
-    "current_scene_summary": "string",
-    "available_options": [
-      {{ "id": 1, "text": "string" }},
-      {{ "id": 2, "text": "string" }}
-    ],
-    "state_flags": {{}}
-  }},
-  "meta": {{
-    "trace_id": "string"
-  }}
-}}
-
 现在开始，只输出 JSON。
 """
-
-
-def _safe_text(value: str | None, default: str = "无") -> str:
-    if value is None:
-        return default
-    value = str(value).strip()
-    return value if value else default
-
-
-def _join_terms(terms: list[str]) -> str:
-    if not terms:
-        return "无"
-    normalized = [str(term).strip() for term in terms if str(term).strip()]
-    return "、".join(normalized) if normalized else "无"
-
-
-def _format_options(options: list) -> str:
-    if not options:
-        return "- 无"
-    return "\n".join(f"- id={item.id}, text={item.text}" for item in options)
-
-
-def _format_state_flags(state_flags: dict) -> str:
-    if not state_flags:
-        return "{}"
-    pairs = []
-    for k, v in state_flags.items():
-        pairs.append(f'- "{k}": {repr(v)}')
-    return "\n".join(pairs)
-
-
-def _resolve_selected_option_text(request: PuzzleRequest) -> str:
-    option_map = {item.id: item.text for item in request.context.available_options}
-    return option_map[request.payload.selected_option_id]
-
-
-def _normalize_event_name(name: str) -> str:
-    return str(name).strip().lower()
-
-
-def _get_allowed_next_event_types(
-    allowed_next_event_types: list[str] | None = None,
-) -> list[str]:
-    source = allowed_next_event_types or settings.loop_allowed_next_events
-
-    normalized: list[str] = []
-    seen: set[str] = set()
-
-    for item in source:
-        value = _normalize_event_name(item)
-        if value and value not in seen:
-            normalized.append(value)
-            seen.add(value)
-
-    if not normalized:
-        normalized = ["decision", "combat", "puzzle", "end"]
-
-    return normalized
-
-
-def _join_allowed_event_types(
-    allowed_next_event_types: list[str] | None = None,
-) -> str:
-    return ", ".join(_get_allowed_next_event_types(allowed_next_event_types))
+)
 
 
 def render_puzzle_prompt(
     request: PuzzleRequest,
     allowed_next_event_types: list[str] | None = None,
 ) -> str:
-    selected_option_text = _resolve_selected_option_text(request)
+    selected_option_text = resolve_selected_option_text(request)
 
-    return PUZZLE_PROMPT_TEMPLATE.format(
+    return PUZZLE_INPUT_TEMPLATE.render(
         hard_limit_seconds=request.time.hard_limit_seconds,
         elapsed_active_seconds=request.time.elapsed_active_seconds,
         remaining_seconds=request.time.remaining_seconds,
@@ -331,16 +278,23 @@ def render_puzzle_prompt(
         language=request.constraints.language,
         max_chars_scene=request.constraints.max_chars_scene,
         max_chars_option=request.constraints.max_chars_option,
-        forbidden_terms=_join_terms(request.constraints.forbidden_terms),
-        tone_bias=_safe_text(request.slots.tone_bias),
-        theme_bias=_safe_text(request.slots.theme_bias),
-        npc_bias=_safe_text(request.slots.npc_bias),
-        client_platform=_safe_text(request.client_context.platform),
-        client_locale=_safe_text(request.client_context.locale),
+        forbidden_terms=join_terms(request.constraints.forbidden_terms),
+        tone_bias=safe_text(request.slots.tone_bias),
+        theme_bias=safe_text(request.slots.theme_bias),
+        npc_bias=safe_text(request.slots.npc_bias),
+        client_platform=safe_text(request.client_context.platform),
+        client_locale=safe_text(request.client_context.locale),
         current_scene_summary=request.context.current_scene_summary,
         selected_option_id=request.payload.selected_option_id,
         selected_option_text=selected_option_text,
-        available_options_text=_format_options(request.context.available_options),
-        state_flags_text=_format_state_flags(request.context.state_flags),
-        allowed_next_event_types=_join_allowed_event_types(allowed_next_event_types),
-    )
\ No newline at end of file
+        available_options_text=format_options(request.context.available_options),
+        state_flags_text=format_state_flags(
+            request.context.state_flags,
+            settings.prompt_state_flags_budget_tokens,
+        ),
+        allowed_next_event_types=join_allowed_event_types(
+            allowed_next_event_types,
+            settings.loop_allowed_next_events_raw,
+            LOOP_FALLBACK_EVENTS,
+        ),
+    )
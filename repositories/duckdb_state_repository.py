@@ -0,0 +1,308 @@
+import json
+import threading
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import replace
+from typing import Any
+
+import duckdb
+
+from core.config import settings
+from core.exceptions import StateConflictError
+from db import repo
+from db.client import DuckDBClient
+from repositories.session_memory import SessionMemory
+from repositories.state_repository import (
+    EventLogSummary,
+    EventRecord,
+    StateRepository,
+    build_journey,
+)
+
+
+class _PendingWrites:
+    __slots__ = ("snapshots", "events")
+
+    def __init__(self) -> None:
+        # 同一会话一个批次内只保留最后一份快照
+        # (session_id, event_type, ai_state_json, last_output_json, expected_version, version)
+        # version 不为 None 时按原值写入（write_snapshot），不做版本校验
+        self.snapshots: dict[str, tuple[str, str, str, str, int | None, int | None]] = {}
+        self.events: list[tuple[str, str, str, str, str]] = []
+
+
+class DuckDBStateRepository(StateRepository):
+    """
+    基于 DuckDB 的持久化状态仓储，接口与 MemoryStateRepository 一致。
+
+    - 启动时执行 schema 迁移
+    - 快照按 session_id upsert，事件日志只追加
+    - batch() 内的写入攒在当前线程，退出时一次事务提交
+      （快照用 upsert + executemany，事件用 executemany）
+    - 不在 batch() 内的写入立即单独提交
+    - 快照版本在提交事务内读取并校验 expected_version，冲突时整批回滚
+
+    事件日志在库中完整保留，iter_events 默认只取最近 max_events 条，
+    与内存版的环形缓冲语义一致。
+
+    会话摘要（计数 / journey / 折叠记忆）与事件在同一事务内增量更新到
+    session_summaries，和内存版一样折叠全部事件而不只是最近 max_events 条；
+    get_event_summary 只读这一行。迁移前写入、还没有摘要行的会话
+    从完整日志重放一次。
+    """
+
+    def __init__(
+        self,
+        path: str | None = None,
+        max_events: int | None = None,
+    ) -> None:
+        self.client = DuckDBClient(path or settings.duckdb_path)
+        self.client.migrate()
+        self._max_events = max(max_events or settings.event_log_max_events, 1)
+        self._local = threading.local()
+
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        pending: _PendingWrites | None = getattr(self._local, "pending", None)
+        if pending is not None:
+            # 嵌套 batch 合并到最外层
+            yield
+            return
+
+        pending = _PendingWrites()
+        self._local.pending = pending
+        try:
+            yield
+        finally:
+            self._local.pending = None
+
+        self._flush(pending)
+
+    def _flush(self, pending: _PendingWrites) -> dict[str, int]:
+        """
+        返回本次提交写入的快照版本（session_id -> version）。
+        """
+        if not pending.snapshots and not pending.events:
+            return {}
+
+        written: dict[str, int] = {}
+        with self.client.writer() as conn:
+            if pending.snapshots:
+                versions = repo.fetch_snapshot_versions(conn, list(pending.snapshots))
+                rows: list[tuple[str, str, str, str, int]] = []
+                for session_id, event_type, ai_state, last_output, expected, version in (
+                    pending.snapshots.values()
+                ):
+                    current = versions.get(session_id, 0)
+                    if version is None and expected is not None and current != expected:
+                        raise StateConflictError(
+                            f"session {session_id} snapshot version is {current}, "
+                            f"expected {expected}"
+                        )
+                    written[session_id] = version if version is not None else current + 1
+                    rows.append(
+                        (session_id, event_type, ai_state, last_output, written[session_id])
+                    )
+                repo.upsert_snapshots(conn, rows)
+            if pending.events:
+                repo.insert_events(conn, pending.events)
+                self._update_summaries(conn, pending.events)
+
+        return written
+
+    def _update_summaries(
+        self,
+        conn: duckdb.DuckDBPyConnection,
+        events: list[tuple[str, str, str, str, str]],
+    ) -> None:
+        # 调用方已在写事务内、且本批事件已插入
+        new_records: dict[str, list[EventRecord]] = {}
+        for session_id, *fields in events:
+            new_records.setdefault(session_id, []).append(EventRecord(*fields))
+
+        existing = repo.fetch_summaries(conn, list(new_records))
+        rows: list[tuple[str, int, str, int, str, str]] = []
+        for session_id, records in new_records.items():
+            row = existing.get(session_id)
+            if row is None:
+                summary = self._replay_summary(conn, session_id)
+            else:
+                summary = self._decode_summary(row)
+                for record in records:
+                    summary = summary.fold(record)
+                summary = replace(
+                    summary,
+                    journey=build_journey(
+                        self._fetch_records(conn, session_id, self._max_events)
+                    ),
+                )
+            rows.append(
+                (
+                    session_id,
+                    summary.total_events,
+                    json.dumps(summary.event_counts, ensure_ascii=False),
+                    summary.choice_count,
+                    summary.journey,
+                    json.dumps(summary.memory.to_dict(), ensure_ascii=False),
+                )
+            )
+        repo.upsert_summaries(conn, rows)
+
+    def _replay_summary(
+        self,
+        conn: duckdb.DuckDBPyConnection,
+        session_id: str,
+    ) -> EventLogSummary:
+        return EventLogSummary.from_events(
+            self._fetch_records(conn, session_id, limit=None),
+            self._max_events,
+        )
+
+    def _fetch_records(
+        self,
+        conn: duckdb.DuckDBPyConnection,
+        session_id: str,
+        limit: int | None,
+    ) -> list[EventRecord]:
+        return [EventRecord(*row) for row in repo.fetch_events(conn, session_id, limit)]
+
+    @staticmethod
+    def _decode_summary(row: tuple[int, str, int, str, str]) -> EventLogSummary:
+        total_events, event_counts, choice_count, journey, memory = row
+        return EventLogSummary(
+            total_events=total_events,
+            event_counts=json.loads(event_counts),
+            choice_count=choice_count,
+            journey=journey,
+            memory=SessionMemory.from_dict(json.loads(memory)),
+        )
+
+    def _current_batch(self) -> _PendingWrites:
+        pending = getattr(self._local, "pending", None)
+        return pending if pending is not None else _PendingWrites()
+
+    def save_snapshot(
+        self,
+        *,
+        session_id: str,
+        event_type: str,
+        ai_state: dict[str, Any],
+        last_output: dict[str, Any],
+        ttl_seconds: float | None = None,
+        expected_version: int | None = None,
+    ) -> int:
+        """
+        batch() 内的写入在提交时才落库，返回的是提交后将得到的版本：
+        有 expected_version 时为 expected_version + 1（冲突会整批回滚），
+        否则按当前已提交的版本推算。
+        """
+        pending = self._current_batch()
+        previous = pending.snapshots.get(session_id)
+        if previous is not None:
+            # 同一批次内多次写入只提交最后一份，版本校验以批内第一次为准
+            expected_version = previous[4]
+        pending.snapshots[session_id] = (
+            session_id,
+            event_type,
+            json.dumps(ai_state, ensure_ascii=False),
+            json.dumps(last_output, ensure_ascii=False),
+            expected_version,
+            None,
+        )
+
+        if pending is not getattr(self._local, "pending", None):
+            return self._flush(pending)[session_id]
+        if expected_version is not None:
+            return expected_version + 1
+        return self.get_version(session_id) + 1
+
+    def write_snapshot(
+        self,
+        *,
+        session_id: str,
+        event_type: str,
+        ai_state: dict[str, Any],
+        last_output: dict[str, Any],
+        version: int,
+        ttl_seconds: float | None = None,
+    ) -> None:
+        pending = self._current_batch()
+        pending.snapshots[session_id] = (
+            session_id,
+            event_type,
+            json.dumps(ai_state, ensure_ascii=False),
+            json.dumps(last_output, ensure_ascii=False),
+            None,
+            version,
+        )
+
+        if pending is not getattr(self._local, "pending", None):
+            self._flush(pending)
+
+    def get_snapshot(self, session_id: str) -> dict[str, Any] | None:
+        with self.client.reader() as conn:
+            row = repo.fetch_snapshot(conn, session_id)
+
+        if row is None:
+            return None
+
+        event_type, ai_state, last_output, version = row
+        return {
+            "session_id": session_id,
+            "event_type": event_type,
+            "version": version or 0,
+            "ai_state": json.loads(ai_state),
+            "last_output": json.loads(last_output),
+        }
+
+    def get_version(self, session_id: str) -> int:
+        with self.client.reader() as conn:
+            versions = repo.fetch_snapshot_versions(conn, [session_id])
+        return versions.get(session_id, 0)
+
+    def append_event(self, session_id: str, event_record: EventRecord) -> None:
+        pending = self._current_batch()
+        pending.events.append(
+            (
+                session_id,
+                event_record.event_type,
+                event_record.scene_summary,
+                event_record.selected_option_text,
+                event_record.result_summary,
+            )
+        )
+
+        if pending is not getattr(self._local, "pending", None):
+            self._flush(pending)
+
+    def iter_events(
+        self,
+        session_id: str,
+        limit: int | None = None,
+    ) -> Iterator[EventRecord]:
+        limit = min(limit, self._max_events) if limit is not None else self._max_events
+        with self.client.reader() as conn:
+            rows = repo.fetch_events(conn, session_id, limit)
+
+        return (
+            EventRecord(
+                event_type=event_type,
+                scene_summary=scene_summary,
+                selected_option_text=selected_option_text,
+                result_summary=result_summary,
+            )
+            for event_type, scene_summary, selected_option_text, result_summary in rows
+        )
+
+    def get_event_summary(self, session_id: str) -> EventLogSummary | None:
+        with self.client.reader() as conn:
+            row = repo.fetch_summaries(conn, [session_id]).get(session_id)
+            if row is not None:
+                return self._decode_summary(row)
+
+            summary = self._replay_summary(conn, session_id)
+
+        return summary if summary.total_events else None
+
+    def close(self) -> None:
+        self.client.close()
@@ -0,0 +1,30 @@
+from core.config import settings
+from repositories.memory_state_repository import MemoryStateRepository
+from repositories.state_repository import StateRepository
+
+
+def build_state_repository() -> StateRepository:
+    """
+    按 settings.state_backend 构建会话仓储：memory（默认）/ duckdb。
+
+    持久化后端默认包一层 write-behind（STATE_WRITE_BEHIND），
+    请求路径只写内存，落盘由后台线程批量完成。
+    """
+    backend = settings.state_backend.strip().lower()
+
+    if backend == "duckdb":
+        from repositories.duckdb_state_repository import DuckDBStateRepository
+
+        repo: StateRepository = DuckDBStateRepository()
+        if settings.state_write_behind:
+            from repositories.write_behind_state_repository import (
+                WriteBehindStateRepository,
+            )
+
+            repo = WriteBehindStateRepository(repo)
+        return repo
+
+    if backend != "memory":
+        raise RuntimeError(f"Unknown STATE_BACKEND: {settings.state_backend}")
+
+    return MemoryStateRepository()
@@ -1,7 +1,70 @@
+import time
+from collections import OrderedDict
+from collections.abc import Iterator, Mapping
+from dataclasses import replace
 from threading import Lock
 from typing import Any
 
-from repositories.state_repository import StateRepository
+from core.config import settings
+from core.exceptions import StateConflictError
+from repositories.session_snapshot import SessionSnapshot
+from repositories.state_repository import (
+    EventLogSummary,
+    EventRecord,
+    StateRepository,
+    build_journey,
+)
+
+
+class _SessionEntry:
+    __slots__ = (
+        "snapshot",
+        "events",
+        "summary",
+        "ttl_seconds",
+        "expires_at",
+        "referenced",
+        "snapshot_bytes",
+        "event_bytes",
+    )
+
+    def __init__(self, ttl_seconds: float) -> None:
+        # snapshot / events / summary 只整体替换、不原地修改，读方无需加锁
+        self.snapshot: SessionSnapshot | None = None
+        self.events: tuple[EventRecord, ...] = ()
+        self.summary: EventLogSummary | None = None
+        self.ttl_seconds = ttl_seconds
+        self.expires_at = 0.0
+        self.referenced = False
+        self.snapshot_bytes = 0
+        self.event_bytes = 0
+
+    @property
+    def size_bytes(self) -> int:
+        return self.snapshot_bytes + self.event_bytes
+
+
+class _Stripe:
+    __slots__ = ("entries", "lock", "bytes", "evicted_ttl", "evicted_lru")
+
+    def __init__(self) -> None:
+        self.entries: OrderedDict[str, _SessionEntry] = OrderedDict()
+        self.lock = Lock()
+        self.bytes = 0
+        self.evicted_ttl = 0
+        self.evicted_lru = 0
+
+
+def _record_bytes(record: EventRecord) -> int:
+    return sum(
+        len(text.encode("utf-8"))
+        for text in (
+            record.event_type,
+            record.scene_summary,
+            record.selected_option_text,
+            record.result_summary,
+        )
+    )
 
 
 class MemoryStateRepository(StateRepository):
@@ -10,11 +73,53 @@ class MemoryStateRepository(StateRepository):
 
     适合当前 MVP / 本地开发阶段。
     后续如果切 DuckDB，只要保留相同接口即可。
+
+    快照以 SessionSnapshot 紧凑编码保存，读取字段时才解码。
+    版本校验（expected_version）与写入在同一个 stripe 锁内完成。
+
+    并发：
+    - 会话按 hash(session_id) 分到 N 个 stripe，每个 stripe 独立加锁，
+      不同 stripe 的写入互不阻塞
+    - 同一会话的写入都落在同一个 stripe 锁内，天然保持顺序
+    - 读取不加锁：快照 / 事件元组 / 摘要都是整体替换的不可变对象
+
+    容量控制（在每个 stripe 内执行，上限按 stripe 数均分）：
+    - 空闲 TTL：save_snapshot 传入的 ttl_seconds（一般为
+      hard_limit_seconds + 宽限期），每次读写都会续期
+    - LRU 上限：会话数 / 近似字节数超限时从 stripe 头部淘汰；
+      读取只打“最近访问”标记（second chance），被标记的条目
+      淘汰时移到尾部再给一次机会，读路径因此不需要移动链表
+    - 过期清理是惰性的：读到过期条目时删除，写入时从头部顺带清理
     """
 
-    def __init__(self) -> None:
-        self._store: dict[str, dict[str, Any]] = {}
-        self._lock = Lock()
+    def __init__(
+        self,
+        max_events: int | None = None,
+        max_sessions: int | None = None,
+        max_bytes: int | None = None,
+        default_ttl_seconds: float | None = None,
+        stripes: int | None = None,
+    ) -> None:
+        stripe_count = max(stripes or settings.session_store_stripes, 1)
+        self._stripes = [_Stripe() for _ in range(stripe_count)]
+        self._max_events = max(max_events or settings.event_log_max_events, 1)
+        self._max_sessions = max(max_sessions or settings.session_max_sessions, 1)
+        self._max_bytes = max_bytes if max_bytes is not None else settings.session_max_bytes
+        self._default_ttl = (
+            default_ttl_seconds
+            if default_ttl_seconds is not None
+            else settings.session_default_ttl_seconds
+        )
+
+        self._stripe_max_sessions = max(self._max_sessions // stripe_count, 1)
+        self._stripe_max_bytes = self._max_bytes // stripe_count if self._max_bytes else 0
+
+    @property
+    def max_events(self) -> int:
+        return self._max_events
+
+    def _stripe(self, session_id: str) -> _Stripe:
+        return self._stripes[hash(session_id) % len(self._stripes)]
 
     def save_snapshot(
         self,
@@ -23,17 +128,302 @@ class MemoryStateRepository(StateRepository):
         event_type: str,
         ai_state: dict[str, Any],
         last_output: dict[str, Any],
+        ttl_seconds: float | None = None,
+        expected_version: int | None = None,
+    ) -> int:
+        """
+        返回写入后的快照版本。
+        """
+        snapshot = SessionSnapshot.encode(
+            session_id=session_id,
+            event_type=event_type,
+            ai_state=ai_state,
+            last_output=last_output,
+        )
+        stripe = self._stripe(session_id)
+
+        with stripe.lock:
+            now = time.monotonic()
+            current = stripe.entries.get(session_id)
+            current_version = (
+                current.snapshot.version
+                if current is not None
+                and current.snapshot is not None
+                and current.expires_at > now
+                else 0
+            )
+            if expected_version is not None and current_version != expected_version:
+                raise StateConflictError(
+                    f"session {session_id} snapshot version is {current_version}, "
+                    f"expected {expected_version}"
+                )
+
+            snapshot.version = current_version + 1
+            self._store_snapshot(stripe, session_id, snapshot, now, ttl_seconds)
+            return snapshot.version
+
+    def write_snapshot(
+        self,
+        *,
+        session_id: str,
+        event_type: str,
+        ai_state: dict[str, Any],
+        last_output: dict[str, Any],
+        version: int,
+        ttl_seconds: float | None = None,
+    ) -> None:
+        snapshot = SessionSnapshot.encode(
+            session_id=session_id,
+            event_type=event_type,
+            ai_state=ai_state,
+            last_output=last_output,
+            version=version,
+        )
+        stripe = self._stripe(session_id)
+
+        with stripe.lock:
+            self._store_snapshot(stripe, session_id, snapshot, time.monotonic(), ttl_seconds)
+
+    def restore_snapshot(
+        self,
+        snapshot: Mapping[str, Any],
+        ttl_seconds: float | None = None,
     ) -> None:
-        snapshot = {
-            "session_id": session_id,
-            "event_type": event_type,
-            "ai_state": ai_state,
-            "last_output": last_output,
+        """
+        按原版本号装入一份快照（供写回仓储从后端回填）；会话已有快照时不覆盖。
+        """
+        session_id = snapshot["session_id"]
+        restored = SessionSnapshot.encode(
+            session_id=session_id,
+            event_type=snapshot["event_type"],
+            ai_state=snapshot["ai_state"],
+            last_output=snapshot["last_output"],
+            version=int(snapshot.get("version") or 0),
+        )
+        stripe = self._stripe(session_id)
+
+        with stripe.lock:
+            now = time.monotonic()
+            current = stripe.entries.get(session_id)
+            if (
+                current is not None
+                and current.snapshot is not None
+                and current.expires_at > now
+            ):
+                return
+            self._store_snapshot(stripe, session_id, restored, now, ttl_seconds)
+
+    def restore_events(
+        self,
+        session_id: str,
+        records: list[EventRecord],
+        summary: EventLogSummary,
+    ) -> None:
+        """
+        按后端的事件日志与摘要装入会话（供写回仓储回填）；会话已有事件时不覆盖。
+        records 超过 max_events 时只保留最近的部分，summary 照原样保留全量计数与记忆。
+        """
+        events = tuple(records[-self._max_events :])
+        event_bytes = sum(_record_bytes(item) for item in events)
+        stripe = self._stripe(session_id)
+
+        with stripe.lock:
+            now = time.monotonic()
+            current = stripe.entries.get(session_id)
+            if (
+                current is not None
+                and current.summary is not None
+                and current.expires_at > now
+            ):
+                return
+
+            entry = self._touch_entry(stripe, session_id, now, None)
+            stripe.bytes += event_bytes - entry.event_bytes
+            entry.events = events
+            entry.event_bytes = event_bytes
+            entry.summary = replace(summary, journey=build_journey(events))
+            self._enforce_limits(stripe, now, keep=session_id)
+
+    def touch(self, session_id: str) -> None:
+        """
+        登记一个空会话（写回仓储确认后端也没有数据的新会话），
+        之后 contains 为 True，同一会话不再回后端查询。
+        """
+        stripe = self._stripe(session_id)
+
+        with stripe.lock:
+            now = time.monotonic()
+            self._touch_entry(stripe, session_id, now, None)
+            self._enforce_limits(stripe, now, keep=session_id)
+
+    def contains(self, session_id: str) -> bool:
+        """
+        会话是否仍在内存中（未过期、未被淘汰）。
+        """
+        return self._read_entry(session_id) is not None
+
+    def get_snapshot(self, session_id: str) -> SessionSnapshot | None:
+        entry = self._read_entry(session_id)
+        return entry.snapshot if entry is not None else None
+
+    def append_event(self, session_id: str, event_record: EventRecord) -> None:
+        record_bytes = _record_bytes(event_record)
+        stripe = self._stripe(session_id)
+
+        with stripe.lock:
+            now = time.monotonic()
+            entry = self._touch_entry(stripe, session_id, now, None)
+
+            events = entry.events + (event_record,)
+            if len(events) > self._max_events:
+                dropped = sum(_record_bytes(item) for item in events[: -self._max_events])
+                events = events[-self._max_events :]
+                entry.event_bytes -= dropped
+                stripe.bytes -= dropped
+            entry.event_bytes += record_bytes
+            stripe.bytes += record_bytes
+
+            previous = entry.summary or EventLogSummary()
+            entry.events = events
+            entry.summary = replace(
+                previous.fold(event_record),
+                journey=build_journey(events),
+            )
+            self._enforce_limits(stripe, now, keep=session_id)
+
+    def iter_events(
+        self,
+        session_id: str,
+        limit: int | None = None,
+    ) -> Iterator[EventRecord]:
+        entry = self._read_entry(session_id)
+        if entry is None:
+            return iter(())
+
+        events = entry.events
+        if limit is not None:
+            events = events[-limit:] if limit > 0 else ()
+        return iter(events)
+
+    def get_event_summary(self, session_id: str) -> EventLogSummary | None:
+        entry = self._read_entry(session_id)
+        return entry.summary if entry is not None else None
+
+    def clear(self) -> None:
+        for stripe in self._stripes:
+            with stripe.lock:
+                stripe.entries.clear()
+                stripe.bytes = 0
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "backend": "memory",
+            "stripes": len(self._stripes),
+            "sessions": sum(len(stripe.entries) for stripe in self._stripes),
+            "approx_bytes": sum(stripe.bytes for stripe in self._stripes),
+            "max_sessions": self._max_sessions,
+            "max_bytes": self._max_bytes,
+            "evicted_ttl": sum(stripe.evicted_ttl for stripe in self._stripes),
+            "evicted_lru": sum(stripe.evicted_lru for stripe in self._stripes),
         }
 
-        with self._lock:
-            self._store[session_id] = snapshot
+    def _read_entry(self, session_id: str) -> _SessionEntry | None:
+        """
+        无锁读取：只续期并打访问标记，过期时才进锁删除。
+        """
+        stripe = self._stripe(session_id)
+        entry = stripe.entries.get(session_id)
+        if entry is None:
+            return None
+
+        now = time.monotonic()
+        if entry.expires_at <= now:
+            with stripe.lock:
+                if stripe.entries.get(session_id) is entry and entry.expires_at <= now:
+                    self._remove(stripe, session_id)
+                    stripe.evicted_ttl += 1
+            return None
+
+        entry.expires_at = now + entry.ttl_seconds
+        entry.referenced = True
+        return entry
+
+    # 以下方法均要求调用方已持有 stripe.lock
+
+    def _store_snapshot(
+        self,
+        stripe: _Stripe,
+        session_id: str,
+        snapshot: SessionSnapshot,
+        now: float,
+        ttl_seconds: float | None,
+    ) -> None:
+        snapshot_bytes = snapshot.nbytes
+        entry = self._touch_entry(stripe, session_id, now, ttl_seconds)
+        stripe.bytes += snapshot_bytes - entry.snapshot_bytes
+        entry.snapshot = snapshot
+        entry.snapshot_bytes = snapshot_bytes
+        self._enforce_limits(stripe, now, keep=session_id)
+
+    def _touch_entry(
+        self,
+        stripe: _Stripe,
+        session_id: str,
+        now: float,
+        ttl_seconds: float | None,
+    ) -> _SessionEntry:
+        entry = stripe.entries.get(session_id)
+        if entry is not None and entry.expires_at <= now:
+            self._remove(stripe, session_id)
+            stripe.evicted_ttl += 1
+            entry = None
+
+        if entry is None:
+            entry = _SessionEntry(ttl_seconds or self._default_ttl)
+            stripe.entries[session_id] = entry
+        else:
+            if ttl_seconds:
+                entry.ttl_seconds = ttl_seconds
+            stripe.entries.move_to_end(session_id)
+            entry.referenced = False
+
+        entry.expires_at = now + entry.ttl_seconds
+        return entry
+
+    def _enforce_limits(self, stripe: _Stripe, now: float, keep: str) -> None:
+        """
+        keep 是刚写入的会话，本次淘汰不会选中它：其余条目都被读过时，
+        second chance 会把它们轮换到它后面，不能让刚写入的数据立刻被淘汰。
+        """
+        entries = stripe.entries
+
+        # 头部是最久未写入的会话，先顺带清理已过期的
+        while entries:
+            session_id, entry = next(iter(entries.items()))
+            if entry.expires_at > now:
+                break
+            self._remove(stripe, session_id)
+            stripe.evicted_ttl += 1
+
+        while len(entries) > self._stripe_max_sessions or (
+            self._stripe_max_bytes
+            and stripe.bytes > self._stripe_max_bytes
+            and len(entries) > 1
+        ):
+            session_id, entry = next(iter(entries.items()))
+            if session_id == keep:
+                if len(entries) == 1:
+                    break
+                entries.move_to_end(session_id)
+                continue
+            if entry.referenced:
+                # second chance：最近被读过，移到尾部
+                entry.referenced = False
+                entries.move_to_end(session_id)
+                continue
+            self._remove(stripe, session_id)
+            stripe.evicted_lru += 1
 
-    def get_snapshot(self, session_id: str) -> dict[str, Any] | None:
-        with self._lock:
-            return self._store.get(session_id)
\ No newline at end of file
+    def _remove(self, stripe: _Stripe, session_id: str) -> None:
+        entry = stripe.entries.pop(session_id)
+        stripe.bytes -= entry.size_bytes
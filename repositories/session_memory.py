@@ -0,0 +1,166 @@
+from collections.abc import Iterable
+from dataclasses import dataclass, replace
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from repositories.state_repository import EventRecord
+
+
+# 最近几个回合逐条保留
+_RECENT_TURNS = 3
+# 移出“最近”的回合每攒够这么多个，合成一章
+_CHAPTER_TURNS = 4
+# 章节数上限，超出时合并最早的两章
+_MAX_CHAPTERS = 3
+
+_LINE_CHARS = 60
+_CLAUSE_CHARS = 24
+_CHAPTER_CHARS = 120
+_STORY_CHARS = 150
+
+
+def _clip(text: str, limit: int) -> str:
+    text = " ".join(text.split())
+    if len(text) <= limit:
+        return text
+    return text[: limit - 1].rstrip("，。；、,.; ") + "…"
+
+
+@dataclass(frozen=True)
+class MemoryChapter:
+    start_turn: int
+    end_turn: int
+    text: str
+
+    def render(self) -> str:
+        if self.start_turn == self.end_turn:
+            return f"第{self.start_turn}回合：{self.text}"
+        return f"第{self.start_turn}-{self.end_turn}回合：{self.text}"
+
+
+@dataclass(frozen=True)
+class SessionMemory:
+    """
+    会话的滚动分层记忆，随事件日志逐条折叠，结果是确定的：
+
+    - recent：最近 _RECENT_TURNS 个回合，每回合一行（事件类型 / 选择 / 结果）
+    - pending：移出 recent 的回合先压成一句短结果，攒够 _CHAPTER_TURNS 句合成一章
+    - chapters：更早的章节，超过 _MAX_CHAPTERS 时合并最早的两章
+
+    每层都有固定的条数和字数上限，render() 的长度与回合数无关。
+    同一段事件日志无论增量折叠还是从头重放，得到的记忆完全相同。
+    """
+
+    turns: int = 0
+    recent: tuple[tuple[str, str], ...] = ()
+    pending: tuple[str, ...] = ()
+    chapters: tuple[MemoryChapter, ...] = ()
+
+    @classmethod
+    def from_events(cls, records: Iterable["EventRecord"]) -> "SessionMemory":
+        memory = cls()
+        for record in records:
+            memory = memory.fold(record)
+        return memory
+
+    def fold(self, record: "EventRecord") -> "SessionMemory":
+        line, clause = self._describe(record)
+        recent = self.recent + ((line, clause),)
+        pending = self.pending
+        chapters = self.chapters
+
+        if len(recent) > _RECENT_TURNS:
+            (_, leaving_clause), recent = recent[0], recent[1:]
+            if leaving_clause:
+                pending = pending + (leaving_clause,)
+
+        # 第一个尚未进入 recent 的回合号
+        first_recent_turn = self.turns + 2 - len(recent)
+        if len(pending) >= _CHAPTER_TURNS:
+            chapter_start = chapters[-1].end_turn + 1 if chapters else 1
+            chapters = chapters + (
+                MemoryChapter(
+                    start_turn=chapter_start,
+                    end_turn=first_recent_turn - 1,
+                    text=_clip("；".join(pending), _CHAPTER_CHARS),
+                ),
+            )
+            pending = ()
+
+        if len(chapters) > _MAX_CHAPTERS:
+            first, second = chapters[0], chapters[1]
+            merged = MemoryChapter(
+                start_turn=first.start_turn,
+                end_turn=second.end_turn,
+                text=(
+                    f"{_clip(first.text, _CHAPTER_CHARS // 2)}；"
+                    f"{_clip(second.text, _CHAPTER_CHARS // 2)}"
+                ),
+            )
+            chapters = (merged,) + chapters[2:]
+
+        return replace(
+            self,
+            turns=self.turns + 1,
+            recent=recent,
+            pending=pending,
+            chapters=chapters,
+        )
+
+    def render(self, story_summary: str = "") -> str:
+        """
+        固定大小的记忆块；story_summary 为模型每回合重写的 memory_summary，
+        作为最上层的剧情梗概。
+        """
+        lines: list[str] = []
+
+        if story_summary and story_summary.strip():
+            lines.append(f"剧情梗概：{_clip(story_summary, _STORY_CHARS)}")
+
+        earlier = [chapter.render() for chapter in self.chapters]
+        if self.pending:
+            earlier.append(_clip("；".join(self.pending), _CHAPTER_CHARS))
+        if earlier:
+            lines.append("早前经过：")
+            lines.extend(f"- {item}" for item in earlier)
+
+        if self.recent:
+            lines.append(f"最近 {len(self.recent)} 个回合：")
+            lines.extend(f"- {line}" for line, _ in self.recent)
+
+        return "\n".join(lines)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "turns": self.turns,
+            "recent": [list(item) for item in self.recent],
+            "pending": list(self.pending),
+            "chapters": [
+                [chapter.start_turn, chapter.end_turn, chapter.text]
+                for chapter in self.chapters
+            ],
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "SessionMemory":
+        return cls(
+            turns=int(data.get("turns") or 0),
+            recent=tuple((str(line), str(clause)) for line, clause in data.get("recent") or ()),
+            pending=tuple(str(item) for item in data.get("pending") or ()),
+            chapters=tuple(
+                MemoryChapter(start_turn=int(start), end_turn=int(end), text=str(text))
+                for start, end, text in data.get("chapters") or ()
+            ),
+        )
+
+    @staticmethod
+    def _describe(record: "EventRecord") -> tuple[str, str]:
+        result = record.result_summary or record.scene_summary
+        parts = [record.event_type]
+        if record.selected_option_text:
+            parts.append(f"选择「{record.selected_option_text}」")
+        if result:
+            parts.append(result)
+        line = _clip(" → ".join(parts), _LINE_CHARS)
+        clause = _clip(result, _CLAUSE_CHARS) if result else ""
+        return line, clause
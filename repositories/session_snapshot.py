@@ -0,0 +1,129 @@
+import json
+import sys
+import zlib
+from collections.abc import Iterator, Mapping
+from typing import Any
+
+_RAW = b"j"
+_ZLIB = b"z"
+# 小于这个长度的 JSON 压缩收益不抵开销，直接存原文
+_COMPRESS_MIN_BYTES = 256
+
+
+def encode_blob(value: Any) -> bytes:
+    """
+    dict -> 紧凑 JSON (UTF-8) -> 按需 zlib 压缩，首字节标记编码方式。
+    """
+    raw = json.dumps(
+        value,
+        ensure_ascii=False,
+        separators=(",", ":"),
+        default=str,
+    ).encode("utf-8")
+
+    if len(raw) >= _COMPRESS_MIN_BYTES:
+        compressed = zlib.compress(raw, 1)
+        if len(compressed) < len(raw):
+            return _ZLIB + compressed
+
+    return _RAW + raw
+
+
+def decode_blob(blob: bytes) -> Any:
+    marker, body = blob[:1], blob[1:]
+    if marker == _ZLIB:
+        body = zlib.decompress(body)
+    return json.loads(body)
+
+
+class SessionSnapshot(Mapping[str, Any]):
+    """
+    紧凑编码的会话快照。
+
+    - ai_state / last_output 各自编码成一段 bytes，读取对应字段时才解码，
+      每次解码都返回新的 dict，调用方可以随意修改
+    - event_type 做 intern，大量会话共享同一个字符串对象
+    - 实现 Mapping 接口，snapshot["ai_state"] / snapshot.get(...) 用法不变
+    - version：该会话快照的写入版本号，首次保存为 1，供乐观并发校验
+    """
+
+    __slots__ = ("session_id", "event_type", "version", "_ai_state", "_last_output")
+
+    _KEYS = ("session_id", "event_type", "version", "ai_state", "last_output")
+
+    def __init__(
+        self,
+        session_id: str,
+        event_type: str,
+        ai_state_blob: bytes,
+        last_output_blob: bytes,
+        version: int = 0,
+    ) -> None:
+        self.session_id = session_id
+        self.event_type = sys.intern(event_type)
+        self.version = version
+        self._ai_state = ai_state_blob
+        self._last_output = last_output_blob
+
+    @classmethod
+    def encode(
+        cls,
+        *,
+        session_id: str,
+        event_type: str,
+        ai_state: dict[str, Any],
+        last_output: dict[str, Any],
+        version: int = 0,
+    ) -> "SessionSnapshot":
+        return cls(
+            session_id,
+            event_type,
+            encode_blob(ai_state),
+            encode_blob(last_output),
+            version,
+        )
+
+    @property
+    def ai_state(self) -> dict[str, Any]:
+        return decode_blob(self._ai_state)
+
+    @property
+    def last_output(self) -> dict[str, Any]:
+        return decode_blob(self._last_output)
+
+    @property
+    def nbytes(self) -> int:
+        """
+        编码后载荷的字节数（不含对象头），用于容量统计。
+        """
+        return (
+            len(self._ai_state)
+            + len(self._last_output)
+            + len(self.session_id.encode("utf-8"))
+        )
+
+    def __getitem__(self, key: str) -> Any:
+        if key == "session_id":
+            return self.session_id
+        if key == "event_type":
+            return self.event_type
+        if key == "version":
+            return self.version
+        if key == "ai_state":
+            return self.ai_state
+        if key == "last_output":
+            return self.last_output
+        raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._KEYS)
+
+    def __len__(self) -> int:
+        return len(self._KEYS)
+
+    def __repr__(self) -> str:
+        return (
+            f"SessionSnapshot(session_id={self.session_id!r}, "
+            f"event_type={self.event_type!r}, version={self.version}, "
+            f"nbytes={self.nbytes})"
+        )
@@ -1,6 +1,110 @@
 from abc import ABC, abstractmethod
+from collections.abc import Iterable, Iterator, Mapping
+from contextlib import AbstractContextManager, nullcontext
+from dataclasses import dataclass, field, replace
 from typing import Any
 
+from repositories.session_memory import SessionMemory
+
+
+@dataclass(frozen=True)
+class EventRecord:
+    """
+    事件日志中的一条记录，字段与 END 的 history_events 保持一致。
+    """
+
+    event_type: str
+    scene_summary: str = ""
+    selected_option_text: str = ""
+    result_summary: str = ""
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "EventRecord":
+        return cls(
+            event_type=str(data.get("event_type", "unknown")).strip().lower() or "unknown",
+            scene_summary=str(data.get("scene_summary") or "").strip(),
+            selected_option_text=str(data.get("selected_option_text") or "").strip(),
+            result_summary=str(data.get("result_summary") or "").strip(),
+        )
+
+    def to_dict(self) -> dict[str, str]:
+        return {
+            "event_type": self.event_type,
+            "scene_summary": self.scene_summary,
+            "selected_option_text": self.selected_option_text,
+            "result_summary": self.result_summary,
+        }
+
+    def journey_segment(self) -> str:
+        """
+        单条记录对应的一段玩家旅程文本（场景，选择，结果）。
+        """
+        seg = []
+        if self.scene_summary:
+            seg.append(self.scene_summary)
+        if self.selected_option_text:
+            seg.append(f"你做出了“{self.selected_option_text}”这一选择")
+        if self.result_summary:
+            seg.append(self.result_summary)
+        return "，".join(seg)
+
+
+@dataclass(frozen=True)
+class EventLogSummary:
+    """
+    随 append_event 增量维护的会话摘要，读取时无需再遍历日志。
+
+    - total_events：累计事件数（不受环形缓冲容量限制）
+    - event_counts：按事件类型计数
+    - choice_count：带有真实选项文本的事件数
+    - journey：缓冲区内事件拼接好的玩家旅程文本
+    - memory：逐条折叠的滚动分层记忆（不受环形缓冲容量限制，大小固定）
+    """
+
+    total_events: int = 0
+    event_counts: dict[str, int] = field(default_factory=dict)
+    choice_count: int = 0
+    journey: str = ""
+    memory: SessionMemory = field(default_factory=SessionMemory)
+
+    def fold(self, record: EventRecord) -> "EventLogSummary":
+        """
+        折叠一条新事件（journey 依赖缓冲区内容，由调用方另行设置）。
+        """
+        event_counts = dict(self.event_counts)
+        event_counts[record.event_type] = event_counts.get(record.event_type, 0) + 1
+        return replace(
+            self,
+            total_events=self.total_events + 1,
+            event_counts=event_counts,
+            choice_count=self.choice_count + (1 if record.selected_option_text else 0),
+            memory=self.memory.fold(record),
+        )
+
+    @classmethod
+    def from_events(
+        cls,
+        records: Iterable[EventRecord],
+        max_events: int,
+    ) -> "EventLogSummary":
+        """
+        从完整事件日志重放出摘要，与逐条 append_event 维护的结果一致。
+        """
+        records = list(records)
+        summary = cls()
+        for record in records:
+            summary = summary.fold(record)
+        return replace(summary, journey=build_journey(records[-max_events:]))
+
+
+def build_journey(records: Iterable[EventRecord]) -> str:
+    """
+    缓冲区内事件拼接成的玩家旅程文本。
+    """
+    return "；".join(
+        segment for segment in (record.journey_segment() for record in records) if segment
+    )
+
 
 class StateRepository(ABC):
     """
@@ -9,6 +113,9 @@ class StateRepository(ABC):
     当前阶段目标：
     - 保存一份会话快照
     - 按 session_id 读取会话快照
+    - 快照带版本号，save_snapshot 支持 compare-and-swap（expected_version）
+    - 按会话追加事件日志，供 END 读取整局历史
+    - batch()：把一个回合内的多次写入合并提交（默认无操作）
 
     未来可以有：
     - MemoryStateRepository
@@ -24,9 +131,89 @@ class StateRepository(ABC):
         event_type: str,
         ai_state: dict[str, Any],
         last_output: dict[str, Any],
-    ) -> None:
+        ttl_seconds: float | None = None,
+        expected_version: int | None = None,
+    ) -> int:
+        """
+        ttl_seconds：会话空闲多久后可被回收；None 表示使用仓储默认值。
+        expected_version：写入前的快照版本（尚无快照为 0），与当前版本
+        不一致时抛 StateConflictError；None 表示不校验。写入成功后版本 +1。
+
+        返回写入后的快照版本。
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_snapshot(self, session_id: str) -> Mapping[str, Any] | None:
+        """
+        返回快照映射：session_id / event_type / version / ai_state / last_output。
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def append_event(self, session_id: str, event_record: EventRecord) -> None:
         raise NotImplementedError
 
     @abstractmethod
-    def get_snapshot(self, session_id: str) -> dict[str, Any] | None:
-        raise NotImplementedError
\ No newline at end of file
+    def iter_events(
+        self,
+        session_id: str,
+        limit: int | None = None,
+    ) -> Iterator[EventRecord]:
+        """
+        按时间顺序返回会话事件；limit 表示只取最近的 N 条。
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_event_summary(self, session_id: str) -> EventLogSummary | None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def write_snapshot(
+        self,
+        *,
+        session_id: str,
+        event_type: str,
+        ai_state: dict[str, Any],
+        last_output: dict[str, Any],
+        version: int,
+        ttl_seconds: float | None = None,
+    ) -> None:
+        """
+        按给定版本号原样写入快照（覆盖，不做版本校验）；
+        供写回仓储把前端已校验过的版本同步到后端，两边版本号保持一致。
+        """
+        raise NotImplementedError
+
+    def get_version(self, session_id: str) -> int:
+        """
+        当前快照版本，没有快照时为 0。
+        """
+        snapshot = self.get_snapshot(session_id)
+        return int(snapshot.get("version") or 0) if snapshot else 0
+
+    def preload(self, session_id: str) -> None:
+        """
+        把会话数据预先装入可无阻塞读取的位置（写回仓储从后端回填）；
+        异步调用方应放到线程里执行。默认无操作。
+        """
+        return None
+
+    def batch(self) -> AbstractContextManager[None]:
+        """
+        在 with 块内的写入合并为一次提交；内存实现无需合并。
+        """
+        return nullcontext()
+
+    def stats(self) -> dict[str, Any]:
+        """
+        容量 / 淘汰统计，供 admin 接口展示。
+        """
+        return {"backend": type(self).__name__}
+
+    def close(self) -> None:
+        """
+        释放底层资源（连接 / 后台线程等），默认无操作。
+        """
+        return None
@@ -0,0 +1,498 @@
+import asyncio
+import threading
+import time
+from collections.abc import Iterator, Mapping
+from contextlib import contextmanager
+from typing import Any
+
+from core.config import settings
+from core.exceptions import StateBackpressureError
+from core.logging import get_logger
+from repositories.memory_state_repository import MemoryStateRepository
+from repositories.state_repository import EventLogSummary, EventRecord, StateRepository
+
+
+logger = get_logger(__name__)
+
+# 连续刷盘失败时的退避上限
+_MAX_BACKOFF_SECONDS = 30.0
+
+# 回填时读后端期间遇到批次提交的重读次数，超过后持刷盘锁读取
+_LOAD_ATTEMPTS = 3
+
+
+def _on_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+class _Pending:
+    __slots__ = ("snapshots", "events")
+
+    def __init__(self) -> None:
+        # 同一会话的多次快照写入只保留最后一次（带前端的版本号）
+        self.snapshots: dict[str, dict[str, Any]] = {}
+        self.events: list[tuple[str, EventRecord]] = []
+
+    def __len__(self) -> int:
+        return len(self.snapshots) + len(self.events)
+
+
+class WriteBehindStateRepository(StateRepository):
+    """
+    写回（write-behind）仓储：前端是内存仓储，后端是持久化仓储。
+
+    - 写入先落到内存前端并进入待刷队列，请求路径不碰磁盘
+    - 后台线程按 flush_interval 或队列达到 batch_size 时，
+      在一次 backend.batch() 内批量写入后端
+    - 同一会话未刷出的快照合并为最后一次；事件日志按顺序全部保留
+    - 快照按前端校验后的版本号原样写入后端（write_snapshot），两边版本一致
+    - close() 时停止线程并把剩余数据全部刷出
+
+    背压：待刷条目达到 max_pending 时拒绝新的写入（StateBackpressureError）。
+    准入在 batch() 入口（一个回合的全部写入）或单次写入前检查，
+    已准入的写入不再等待，不会出现回合写了一半被拒绝。
+    事件循环线程上直接拒绝，不阻塞其他会话；其他线程最多等待
+    queue_wait_seconds。
+
+    刷盘失败：整批放回队列，按 flush_interval 指数退避重试；连续失败
+    超过 max_retries 次时丢弃这一批并记入 stats()["dropped_items"]。
+
+    读取优先走内存前端；前端没有该会话（重启后 / 已被淘汰）时，
+    从后端回填快照、最近事件与摘要，并叠加尚未刷出的写入。
+    后端读取不持刷盘锁；后端也没有数据的新会话在前端登记为空会话，
+    之后不再回后端查询。异步调用方先在线程里调用 preload()，
+    请求路径上的读写只碰内存前端。
+    版本校验（expected_version）在前端完成，冲突的写入不会进入待刷队列。
+    """
+
+    def __init__(
+        self,
+        backend: StateRepository,
+        front: MemoryStateRepository | None = None,
+        flush_interval: float | None = None,
+        batch_size: int | None = None,
+        max_pending: int | None = None,
+        queue_wait_seconds: float | None = None,
+        max_retries: int | None = None,
+    ) -> None:
+        self.backend = backend
+        self.front = front or MemoryStateRepository()
+        self._flush_interval = (
+            flush_interval
+            if flush_interval is not None
+            else settings.state_flush_interval_seconds
+        )
+        self._batch_size = max(batch_size or settings.state_flush_batch_size, 1)
+        self._max_pending = max(max_pending or settings.state_write_queue_max, 1)
+        self._queue_wait = (
+            queue_wait_seconds
+            if queue_wait_seconds is not None
+            else settings.state_write_queue_wait_seconds
+        )
+        self._max_retries = max(
+            max_retries if max_retries is not None else settings.state_flush_max_retries,
+            0,
+        )
+
+        self._pending = _Pending()
+        self._cond = threading.Condition()
+        # 串行化“取出待刷批次 + 写入后端”，保证批次按顺序落盘
+        self._write_lock = threading.Lock()
+        # 正在写入后端的批次；回填时与待刷队列一起叠加
+        self._inflight: _Pending | None = None
+        # 提交计数（seqlock）：批次提交期间为奇数，提交结束后为偶数。
+        # 回填读后端前后计数不变，说明读到的数据与 _inflight / 待刷队列不重叠。
+        # 要求后端的 batch() 在退出时一次性提交（DuckDB 即如此）
+        self._epoch = 0
+        self._local = threading.local()
+        self._closed = False
+
+        self._failures = 0
+        self._retry_at = 0.0
+
+        self._flushed_batches = 0
+        self._flushed_items = 0
+        self._flush_errors = 0
+        self._dropped_items = 0
+        self._backpressure_waits = 0
+        self._rejected_writes = 0
+
+        self._thread = threading.Thread(
+            target=self._run,
+            name="state-write-behind",
+            daemon=True,
+        )
+        self._thread.start()
+
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        """
+        一个回合的写入只在入口做一次准入检查。
+        """
+        if getattr(self._local, "admitted", False):
+            yield
+            return
+
+        self._admit()
+        self._local.admitted = True
+        try:
+            yield
+        finally:
+            self._local.admitted = False
+
+    def save_snapshot(
+        self,
+        *,
+        session_id: str,
+        event_type: str,
+        ai_state: dict[str, Any],
+        last_output: dict[str, Any],
+        ttl_seconds: float | None = None,
+        expected_version: int | None = None,
+    ) -> int:
+        self._ensure_loaded(session_id)
+        self._admit_single()
+
+        version = self.front.save_snapshot(
+            session_id=session_id,
+            event_type=event_type,
+            ai_state=ai_state,
+            last_output=last_output,
+            ttl_seconds=ttl_seconds,
+            expected_version=expected_version,
+        )
+        item = {
+            "session_id": session_id,
+            "event_type": event_type,
+            "ai_state": ai_state,
+            "last_output": last_output,
+            "version": version,
+            "ttl_seconds": ttl_seconds,
+        }
+
+        with self._cond:
+            self._pending.snapshots[session_id] = item
+            self._notify_if_full()
+        return version
+
+    def write_snapshot(
+        self,
+        *,
+        session_id: str,
+        event_type: str,
+        ai_state: dict[str, Any],
+        last_output: dict[str, Any],
+        version: int,
+        ttl_seconds: float | None = None,
+    ) -> None:
+        self._ensure_loaded(session_id)
+        self._admit_single()
+
+        item = {
+            "session_id": session_id,
+            "event_type": event_type,
+            "ai_state": ai_state,
+            "last_output": last_output,
+            "version": version,
+            "ttl_seconds": ttl_seconds,
+        }
+        self.front.write_snapshot(**item)
+
+        with self._cond:
+            self._pending.snapshots[session_id] = item
+            self._notify_if_full()
+
+    def get_snapshot(self, session_id: str) -> Mapping[str, Any] | None:
+        self._ensure_loaded(session_id)
+        return self.front.get_snapshot(session_id)
+
+    def append_event(self, session_id: str, event_record: EventRecord) -> None:
+        self._ensure_loaded(session_id)
+        self._admit_single()
+
+        self.front.append_event(session_id, event_record)
+
+        with self._cond:
+            self._pending.events.append((session_id, event_record))
+            self._notify_if_full()
+
+    def iter_events(
+        self,
+        session_id: str,
+        limit: int | None = None,
+    ) -> Iterator[EventRecord]:
+        self._ensure_loaded(session_id)
+        return self.front.iter_events(session_id, limit)
+
+    def get_event_summary(self, session_id: str) -> EventLogSummary | None:
+        self._ensure_loaded(session_id)
+        return self.front.get_event_summary(session_id)
+
+    def preload(self, session_id: str) -> None:
+        self._ensure_loaded(session_id)
+
+    def clear(self) -> None:
+        self.front.clear()
+
+    def flush(self) -> None:
+        """
+        立即把待刷数据写入后端（阻塞到完成）；写入失败时抛出异常，
+        数据按重试策略留在队列中。
+        """
+        with self._write_lock:
+            with self._cond:
+                pending = self._take_pending()
+            error = self._write(pending)
+
+        if error is not None:
+            raise RuntimeError("write-behind flush failed") from error
+
+    def stats(self) -> dict[str, Any]:
+        with self._cond:
+            pending_snapshots = len(self._pending.snapshots)
+            pending_events = len(self._pending.events)
+
+        return {
+            **self.front.stats(),
+            "backend": f"write_behind:{type(self.backend).__name__}",
+            "pending_snapshots": pending_snapshots,
+            "pending_events": pending_events,
+            "flushed_batches": self._flushed_batches,
+            "flushed_items": self._flushed_items,
+            "flush_errors": self._flush_errors,
+            "consecutive_flush_failures": self._failures,
+            "dropped_items": self._dropped_items,
+            "backpressure_waits": self._backpressure_waits,
+            "rejected_writes": self._rejected_writes,
+        }
+
+    def close(self) -> None:
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+
+        self._thread.join()
+        try:
+            self.flush()
+        except RuntimeError:
+            with self._cond:
+                lost = self._take_pending()
+            self._dropped_items += len(lost)
+            logger.error("write-behind dropped %s items on close", len(lost))
+        self.backend.close()
+
+    def _ensure_loaded(self, session_id: str) -> None:
+        """
+        前端没有该会话时从后端回填：快照（保留版本号）、最近事件与全量摘要，
+        再叠加正在写入 / 仍在待刷队列里的写入，保证回填后的前端与
+        “后端 + 队列”一致。
+
+        后端读取不持刷盘锁，读完后按 _epoch 判断期间是否有批次提交，
+        有则重读；连续重读失败时才持刷盘锁读取。
+        """
+        if self.front.contains(session_id):
+            return
+
+        for _ in range(_LOAD_ATTEMPTS):
+            with self._cond:
+                self._cond.wait_for(lambda: self._epoch % 2 == 0)
+                epoch = self._epoch
+
+            loaded = self._read_backend(session_id)
+
+            with self._cond:
+                if self._epoch == epoch:
+                    self._restore(session_id, *loaded)
+                    return
+
+        with self._write_lock:
+            loaded = self._read_backend(session_id)
+            with self._cond:
+                self._restore(session_id, *loaded)
+
+    def _read_backend(
+        self,
+        session_id: str,
+    ) -> tuple[Mapping[str, Any] | None, EventLogSummary | None, list[EventRecord]]:
+        snapshot = self.backend.get_snapshot(session_id)
+        summary = self.backend.get_event_summary(session_id)
+        records = (
+            list(self.backend.iter_events(session_id, self.front.max_events))
+            if summary
+            else []
+        )
+        return snapshot, summary, records
+
+    def _restore(
+        self,
+        session_id: str,
+        snapshot: Mapping[str, Any] | None,
+        summary: EventLogSummary | None,
+        records: list[EventRecord],
+    ) -> None:
+        # 调用方已持有 self._cond
+        if self.front.contains(session_id):
+            return
+
+        batches = [self._pending] if self._inflight is None else [self._inflight, self._pending]
+        pending_snapshot = None
+        pending_events: list[EventRecord] = []
+        for batch in batches:
+            pending_snapshot = batch.snapshots.get(session_id, pending_snapshot)
+            pending_events.extend(record for sid, record in batch.events if sid == session_id)
+
+        if pending_events:
+            summary = summary or EventLogSummary()
+            for record in pending_events:
+                summary = summary.fold(record)
+            records.extend(pending_events)
+
+        if summary is not None:
+            self.front.restore_events(session_id, records, summary)
+
+        if pending_snapshot is not None:
+            self.front.write_snapshot(**pending_snapshot)
+        elif snapshot is not None:
+            self.front.restore_snapshot(snapshot)
+        elif summary is None:
+            # 后端和队列里都没有：新会话
+            self.front.touch(session_id)
+
+    def _admit_single(self) -> None:
+        # batch() 内的写入已在入口准入
+        if not getattr(self._local, "admitted", False):
+            self._admit()
+
+    def _admit(self) -> None:
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("WriteBehindStateRepository is closed")
+            if len(self._pending) < self._max_pending:
+                return
+
+            self._backpressure_waits += 1
+            self._cond.notify_all()
+
+            # 事件循环线程上不等待：阻塞会拖住同一 worker 上的所有会话
+            wait = 0.0 if _on_event_loop() else self._queue_wait
+            deadline = time.monotonic() + wait
+            while len(self._pending) >= self._max_pending and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._rejected_writes += 1
+                    raise StateBackpressureError(
+                        f"state write queue is full ({len(self._pending)} pending)"
+                    )
+                self._cond.wait(remaining)
+
+            if self._closed:
+                raise RuntimeError("WriteBehindStateRepository is closed")
+
+    # 以下 _notify_if_full / _take_pending 要求调用方已持有 self._cond
+
+    def _notify_if_full(self) -> None:
+        if len(self._pending) >= self._batch_size and not self._retry_at:
+            self._cond.notify_all()
+
+    def _take_pending(self) -> _Pending:
+        pending = self._pending
+        self._pending = _Pending()
+        if len(pending):
+            self._inflight = pending
+        self._cond.notify_all()
+        return pending
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                deadline = max(time.monotonic() + self._flush_interval, self._retry_at)
+                while (
+                    not self._closed
+                    # 退避期间不因队列攒满提前刷
+                    and (self._retry_at or len(self._pending) < self._batch_size)
+                    and (remaining := deadline - time.monotonic()) > 0
+                ):
+                    self._cond.wait(remaining)
+
+                if self._closed:
+                    return
+
+            try:
+                self.flush()
+            except RuntimeError:
+                # 已记录并按退避策略重排
+                pass
+
+    def _write(self, pending: _Pending) -> Exception | None:
+        """
+        返回写入失败的异常（成功时为 None）。
+        """
+        if not len(pending):
+            return None
+
+        try:
+            with self.backend.batch():
+                for item in pending.snapshots.values():
+                    self.backend.write_snapshot(**item)
+                for session_id, record in pending.events:
+                    self.backend.append_event(session_id, record)
+                # 退出 batch() 时提交
+                with self._cond:
+                    self._epoch += 1
+        except Exception as exc:
+            self._end_commit()
+            self._flush_errors += 1
+            self._failures += 1
+            if self._failures > self._max_retries:
+                logger.exception(
+                    "write-behind flush failed %s times, dropping %s items",
+                    self._failures,
+                    len(pending),
+                )
+                self._dropped_items += len(pending)
+                with self._cond:
+                    self._inflight = None
+                self._reset_retry()
+            else:
+                backoff = min(
+                    max(self._flush_interval, 0.01) * 2 ** (self._failures - 1),
+                    _MAX_BACKOFF_SECONDS,
+                )
+                logger.exception("write-behind flush failed, retrying in %.2fs", backoff)
+                self._requeue(pending, time.monotonic() + backoff)
+            return exc
+
+        with self._cond:
+            self._inflight = None
+        self._end_commit()
+        self._reset_retry()
+        self._flushed_batches += 1
+        self._flushed_items += len(pending)
+        return None
+
+    def _end_commit(self) -> None:
+        with self._cond:
+            if self._epoch % 2:
+                self._epoch += 1
+                self._cond.notify_all()
+
+    def _reset_retry(self) -> None:
+        with self._cond:
+            self._failures = 0
+            self._retry_at = 0.0
+
+    def _requeue(self, failed: _Pending, retry_at: float) -> None:
+        with self._cond:
+            current = self._pending
+            merged = _Pending()
+            merged.snapshots = {**failed.snapshots, **current.snapshots}
+            merged.events = failed.events + current.events
+            self._pending = merged
+            self._inflight = None
+            self._retry_at = retry_at
@@ -25,6 +25,16 @@ class InvokeRequest(BaseModel):
     def event_type(self) -> EventType:
         return self.event.type
 
+    @property
+    def session_id(self) -> str | None:
+        """
+        透传字段 session.session_id，不存在时为 None。
+        """
+        session = (self.model_extra or {}).get("session")
+        if isinstance(session, dict) and session.get("session_id"):
+            return str(session["session_id"])
+        return None
+
     def extra_data(self) -> dict[str, Any]:
         """
         返回除 event 外的其余透传字段，
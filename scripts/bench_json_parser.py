@@ -0,0 +1,106 @@
+"""
+JSON 提取基准：旧版逐字符括号计数 vs 增量解析引擎。
+
+uv run python -m scripts.bench_json_parser
+"""
+import json
+import time
+
+from core.llm_exceptions import LLMJsonParseError
+from utils.json_parser import parse_json_object, strip_code_fence
+from utils.json_stream import IncrementalJsonParser
+
+
+def _legacy_extract_first_json_object(text: str) -> str:
+    cleaned = strip_code_fence(text)
+
+    start = cleaned.find("{")
+    if start == -1:
+        raise LLMJsonParseError("No JSON object found in model output")
+
+    depth = 0
+    in_string = False
+    escape = False
+
+    for idx in range(start, len(cleaned)):
+        ch = cleaned[idx]
+
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+            continue
+
+        if ch == '"':
+            in_string = True
+        elif ch == "{":
+            depth += 1
+        elif ch == "}":
+            depth -= 1
+            if depth == 0:
+                return cleaned[start : idx + 1]
+
+    raise LLMJsonParseError("Incomplete JSON object in model output")
+
+
+def _legacy_parse(text: str) -> dict:
+    return json.loads(_legacy_extract_first_json_object(text))
+
+
+def _build_output(history_items: int) -> str:
+    data = {
+        "event": {"type": "end"},
+        "ai_state": {"memory_summary": "玩家穿过雾港，" * 20, "arc_progress": 100},
+        "payload": {
+            "epilogue": {"scene": "灯塔熄灭，潮水退去。" * 30},
+            "key_choices": [
+                {
+                    "event_type": "decision",
+                    "choice_text": f"第 {i} 次选择",
+                    "impact": "这一选择推动了故事走向最终结局。" * 3,
+                }
+                for i in range(history_items)
+            ],
+        },
+        "meta": {"trace_id": "bench"},
+    }
+    return "```json\n" + json.dumps(data, ensure_ascii=False, indent=2) + "\n```\n以上为输出。"
+
+
+def _timeit(fn, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def main() -> None:
+    print(f"{'size':>10} | {'legacy (us)':>12} | {'engine (us)':>12} | {'stream x32 (us)':>15}")
+
+    for items in (5, 50, 500):
+        text = _build_output(items)
+        assert _legacy_parse(text) == parse_json_object(text)
+        repeat = max(20, 20000 // items)
+
+        legacy = _timeit(lambda: _legacy_parse(text), repeat)
+        engine = _timeit(lambda: parse_json_object(text), repeat)
+
+        chunks = [text[i : i + 32] for i in range(0, len(text), 32)]
+
+        def stream() -> None:
+            parser = IncrementalJsonParser(text_paths=(("payload", "epilogue", "scene"),))
+            for chunk in chunks:
+                parser.feed(chunk)
+                if parser.done:
+                    break
+
+        streamed = _timeit(stream, max(5, repeat // 10))
+
+        print(f"{len(text):>10} | {legacy:>12.1f} | {engine:>12.1f} | {streamed:>15.1f}")
+
+
+if __name__ == "__main__":
+    main()
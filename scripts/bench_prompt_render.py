@@ -0,0 +1,106 @@
+"""
+prompt 渲染基准：五个事件的 render_*_prompt，预编译模板 vs 每次 str.format。
+
+uv run python -m scripts.bench_prompt_render
+"""
+import time
+
+from core.config import settings
+from prompts.combat_prompt import COMBAT_INPUT_TEMPLATE, render_combat_prompt
+from prompts.decision_prompt import DECISION_INPUT_TEMPLATE, render_decision_prompt
+from prompts.end_prompt import END_INPUT_TEMPLATE, render_end_prompt
+from prompts.init_prompt import INIT_INPUT_TEMPLATE, render_init_prompt
+from prompts.puzzle_prompt import PUZZLE_INPUT_TEMPLATE, render_puzzle_prompt
+from schemas.combat import CombatRequest
+from schemas.decision import DecisionRequest
+from schemas.end import EndRequest
+from schemas.init import InitRequest
+from schemas.puzzle import PuzzleRequest
+
+
+def _base(event_type: str) -> dict:
+    return {
+        "event": {"type": event_type},
+        "session": {"session_id": "sess_bench", "player_count": 1, "difficulty": "NORMAL"},
+        "time": {"hard_limit_seconds": 300, "elapsed_active_seconds": 120, "remaining_seconds": 180},
+        "seed": {"run_seed": "run_bench"},
+        "constraints": {
+            "language": "zh",
+            "max_chars_scene": 220,
+            "max_chars_option": 14,
+            "forbidden_terms": ["骰子", "扑克"],
+        },
+        "slots": {"tone_bias": "温柔诡秘", "theme_bias": "时间", "npc_bias": "守门人"},
+    }
+
+
+def _loop_request(event_type: str) -> dict:
+    data = _base(event_type)
+    data["payload"] = {"selected_option_id": 1}
+    data["context"] = {
+        "current_scene_summary": "雾气漫过码头，灯塔忽明忽暗。" * 4,
+        "available_options": [
+            {"id": 1, "text": "推门而入"},
+            {"id": 2, "text": "绕到后院"},
+            {"id": 3, "text": "呼唤守门人"},
+        ],
+        "state_flags": {"found_clocktower_clue": True, "lantern": "lit"},
+    }
+    return data
+
+
+def _history(items: int) -> list[dict]:
+    return [
+        {
+            "event_type": "decision",
+            "scene_summary": f"第 {i} 幕：雾港的钟楼再次敲响。",
+            "selected_option_text": "推门而入",
+            "result_summary": "守门人让开了道路。",
+        }
+        for i in range(items)
+    ]
+
+
+def _timeit(fn, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def main() -> None:
+    init_request = InitRequest.model_validate({**_base("init"), "payload": {}, "context": {}})
+    decision_request = DecisionRequest.model_validate(_loop_request("decision"))
+    combat_request = CombatRequest.model_validate(_loop_request("combat"))
+    puzzle_request = PuzzleRequest.model_validate(_loop_request("puzzle"))
+    end_data = _base("end")
+    end_data["context"] = {"current_scene_summary": "灯塔熄灭，潮水退去。"}
+    end_request = EndRequest.model_validate(end_data)
+    history = _history(12)
+
+    allowed = settings.loop_allowed_next_events
+    cases = [
+        ("init", INIT_INPUT_TEMPLATE, lambda: render_init_prompt(init_request)),
+        ("decision", DECISION_INPUT_TEMPLATE, lambda: render_decision_prompt(decision_request)),
+        ("combat", COMBAT_INPUT_TEMPLATE, lambda: render_combat_prompt(combat_request)),
+        ("puzzle", PUZZLE_INPUT_TEMPLATE, lambda: render_puzzle_prompt(puzzle_request)),
+        ("end", END_INPUT_TEMPLATE, lambda: render_end_prompt(end_request, history)),
+    ]
+
+    repeat = 20000
+    print(f"{'event':>10} | {'render (us)':>12} | {'template only (us)':>18} | {'str.format (us)':>15}")
+
+    for name, template, render in cases:
+        values = {field: f"<{field}>" for field in template.fields}
+        values["allowed_next_event_types"] = ", ".join(allowed)
+        assert template.render(**values) == template.text.format(**values)
+
+        full = _timeit(render, repeat)
+        compiled = _timeit(lambda: template.render(**values), repeat)
+        formatted = _timeit(lambda: template.text.format(**values), repeat)
+
+        print(f"{name:>10} | {full:>12.2f} | {compiled:>18.2f} | {formatted:>15.2f}")
+
+
+if __name__ == "__main__":
+    main()
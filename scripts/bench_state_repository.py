@@ -0,0 +1,137 @@
+"""
+会话仓储基准：
+
+- 并发：10k 会话 × 多线程同时读写，对比 stripe=1（等价于全局一把锁）与多 stripe 的吞吐
+- 内存：10k 个 DECISION 快照，对比原始嵌套 dict 与 SessionSnapshot 紧凑编码（tracemalloc）
+
+uv run python -m scripts.bench_state_repository
+"""
+import json
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+from repositories.memory_state_repository import MemoryStateRepository
+from repositories.session_snapshot import SessionSnapshot
+from repositories.state_repository import EventRecord
+from schemas.decision import DecisionResponse
+
+SESSIONS = 10_000
+THREADS = 32
+TURNS_PER_SESSION = 3
+
+AI_STATE = {"title": "雾港", "tone": "悬疑", "memory_summary": "你抵达雾港。", "arc_progress": 1}
+LAST_OUTPUT = {
+    "event": {"type": "decision"},
+    "payload": {"scene": {"summary": "雾气漫过码头，灯塔忽明忽暗。"}},
+    "context": {"current_scene_summary": "雾港码头", "available_options": []},
+}
+
+
+def _play_session(repo: MemoryStateRepository, session_id: str) -> None:
+    for turn in range(TURNS_PER_SESSION):
+        # 每回合：读快照 -> 写快照 -> 追加事件 -> 读历史
+        repo.get_snapshot(session_id)
+        repo.save_snapshot(
+            session_id=session_id,
+            event_type="decision",
+            ai_state=AI_STATE,
+            last_output=LAST_OUTPUT,
+            ttl_seconds=900,
+        )
+        repo.append_event(
+            session_id,
+            EventRecord(
+                event_type="decision",
+                scene_summary="雾港码头",
+                selected_option_text=f"选项{turn}",
+                result_summary="灯塔亮起",
+            ),
+        )
+        list(repo.iter_events(session_id, limit=8))
+
+
+def _run(stripes: int) -> float:
+    repo = MemoryStateRepository(max_sessions=SESSIONS * 2, stripes=stripes)
+    session_ids = [f"sess_{idx}" for idx in range(SESSIONS)]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=THREADS) as pool:
+        list(pool.map(lambda sid: _play_session(repo, sid), session_ids))
+    elapsed = time.perf_counter() - start
+
+    assert repo.stats()["sessions"] == SESSIONS
+    return elapsed
+
+
+def _decision_snapshot_json() -> str:
+    response = DecisionResponse.mock()
+    return json.dumps(
+        {
+            "ai_state": response.ai_state.model_dump(),
+            "last_output": {
+                "event": response.event.model_dump(),
+                "payload": {
+                    "decision": response.payload.decision.model_dump(),
+                    "result": response.payload.result.model_dump(),
+                    "scene": response.payload.scene.model_dump(),
+                    "options": [item.model_dump() for item in response.payload.options],
+                },
+                "context": response.context.model_dump(),
+                "routing": response.routing.model_dump(),
+                "meta": response.meta.model_dump(),
+            },
+        },
+        ensure_ascii=False,
+    )
+
+
+def _measure_memory(compact: bool) -> int:
+    raw = _decision_snapshot_json()
+
+    tracemalloc.start()
+    store = {}
+    for idx in range(SESSIONS):
+        # 每个会话都是新解析出来的对象，与 model_dump() 的结果一样互不共享
+        data = json.loads(raw)
+        data["last_output"]["meta"]["trace_id"] = f"trace_{idx}"
+        session_id = f"sess_{idx}"
+
+        if compact:
+            store[session_id] = SessionSnapshot.encode(
+                session_id=session_id,
+                event_type="decision",
+                ai_state=data["ai_state"],
+                last_output=data["last_output"],
+            )
+        else:
+            store[session_id] = {
+                "session_id": session_id,
+                "event_type": "decision",
+                "ai_state": data["ai_state"],
+                "last_output": data["last_output"],
+            }
+
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return current // SESSIONS
+
+
+def main() -> None:
+    ops = SESSIONS * TURNS_PER_SESSION * 4
+    print(f"sessions={SESSIONS} threads={THREADS} ops={ops}")
+
+    for stripes in (1, 16, 64):
+        elapsed = _run(stripes)
+        print(f"stripes={stripes:<3} {elapsed:.3f}s  {ops / elapsed:,.0f} ops/s")
+
+    plain = _measure_memory(compact=False)
+    compact = _measure_memory(compact=True)
+    print(
+        f"per-session snapshot: dict={plain}B  compact={compact}B  "
+        f"reduction={plain / compact:.1f}x"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+import hashlib
+import math
+from collections import deque
+from functools import lru_cache
+from threading import Lock
+from typing import Any
+
+from core.config import settings
+from core.metrics import registry as metrics
+from services.ai.token_usage import TokenUsage
+
+
+# 预算按此粒度向上取整：分位数小幅波动时 max_tokens 不变，响应缓存的 key 也不变
+_BUDGET_STEP = 64
+
+
+@lru_cache(maxsize=64)
+def template_version(text: str | None) -> str:
+    """
+    prompt 模板的版本号（内容 hash 前 8 位）；模板一改，输出长度分布从头统计。
+    """
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()[:8]
+
+
+class _Samples:
+    __slots__ = ("values", "budget")
+
+    def __init__(self, window: int) -> None:
+        self.values: deque[int] = deque(maxlen=window)
+        # 按当前样本算好的预算，新样本进来时作废
+        self.budget: int | None = None
+
+
+class CompletionBudget:
+    """
+    按 (event_type, template_version) 统计模型输出的 completion token 数，
+    据此给出自适应的 max_tokens：
+
+    - 每个 key 保留最近 window 个样本
+    - 预算 = percentile 分位数 × (1 + margin)，按 _BUDGET_STEP 向上取整，
+      夹在 [floor, ceiling] 之间；ceiling 是调用方原先的固定 max_tokens
+    - 样本不足 min_samples 或未启用时直接用 ceiling
+
+    只记录单次、完整输出的调用；被截断的输出由调用方按 retry_budget 放大预算重试。
+    """
+
+    def __init__(
+        self,
+        *,
+        enabled: bool,
+        percentile: float,
+        margin: float,
+        min_samples: int,
+        window: int,
+        floor: int,
+    ) -> None:
+        self.enabled = enabled
+        self._percentile = min(max(percentile, 0.0), 1.0)
+        self._margin = max(margin, 0.0)
+        self._min_samples = max(min_samples, 1)
+        self._window = max(window, self._min_samples)
+        self._floor = max(floor, 1)
+        self._samples: dict[tuple[str, str], _Samples] = {}
+        self._lock = Lock()
+
+    def max_tokens(self, event_type: str, version: str, *, ceiling: int) -> int:
+        if not self.enabled:
+            return ceiling
+
+        with self._lock:
+            samples = self._samples.get((event_type, version))
+            if samples is None or len(samples.values) < self._min_samples:
+                return ceiling
+            if samples.budget is None:
+                samples.budget = self._compute(samples.values)
+            budget = samples.budget
+
+        return min(max(budget, self._floor), ceiling)
+
+    def retry_budget(self, event_type: str, used: int, *, ceiling: int) -> int | None:
+        """
+        输出被截断后的重试预算：还没到 ceiling 时直接放到 ceiling，否则不再重试。
+        """
+        metrics.inc("llm_output_truncated_total", event_type=event_type)
+        if used >= ceiling:
+            return None
+        metrics.inc("llm_max_tokens_retries_total", event_type=event_type)
+        return ceiling
+
+    def record(self, event_type: str, version: str, usage: TokenUsage | None) -> None:
+        """
+        记录一次模型调用的 completion token 数；缓存命中（calls=0）不计。
+        """
+        if usage is None or usage.calls != 1 or usage.completion_tokens <= 0:
+            return
+
+        with self._lock:
+            samples = self._samples.get((event_type, version))
+            if samples is None:
+                samples = _Samples(self._window)
+                self._samples[(event_type, version)] = samples
+            samples.values.append(usage.completion_tokens)
+            samples.budget = None
+
+    def _compute(self, values: deque[int]) -> int:
+        ordered = sorted(values)
+        rank = max(math.ceil(self._percentile * len(ordered)), 1)
+        target = ordered[rank - 1] * (1 + self._margin)
+        return math.ceil(target / _BUDGET_STEP) * _BUDGET_STEP
+
+    def report(self) -> list[dict[str, Any]]:
+        """
+        各 key 的样本数、中位数、最大值与当前预算（样本不足时为 None）。
+        """
+        report = []
+        with self._lock:
+            for (event_type, version), samples in self._samples.items():
+                ordered = sorted(samples.values)
+                if samples.budget is None and len(ordered) >= self._min_samples:
+                    samples.budget = self._compute(samples.values)
+                report.append(
+                    {
+                        "event_type": event_type,
+                        "template_version": version,
+                        "samples": len(ordered),
+                        "p50": ordered[len(ordered) // 2],
+                        "max": ordered[-1],
+                        "budget": samples.budget,
+                    }
+                )
+        return report
+
+    def clear(self) -> None:
+        with self._lock:
+            self._samples.clear()
+
+
+@lru_cache
+def get_completion_budget() -> CompletionBudget:
+    return CompletionBudget(
+        enabled=settings.llm_adaptive_max_tokens,
+        percentile=settings.llm_max_tokens_percentile,
+        margin=settings.llm_max_tokens_margin,
+        min_samples=settings.llm_max_tokens_min_samples,
+        window=settings.llm_max_tokens_window,
+        floor=settings.llm_max_tokens_floor,
+    )
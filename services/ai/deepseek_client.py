@@ -1,17 +1,167 @@
+import json
+from collections.abc import AsyncIterator
+from functools import lru_cache
+from time import perf_counter
 from typing import Any
 
+import httpx
 from deepseek import DeepSeekClient
 
 from core.deepseek_config import DeepSeekConfig
+from core.logging import get_logger
+from core.metrics import registry as metrics
+from services.ai.response_cache import ResponseCache, get_response_cache
+from services.ai.single_flight import AsyncSingleFlight, SingleFlight
+from services.ai.token_usage import TokenUsage, record_usage
 
 
-class DeepSeekProvider:
+logger = get_logger(__name__)
+
+# 流式调用被提前关闭后，为拿到末尾 usage 最多再读的 SSE 行数
+_STREAM_DRAIN_MAX_LINES = 16
+
+
+class _DeepSeekProviderBase:
+    """
+    同步 / 异步 provider 共用的消息构建、响应解析与响应缓存。
+
+    只有 temperature=0 的调用会走缓存：同一份 prompt 的输出
+    本身就是确定的，重放 / 重试无需再次请求模型。
+    provider 只读缓存；模型输出要经调用方解析、校验通过后
+    才通过 remember_response 写入，截断 / 非法输出不会被缓存。
+    缓存 key 不含 max_tokens：写入的都是完整输出，自适应预算下
+    较小 max_tokens 的请求也能命中放大预算重试后得到的结果。
+
+    并发中的相同 temperature=0 请求（同一 prompt hash）通过
+    single-flight 合并为一次上游调用；采样调用不合并。
+    """
+
+    config: DeepSeekConfig
+    cache: ResponseCache | None = None
+
+    def _flight_key(
+        self,
+        prompt: str,
+        system_prompt: str | None,
+        temperature: float,
+        max_tokens: int,
+    ) -> str | None:
+        """
+        只合并 temperature=0 的调用；采样调用（init / novel 等）每次都应得到
+        独立的输出，合并会让不同玩家拿到逐字相同的“随机”结果。
+
+        /invoke 的重复回合在到达 provider 之前已被会话排队、回合登记与
+        幂等键挡住，同一 prompt 不会同时进来，这条路径在请求流程里不会触发；
+        保留它作为直接调用 provider 的内部调用方（脚本、smoke_test 等）的兜底。
+        """
+        if temperature != 0:
+            return None
+
+        return ResponseCache.make_key(
+            prompt=prompt,
+            system_prompt=system_prompt,
+            model=self.config.model,
+            max_tokens=max_tokens,
+        )
+
+    def _cache_key(
+        self,
+        prompt: str,
+        system_prompt: str | None,
+        temperature: float,
+    ) -> str | None:
+        if self.cache is None or temperature != 0:
+            return None
+
+        return ResponseCache.make_key(
+            prompt=prompt,
+            system_prompt=system_prompt,
+            model=self.config.model,
+        )
+
+    def remember_response(
+        self,
+        prompt: str,
+        text: str,
+        *,
+        system_prompt: str | None = None,
+        temperature: float = 0.7,
+    ) -> None:
+        """
+        把一次已确认可用的输出写入缓存（调用方解析、校验通过后回填）。
+        """
+        key = self._cache_key(prompt, system_prompt, temperature)
+        if key is not None:
+            self.cache.set(key, text)
+
+    def _record_upstream(self, mode: str, start: float, outcome: str) -> None:
+        """
+        上游调用指标：每次尝试（含重试）计一次。
+        """
+        metrics.inc("deepseek_requests_total", mode=mode, outcome=outcome)
+        metrics.observe("deepseek_request_seconds", perf_counter() - start, mode=mode)
+
+    def _record_usage(self, response: Any) -> None:
+        """
+        把响应里的 usage 上报给当前回合的用量收集器。
+        """
+        if isinstance(response, dict):
+            usage = response.get("usage")
+        else:
+            usage = getattr(response, "usage", None)
+        record_usage(TokenUsage.from_response(usage))
+
+    def _build_messages(
+        self,
+        prompt: str,
+        system_prompt: str | None = None,
+    ) -> list[dict[str, str]]:
+        messages: list[dict[str, str]] = []
+
+        if system_prompt:
+            messages.append({"role": "system", "content": system_prompt})
+
+        messages.append({"role": "user", "content": prompt})
+        return messages
+
+    def _extract_text(self, response: Any) -> str:
+        if response is None:
+            raise RuntimeError("DeepSeek response is empty")
+
+        if isinstance(response, dict):
+            try:
+                content = response["choices"][0]["message"]["content"]
+                if content is None:
+                    raise RuntimeError("DeepSeek response content is empty")
+                return str(content).strip()
+            except Exception:
+                return str(response)
+
+        choices = getattr(response, "choices", None)
+        if choices:
+            first_choice = choices[0]
+            message = getattr(first_choice, "message", None)
+            if message is not None:
+                content = getattr(message, "content", None)
+                if content is not None:
+                    return str(content).strip()
+
+        return str(response).strip()
+
+
+class DeepSeekProvider(_DeepSeekProviderBase):
     """
     DeepSeek 官方 SDK 最小封装层。
     """
 
-    def __init__(self, config: DeepSeekConfig | None = None) -> None:
+    def __init__(
+        self,
+        config: DeepSeekConfig | None = None,
+        cache: ResponseCache | None = None,
+    ) -> None:
         self.config = config or DeepSeekConfig.from_env()
+        self.cache = cache
+        self._flights = SingleFlight()
         self.client = DeepSeekClient(
             api_key=self.config.api_key,
             base_url=self.config.base_url,
@@ -25,16 +175,33 @@ class DeepSeekProvider:
         temperature: float = 0.7,
         max_tokens: int = 600,
     ) -> str:
-        messages: list[dict[str, str]] = []
+        cache_key = self._cache_key(prompt, system_prompt, temperature)
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached
 
-        if system_prompt:
-            messages.append({"role": "system", "content": system_prompt})
+        def _call() -> str:
+            return self._request(prompt, system_prompt, temperature, max_tokens)
 
-        messages.append({"role": "user", "content": prompt})
+        flight_key = self._flight_key(prompt, system_prompt, temperature, max_tokens)
+        if flight_key is None:
+            return _call()
+        return self._flights.do(flight_key, _call)
+
+    def _request(
+        self,
+        prompt: str,
+        system_prompt: str | None,
+        temperature: float,
+        max_tokens: int,
+    ) -> str:
+        messages = self._build_messages(prompt, system_prompt)
 
         last_error: Exception | None = None
 
         for attempt in range(2):
+            start = perf_counter()
             try:
                 response = self.client.chat_completion(
                     messages=messages,
@@ -42,8 +209,12 @@ class DeepSeekProvider:
                     temperature=temperature,
                     max_tokens=max_tokens,
                 )
-                return self._extract_text(response)
+                text = self._extract_text(response)
+                self._record_upstream("sync", start, "ok")
+                self._record_usage(response)
+                return text
             except Exception as exc:
+                self._record_upstream("sync", start, "error")
                 last_error = exc
                 if attempt == 1:
                     raise
@@ -53,38 +224,252 @@ class DeepSeekProvider:
 
         raise RuntimeError("DeepSeek request failed unexpectedly")
 
-    def _extract_text(self, response: Any) -> str:
-        if response is None:
-            raise RuntimeError("DeepSeek response is empty")
+    def smoke_test(self) -> str:
+        return self.complete_prompt(
+            "请只回复：deepseek connected",
+            temperature=0,
+            max_tokens=32,
+        )
 
-        if isinstance(response, dict):
+
+class AsyncDeepSeekProvider(_DeepSeekProviderBase):
+    """
+    基于 httpx.AsyncClient 的异步 DeepSeek 封装层。
+
+    - 直接调用 OpenAI 兼容的 /chat/completions 接口
+    - 进程内所有调用方共享同一个 keep-alive 连接池
+    - 连接池大小 / 超时 / HTTP2 开关均来自 DeepSeekConfig
+    """
+
+    def __init__(
+        self,
+        config: DeepSeekConfig | None = None,
+        cache: ResponseCache | None = None,
+    ) -> None:
+        self.config = config or DeepSeekConfig.from_env()
+        self.cache = cache
+        self._flights = AsyncSingleFlight()
+        self._client: httpx.AsyncClient | None = None
+
+    def _http2_enabled(self) -> bool:
+        if not self.config.http2:
+            return False
+
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            logger.warning("DEEPSEEK_HTTP2 is on but 'h2' is not installed, using HTTP/1.1")
+            return False
+
+        return True
+
+    def _get_client(self) -> httpx.AsyncClient:
+        """
+        懒加载共享客户端，保证在事件循环内创建。
+        """
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.config.base_url,
+                headers={"Authorization": f"Bearer {self.config.api_key}"},
+                timeout=httpx.Timeout(
+                    self.config.timeout,
+                    connect=self.config.connect_timeout,
+                ),
+                limits=httpx.Limits(
+                    max_connections=self.config.max_connections,
+                    max_keepalive_connections=self.config.max_keepalive_connections,
+                    keepalive_expiry=self.config.keepalive_expiry,
+                ),
+                http2=self._http2_enabled(),
+            )
+        return self._client
+
+    async def complete_prompt(
+        self,
+        prompt: str,
+        *,
+        system_prompt: str | None = None,
+        temperature: float = 0.7,
+        max_tokens: int = 600,
+    ) -> str:
+        cache_key = self._cache_key(prompt, system_prompt, temperature)
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        async def _call() -> str:
+            return await self._request(prompt, system_prompt, temperature, max_tokens)
+
+        flight_key = self._flight_key(prompt, system_prompt, temperature, max_tokens)
+        if flight_key is None:
+            return await _call()
+        return await self._flights.do(flight_key, _call)
+
+    async def _request(
+        self,
+        prompt: str,
+        system_prompt: str | None,
+        temperature: float,
+        max_tokens: int,
+    ) -> str:
+        body = {
+            "model": self.config.model,
+            "messages": self._build_messages(prompt, system_prompt),
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+        }
+
+        last_error: Exception | None = None
+
+        for attempt in range(2):
+            start = perf_counter()
             try:
-                content = response["choices"][0]["message"]["content"]
-                if content is None:
-                    raise RuntimeError("DeepSeek response content is empty")
-                return str(content).strip()
-            except Exception:
-                return str(response)
+                response = await self._get_client().post("/chat/completions", json=body)
+                response.raise_for_status()
+                data = response.json()
+                text = self._extract_text(data)
+                self._record_upstream("async", start, "ok")
+                self._record_usage(data)
+                return text
+            except Exception as exc:
+                self._record_upstream("async", start, "error")
+                last_error = exc
+                if attempt == 1:
+                    raise
 
-        choices = getattr(response, "choices", None)
-        if choices:
-            first_choice = choices[0]
-            message = getattr(first_choice, "message", None)
-            if message is not None:
-                content = getattr(message, "content", None)
-                if content is not None:
-                    return str(content).strip()
+        if last_error:
+            raise last_error
 
-        return str(response).strip()
+        raise RuntimeError("DeepSeek request failed unexpectedly")
 
-    def smoke_test(self) -> str:
-        return self.complete_prompt(
+    async def stream_prompt(
+        self,
+        prompt: str,
+        *,
+        system_prompt: str | None = None,
+        temperature: float = 0.7,
+        max_tokens: int = 600,
+    ) -> AsyncIterator[str]:
+        """
+        流式调用，逐块返回模型输出的文本增量。
+
+        已经开始输出后无法安全重放，所以流式调用不做重试。
+        调用方提前结束迭代时，底层连接会随之关闭。
+
+        缓存命中时一次性返回缓存文本；未命中时不自动写入
+        （流可能被提前中断），由调用方确认输出可用后调用 remember_response。
+        """
+        cache_key = self._cache_key(prompt, system_prompt, temperature)
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                yield cached
+                return
+
+        body = {
+            "model": self.config.model,
+            "messages": self._build_messages(prompt, system_prompt),
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "stream": True,
+            # 最后一块（choices 为空）携带本次调用的 usage
+            "stream_options": {"include_usage": True},
+        }
+
+        start = perf_counter()
+        outcome = "error"
+        try:
+            async with self._get_client().stream(
+                "POST", "/chat/completions", json=body
+            ) as response:
+                response.raise_for_status()
+
+                lines = response.aiter_lines()
+                try:
+                    async for line in lines:
+                        done, delta = self._read_stream_line(line)
+                        if done:
+                            break
+                        if delta:
+                            yield delta
+                except GeneratorExit:
+                    # 调用方拿到完整 JSON 后提前结束迭代：不再产出文本，
+                    # 但读完剩下的少量行，拿到流末尾的 usage
+                    await self._drain_stream_usage(lines)
+                    raise
+            outcome = "ok"
+        except GeneratorExit:
+            # 提前结束不算上游失败
+            outcome = "ok"
+            raise
+        finally:
+            self._record_upstream("stream", start, outcome)
+
+    def _read_stream_line(self, line: str) -> tuple[bool, str | None]:
+        """
+        解析一行 SSE：返回 (是否结束, 文本增量)；带 usage 的块顺带上报用量。
+        """
+        if not line.startswith("data:"):
+            return False, None
+
+        data = line[5:].strip()
+        if data == "[DONE]":
+            return True, None
+
+        chunk = json.loads(data)
+        if chunk.get("usage"):
+            self._record_usage(chunk)
+
+        choices = chunk.get("choices") or []
+        if not choices:
+            return False, None
+        return False, (choices[0].get("delta") or {}).get("content")
+
+    async def _drain_stream_usage(self, lines: AsyncIterator[str]) -> None:
+        """
+        最多再读 _STREAM_DRAIN_MAX_LINES 行等待 usage 块；模型还在继续输出时
+        放弃统计，直接断开，避免为记账拖长响应。
+        """
+        try:
+            read = 0
+            async for line in lines:
+                done, _ = self._read_stream_line(line)
+                read += 1
+                if done or read >= _STREAM_DRAIN_MAX_LINES:
+                    return
+        except Exception:
+            logger.debug("failed to drain stream usage", exc_info=True)
+
+    async def aclose(self) -> None:
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+
+    async def smoke_test(self) -> str:
+        return await self.complete_prompt(
             "请只回复：deepseek connected",
             temperature=0,
             max_tokens=32,
         )
 
 
+@lru_cache
+def get_deepseek_provider() -> DeepSeekProvider:
+    """
+    进程内共享的同步 provider（复用同一个 SDK 客户端）。
+    """
+    return DeepSeekProvider(cache=get_response_cache())
+
+
+@lru_cache
+def get_async_deepseek_provider() -> AsyncDeepSeekProvider:
+    """
+    进程内共享的异步 provider（复用同一个 httpx 连接池）。
+    """
+    return AsyncDeepSeekProvider(cache=get_response_cache())
+
+
 if __name__ == "__main__":
     provider = DeepSeekProvider()
-    print(provider.smoke_test())
\ No newline at end of file
+    print(provider.smoke_test())
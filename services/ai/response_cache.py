@@ -0,0 +1,254 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from functools import lru_cache
+from pathlib import Path
+from threading import Lock
+from typing import Any
+
+from core.config import settings
+
+
+class CacheBackend(ABC):
+    """
+    响应缓存存储接口。
+
+    当前实现：
+    - MemoryCacheBackend：进程内 LRU + TTL
+    - DiskCacheBackend：目录文件存储，可跨进程 / 重启复用
+    """
+
+    @abstractmethod
+    def get(self, key: str) -> str | None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def set(self, key: str, value: str) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def size(self) -> int:
+        raise NotImplementedError
+
+    @abstractmethod
+    def clear(self) -> None:
+        raise NotImplementedError
+
+
+class MemoryCacheBackend(CacheBackend):
+    def __init__(self, max_entries: int, ttl_seconds: float) -> None:
+        self.max_entries = max(max_entries, 1)
+        self.ttl_seconds = ttl_seconds
+        self._store: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: str) -> str | None:
+        now = time.monotonic()
+        with self._lock:
+            item = self._store.get(key)
+            if item is None:
+                return None
+
+            expires_at, value = item
+            if expires_at <= now:
+                del self._store[key]
+                return None
+
+            self._store.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str) -> None:
+        expires_at = time.monotonic() + self.ttl_seconds
+        with self._lock:
+            self._store[key] = (expires_at, value)
+            self._store.move_to_end(key)
+            while len(self._store) > self.max_entries:
+                self._store.popitem(last=False)
+
+    def size(self) -> int:
+        return len(self._store)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._store.clear()
+
+
+class DiskCacheBackend(CacheBackend):
+    """
+    每个 key 一个文件：<root>/<key[:2]>/<key>.json
+
+    - TTL 以文件写入时间为准
+    - 命中时刷新 mtime，超出 max_entries 时按 mtime 淘汰最旧的文件（近似 LRU）
+    - 写入走临时文件 + os.replace，多进程并发写也不会读到半个文件
+    """
+
+    def __init__(self, root: str | Path, max_entries: int, ttl_seconds: float) -> None:
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max(max_entries, 1)
+        self.ttl_seconds = ttl_seconds
+        self._lock = Lock()
+        self._count = sum(1 for _ in self.root.glob("*/*.json"))
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> str | None:
+        path = self._path(key)
+        try:
+            with path.open("r", encoding="utf-8") as fp:
+                item = json.load(fp)
+        except (OSError, ValueError):
+            return None
+
+        if item.get("created_at", 0) + self.ttl_seconds <= time.time():
+            self._remove(path)
+            return None
+
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return item.get("value")
+
+    def set(self, key: str, value: str) -> None:
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        is_new = not path.exists()
+
+        # 每次写入独占一个临时文件，同进程多线程写同一个 key 也不会互相覆盖
+        with tempfile.NamedTemporaryFile(
+            "w",
+            encoding="utf-8",
+            dir=path.parent,
+            prefix=f"{key}.",
+            suffix=".tmp",
+            delete=False,
+        ) as fp:
+            tmp_path = fp.name
+            try:
+                json.dump({"created_at": time.time(), "value": value}, fp, ensure_ascii=False)
+            except BaseException:
+                fp.close()
+                os.unlink(tmp_path)
+                raise
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            if is_new:
+                self._count += 1
+            if self._count > self.max_entries:
+                self._prune()
+
+    def _prune(self) -> None:
+        # 调用方已持有 self._lock
+        files = sorted(self.root.glob("*/*.json"), key=lambda p: p.stat().st_mtime)
+        self._count = len(files)
+        for path in files[: max(self._count - self.max_entries, 0)]:
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            self._count -= 1
+
+    def _remove(self, path: Path) -> None:
+        try:
+            path.unlink()
+        except OSError:
+            return
+        with self._lock:
+            self._count = max(self._count - 1, 0)
+
+    def size(self) -> int:
+        return self._count
+
+    def clear(self) -> None:
+        for path in self.root.glob("*/*.json"):
+            self._remove(path)
+
+
+class ResponseCache:
+    """
+    temperature=0 调用的确定性响应缓存。
+
+    key = sha256(system_prompt, prompt, model)，
+    同一份渲染后的 prompt 在 TTL 内直接复用上次的模型输出。
+    只缓存校验通过的完整输出，与当次 max_tokens 无关，所以不进 key；
+    single-flight 合并的是尚未完成的调用，会带上 max_tokens。
+    """
+
+    def __init__(self, backend: CacheBackend) -> None:
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(
+        *,
+        prompt: str,
+        system_prompt: str | None,
+        model: str,
+        max_tokens: int | None = None,
+    ) -> str:
+        parts = [system_prompt or "", prompt, model]
+        if max_tokens is not None:
+            parts.append(str(max_tokens))
+
+        digest = hashlib.sha256()
+        for part in parts:
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\x00")
+        return digest.hexdigest()
+
+    def get(self, key: str) -> str | None:
+        value = self.backend.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        if value and value.strip():
+            self.backend.set(key, value)
+
+    def stats(self) -> dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "size": self.backend.size(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+def build_response_cache() -> ResponseCache | None:
+    if not settings.llm_cache_enabled:
+        return None
+
+    if settings.llm_cache_backend.strip().lower() == "disk":
+        backend: CacheBackend = DiskCacheBackend(
+            settings.llm_cache_dir,
+            max_entries=settings.llm_cache_max_entries,
+            ttl_seconds=settings.llm_cache_ttl_seconds,
+        )
+    else:
+        backend = MemoryCacheBackend(
+            max_entries=settings.llm_cache_max_entries,
+            ttl_seconds=settings.llm_cache_ttl_seconds,
+        )
+
+    return ResponseCache(backend)
+
+
+@lru_cache
+def get_response_cache() -> ResponseCache | None:
+    """
+    进程内共享的响应缓存（按配置构建，关闭时为 None）。
+    """
+    return build_response_cache()
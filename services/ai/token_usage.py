@@ -0,0 +1,216 @@
+from collections import OrderedDict
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass
+from functools import lru_cache
+from threading import Lock
+from typing import Any
+
+from core.config import settings
+from core.metrics import registry as metrics
+
+
+@dataclass
+class TokenUsage:
+    """
+    一次（或多次累加的）模型调用的 token 用量。
+
+    cached_tokens 对应 DeepSeek 的 prompt_cache_hit_tokens，
+    是 prompt_tokens 中命中上下文缓存、按缓存价计费的部分。
+    """
+
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0
+    calls: int = 0
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    @property
+    def cache_hit_ratio(self) -> float:
+        """
+        prompt 中命中前缀缓存的比例。
+        """
+        if not self.prompt_tokens:
+            return 0.0
+        return self.cached_tokens / self.prompt_tokens
+
+    @property
+    def cost(self) -> float:
+        """
+        按配置单价（每百万 token）估算的费用。
+        """
+        uncached = max(self.prompt_tokens - self.cached_tokens, 0)
+        return (
+            uncached * settings.llm_price_prompt_per_mtok
+            + self.cached_tokens * settings.llm_price_cached_prompt_per_mtok
+            + self.completion_tokens * settings.llm_price_completion_per_mtok
+        ) / 1_000_000
+
+    @classmethod
+    def from_response(cls, usage: Any) -> "TokenUsage | None":
+        """
+        解析 API 响应里的 usage（dict 或 SDK 对象），缺失时返回 None。
+        """
+        if usage is None:
+            return None
+
+        def read(name: str) -> int:
+            value = usage.get(name) if isinstance(usage, dict) else getattr(usage, name, None)
+            return int(value or 0)
+
+        return cls(
+            prompt_tokens=read("prompt_tokens"),
+            completion_tokens=read("completion_tokens"),
+            cached_tokens=read("prompt_cache_hit_tokens"),
+            calls=1,
+        )
+
+    def add(self, other: "TokenUsage") -> None:
+        self.prompt_tokens += other.prompt_tokens
+        self.completion_tokens += other.completion_tokens
+        self.cached_tokens += other.cached_tokens
+        self.calls += other.calls
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            **asdict(self),
+            "total_tokens": self.total_tokens,
+            "cache_hit_ratio": round(self.cache_hit_ratio, 4),
+            "cost": round(self.cost, 6),
+        }
+
+
+_current_usage: ContextVar[TokenUsage | None] = ContextVar("current_token_usage", default=None)
+
+
+@contextmanager
+def collect_usage() -> Iterator[TokenUsage]:
+    """
+    收集 with 块内（同一上下文里）所有模型调用的用量。
+
+    缓存命中 / single-flight 跟随方没有真正调用模型，不计用量。
+
+    可以嵌套：内层单独统计某一次调用，结束时并入外层。
+    """
+    parent = _current_usage.get()
+    usage = TokenUsage()
+    token = _current_usage.set(usage)
+    try:
+        yield usage
+    finally:
+        try:
+            _current_usage.reset(token)
+        except ValueError:
+            # 异步生成器可能在另一个上下文里被关闭
+            _current_usage.set(parent)
+        if parent is not None:
+            parent.add(usage)
+
+
+def record_usage(usage: TokenUsage | None) -> None:
+    """
+    provider 在一次成功调用后上报用量。
+    """
+    if usage is None:
+        return
+
+    current = _current_usage.get()
+    if current is not None:
+        current.add(usage)
+
+
+class UsageLedger:
+    """
+    进程内 token 用量汇总：
+
+    - 按 event_type / prompt 模板累计（基数固定）
+    - 按会话累计，最多保留 max_sessions 个会话（LRU）
+    - 同时写入 llm_tokens_total 计数器，供 /metrics 抓取
+    """
+
+    def __init__(self, max_sessions: int) -> None:
+        self._max_sessions = max(max_sessions, 1)
+        self._by_event_type: dict[str, TokenUsage] = {}
+        self._by_template: dict[str, TokenUsage] = {}
+        self._by_session: OrderedDict[str, TokenUsage] = OrderedDict()
+        self._lock = Lock()
+
+    def record(
+        self,
+        *,
+        session_id: str | None,
+        event_type: str,
+        template: str,
+        usage: TokenUsage,
+    ) -> None:
+        if not usage.calls:
+            return
+
+        with self._lock:
+            self._by_event_type.setdefault(event_type, TokenUsage()).add(usage)
+            self._by_template.setdefault(template, TokenUsage()).add(usage)
+
+            if session_id:
+                session_usage = self._by_session.get(session_id)
+                if session_usage is None:
+                    session_usage = TokenUsage()
+                    self._by_session[session_id] = session_usage
+                else:
+                    self._by_session.move_to_end(session_id)
+                session_usage.add(usage)
+
+                while len(self._by_session) > self._max_sessions:
+                    self._by_session.popitem(last=False)
+
+        for kind, value in (
+            ("prompt", usage.prompt_tokens),
+            ("completion", usage.completion_tokens),
+            ("cached", usage.cached_tokens),
+        ):
+            metrics.inc("llm_tokens_total", value, event_type=event_type, kind=kind)
+
+    def session(self, session_id: str) -> dict[str, Any] | None:
+        with self._lock:
+            usage = self._by_session.get(session_id)
+            return usage.to_dict() if usage is not None else None
+
+    def report(self, top_sessions: int = 20) -> dict[str, Any]:
+        """
+        汇总报表；模板按 prompt_tokens 降序，便于找出最耗 token 的模板。
+        """
+        with self._lock:
+            by_event_type = {key: value.to_dict() for key, value in self._by_event_type.items()}
+            by_template = sorted(
+                ({"template": key, **value.to_dict()} for key, value in self._by_template.items()),
+                key=lambda item: item["prompt_tokens"],
+                reverse=True,
+            )
+            sessions = sorted(
+                self._by_session.items(),
+                key=lambda item: item[1].total_tokens,
+                reverse=True,
+            )[:top_sessions]
+            top = [{"session_id": key, **value.to_dict()} for key, value in sessions]
+            tracked_sessions = len(self._by_session)
+
+        return {
+            "by_event_type": by_event_type,
+            "by_template": by_template,
+            "top_sessions": top,
+            "tracked_sessions": tracked_sessions,
+        }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._by_event_type.clear()
+            self._by_template.clear()
+            self._by_session.clear()
+
+
+@lru_cache
+def get_usage_ledger() -> UsageLedger:
+    return UsageLedger(max_sessions=settings.session_max_sessions)
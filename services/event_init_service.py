@@ -51,18 +51,24 @@ from core.llm_exceptions import (
     LLMInvokeError,
     LLMJsonParseError,
     LLMSchemaValidationError,
+    LLMTruncatedOutputError,
 )
 from prompts.event_init_prompt import build_dnd_event_init_prompt
 from schemas.event_init import DndEventInitResponse, DndEventInitSlots
-from services.ai.deepseek_client import DeepSeekProvider
+from services.ai.completion_budget import get_completion_budget, template_version
+from services.ai.deepseek_client import get_async_deepseek_provider
+from services.ai.token_usage import collect_usage
 from utils.json_parser import parse_json_object
 
 
 class EventInitService:
+    # 输出预算上限；实际预算按历史输出长度自适应（见 CompletionBudget）
+    max_tokens = 180
+
     def __init__(self) -> None:
-        self.provider = DeepSeekProvider()
+        self.provider = get_async_deepseek_provider()
 
-    def init_dnd_event(self) -> DndEventInitResponse:
+    async def init_dnd_event(self) -> DndEventInitResponse:
         event_pool = settings.event_init_random_events
         if not event_pool:
             raise ValueError("EVENT_INIT_RANDOM_EVENTS is empty")
@@ -70,22 +76,27 @@ class EventInitService:
         target_event = random.choice(event_pool)
         prompt = build_dnd_event_init_prompt(target_event)
 
-        try:
-            raw_text = self.provider.complete_prompt(
-                prompt,
-                temperature=1.3,
-                max_tokens=180,
-            )
-        except Exception as exc:
-            raise LLMInvokeError(f"DeepSeek invoke failed: {exc}") from exc
+        budget = get_completion_budget()
+        # 每个目标事件对应一份 prompt，各自统计输出长度
+        version = template_version(prompt)
+        max_tokens = budget.max_tokens("event_init", version, ceiling=self.max_tokens)
 
-        if not raw_text or not raw_text.strip():
-            raise LLMEmptyResponseError("DeepSeek returned empty content")
+        while True:
+            with collect_usage() as usage:
+                raw_text = await self._complete(prompt, max_tokens)
 
-        try:
-            data = parse_json_object(raw_text)
-        except Exception as exc:
-            raise LLMJsonParseError(f"Failed to parse model JSON: {exc}") from exc
+            try:
+                data = parse_json_object(raw_text)
+                break
+            except LLMTruncatedOutputError as exc:
+                retry = budget.retry_budget("event_init", max_tokens, ceiling=self.max_tokens)
+                if retry is None:
+                    raise LLMJsonParseError(f"Failed to parse model JSON: {exc}") from exc
+                max_tokens = retry
+            except Exception as exc:
+                raise LLMJsonParseError(f"Failed to parse model JSON: {exc}") from exc
+
+        budget.record("event_init", version, usage)
 
         try:
             slots = DndEventInitSlots.model_validate(data)
@@ -97,4 +108,19 @@ class EventInitService:
         return DndEventInitResponse(
             event=target_event,
             slots=slots,
-        )
\ No newline at end of file
+        )
+
+    async def _complete(self, prompt: str, max_tokens: int) -> str:
+        try:
+            raw_text = await self.provider.complete_prompt(
+                prompt,
+                temperature=1.3,
+                max_tokens=max_tokens,
+            )
+        except Exception as exc:
+            raise LLMInvokeError(f"DeepSeek invoke failed: {exc}") from exc
+
+        if not raw_text or not raw_text.strip():
+            raise LLMEmptyResponseError("DeepSeek returned empty content")
+
+        return raw_text
@@ -5,18 +5,24 @@ from core.llm_exceptions import (
     LLMInvokeError,
     LLMJsonParseError,
     LLMSchemaValidationError,
+    LLMTruncatedOutputError,
 )
 from prompts.novel_prompt import NOVEL_PROMPT_TEMPLATE
 from schemas.novel import NovelRequest, NovelResponse
-from services.ai.deepseek_client import DeepSeekProvider
+from services.ai.completion_budget import get_completion_budget, template_version
+from services.ai.deepseek_client import get_async_deepseek_provider
+from services.ai.token_usage import collect_usage
 from utils.json_parser import parse_json_object
 
 
 class EventNovelService:
+    # 输出预算上限；实际预算按历史输出长度自适应（见 CompletionBudget）
+    max_tokens = 1200
+
     def __init__(self) -> None:
-        self.provider = DeepSeekProvider()
+        self.provider = get_async_deepseek_provider()
 
-    def generate(self, request: NovelRequest) -> NovelResponse:
+    async def generate(self, request: NovelRequest) -> NovelResponse:
         prompt = NOVEL_PROMPT_TEMPLATE.format(
             player_name=request.player_name,
             story_overview=request.novel_summary.story_overview,
@@ -24,11 +30,39 @@ class EventNovelService:
             final_outcome=request.novel_summary.final_outcome,
         )
 
+        budget = get_completion_budget()
+        version = template_version(NOVEL_PROMPT_TEMPLATE)
+        max_tokens = budget.max_tokens("novel", version, ceiling=self.max_tokens)
+
+        while True:
+            with collect_usage() as usage:
+                raw = await self._complete(prompt, max_tokens)
+
+            try:
+                data = parse_json_object(raw)
+                break
+            except LLMTruncatedOutputError as e:
+                # 输出被截断：放大预算重试一次，已是上限时按解析失败处理
+                retry = budget.retry_budget("novel", max_tokens, ceiling=self.max_tokens)
+                if retry is None:
+                    raise LLMJsonParseError(f"JSON parse error: {e}") from e
+                max_tokens = retry
+            except Exception as e:
+                raise LLMJsonParseError(f"JSON parse error: {e}") from e
+
+        budget.record("novel", version, usage)
+
         try:
-            raw = self.provider.complete_prompt(
+            return NovelResponse.model_validate(data)
+        except ValidationError as e:
+            raise LLMSchemaValidationError(f"Schema error: {e}") from e
+
+    async def _complete(self, prompt: str, max_tokens: int) -> str:
+        try:
+            raw = await self.provider.complete_prompt(
                 prompt,
                 temperature=1.0,
-                max_tokens=1200,
+                max_tokens=max_tokens,
             )
         except Exception as e:
             raise LLMInvokeError(f"DeepSeek error: {e}") from e
@@ -36,12 +70,4 @@ class EventNovelService:
         if not raw or not raw.strip():
             raise LLMEmptyResponseError("Empty response")
 
-        try:
-            data = parse_json_object(raw)
-        except Exception as e:
-            raise LLMJsonParseError(f"JSON parse error: {e}") from e
-
-        try:
-            return NovelResponse.model_validate(data)
-        except ValidationError as e:
-            raise LLMSchemaValidationError(f"Schema error: {e}") from e
\ No newline at end of file
+        return raw
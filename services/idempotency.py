@@ -0,0 +1,109 @@
+import hashlib
+import json
+from collections.abc import Awaitable, Callable
+from functools import lru_cache
+from typing import Any
+
+from core.config import settings
+from schemas.invoke import InvokeRequest, InvokeResponseData
+from services.ai.response_cache import MemoryCacheBackend
+from services.ai.single_flight import AsyncSingleFlight
+
+
+class IdempotencyStore:
+    """
+    /invoke 回合级幂等结果存储（有界 LRU + TTL）。
+
+    - 同一个 key 已有结果：直接返回存储的 InvokeResponseData，不再调用模型
+    - 同一个 key 正在处理：等待同一次处理的结果
+    - 只存成功结果，失败的回合允许客户端重试
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float) -> None:
+        self._results = MemoryCacheBackend(max_entries=max_entries, ttl_seconds=ttl_seconds)
+        self._flights = AsyncSingleFlight()
+        self.replays = 0
+
+    @staticmethod
+    def build_key(request: InvokeRequest, header_key: str | None = None) -> str | None:
+        """
+        生成幂等 key。
+
+        - 有 Idempotency-Key header：session_id + header
+        - 否则仅对带 selected_option_id 的回合推导：
+          session_id + event type + selected_option_id + context 摘要
+          （context 区分“同一个选项 ID 出现在不同回合”的情况）
+        - 无法确定回合身份时返回 None，不做幂等
+        """
+        extra = request.model_extra or {}
+        session = extra.get("session")
+        session_id = session.get("session_id") if isinstance(session, dict) else None
+
+        if header_key and header_key.strip():
+            parts: list[Any] = ["key", session_id or "", header_key.strip()]
+        else:
+            payload = extra.get("payload")
+            option_id = (
+                payload.get("selected_option_id") if isinstance(payload, dict) else None
+            )
+            if not session_id or option_id is None:
+                return None
+            parts = [
+                "turn",
+                session_id,
+                request.event_type.value,
+                option_id,
+                extra.get("context") or {},
+            ]
+
+        raw = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> InvokeResponseData | None:
+        stored = self._results.get(key)
+        if stored is None:
+            return None
+
+        self.replays += 1
+        result = InvokeResponseData.model_validate_json(stored)
+        result.meta["idempotent_replay"] = True
+        return result
+
+    def put(self, key: str, result: InvokeResponseData) -> None:
+        self._results.set(key, result.model_dump_json())
+
+    async def run(
+        self,
+        key: str,
+        fn: Callable[[], Awaitable[InvokeResponseData]],
+    ) -> InvokeResponseData:
+        stored = self.get(key)
+        if stored is not None:
+            return stored
+
+        async def _call() -> InvokeResponseData:
+            result = await fn()
+            self.put(key, result)
+            return result
+
+        result = await self._flights.do(key, _call)
+        # 并发等待方拿到的是同一个对象，复制一份避免后续修改互相影响
+        return result.model_copy(deep=True)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "size": self._results.size(),
+            "in_flight": self._flights.in_flight,
+            "replays": self.replays,
+        }
+
+
+@lru_cache
+def get_idempotency_store() -> IdempotencyStore:
+    """
+    进程内共享的幂等结果存储。
+    """
+    return IdempotencyStore(
+        max_entries=settings.idempotency_max_entries,
+        ttl_seconds=settings.idempotency_ttl_seconds,
+    )
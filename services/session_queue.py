@@ -0,0 +1,78 @@
+import asyncio
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import Any
+
+from core.config import settings
+from core.exceptions import SessionBusyError
+
+
+class _SessionSlot:
+    __slots__ = ("lock", "pending")
+
+    def __init__(self) -> None:
+        self.lock = asyncio.Lock()
+        # 正在执行 + 排队等待的回合数
+        self.pending = 0
+
+
+class SessionTurnQueue:
+    """
+    按会话串行执行回合的异步队列。
+
+    - 同一 session_id 的回合按到达顺序逐个执行（asyncio.Lock 的等待队列是 FIFO）
+    - 不同会话各自一把锁，互不阻塞，没有全局锁
+    - 排队等待的回合数超过 max_depth 时立即抛 SessionBusyError，
+      不再继续排队，避免连点的客户端堆出一串模型调用
+    - 会话空闲（无执行、无等待）时释放对应的锁，字典不随会话数增长
+
+    只在单个事件循环内使用，不需要额外的线程锁。
+    """
+
+    def __init__(self, max_depth: int) -> None:
+        self._max_depth = max(max_depth, 0)
+        self._slots: dict[str, _SessionSlot] = {}
+        self.rejected = 0
+
+    @asynccontextmanager
+    async def turn(self, session_id: str | None) -> AsyncIterator[None]:
+        """
+        在 with 块内独占该会话；session_id 为空时不做串行化。
+        """
+        if not session_id:
+            yield
+            return
+
+        slot = self._slots.get(session_id)
+        if slot is None:
+            slot = _SessionSlot()
+            self._slots[session_id] = slot
+
+        if slot.pending > self._max_depth:
+            self.rejected += 1
+            raise SessionBusyError(
+                f"session {session_id} has too many queued turns, retry later"
+            )
+
+        slot.pending += 1
+        try:
+            async with slot.lock:
+                yield
+        finally:
+            slot.pending -= 1
+            if slot.pending == 0 and self._slots.get(session_id) is slot:
+                del self._slots[session_id]
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "sessions": len(self._slots),
+            "queued": sum(max(slot.pending - 1, 0) for slot in self._slots.values()),
+            "max_depth": self._max_depth,
+            "rejected": self.rejected,
+        }
+
+
+@lru_cache
+def get_session_queue() -> SessionTurnQueue:
+    return SessionTurnQueue(max_depth=settings.session_queue_max_depth)
@@ -0,0 +1,17 @@
+from fastapi.testclient import TestClient
+
+from main import app
+
+client = TestClient(app)
+
+
+def test_admin_stats_reports_store_usage():
+    response = client.get("/admin/stats")
+    assert response.status_code == 200
+
+    body = response.json()
+    assert body["code"] == 0
+    assert body["data"]["state_repo"]["backend"] == "memory"
+    assert "evicted_lru" in body["data"]["state_repo"]
+    assert "approx_bytes" in body["data"]["state_repo"]
+    assert "replays" in body["data"]["idempotency"]
@@ -0,0 +1,133 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from core.deepseek_config import DeepSeekConfig
+from services.ai.deepseek_client import AsyncDeepSeekProvider
+
+
+CONFIG = DeepSeekConfig(
+    api_key="sk-test",
+    base_url="http://deepseek.test/v1",
+    model="deepseek-chat",
+    timeout=7,
+    connect_timeout=2.5,
+    max_connections=12,
+    max_keepalive_connections=3,
+    keepalive_expiry=9.0,
+)
+
+
+def _ok(content: str) -> httpx.Response:
+    return httpx.Response(
+        200,
+        json={
+            "choices": [{"message": {"content": content}}],
+            "usage": {"prompt_tokens": 3, "completion_tokens": 2},
+        },
+    )
+
+
+def _patch_client(monkeypatch, handler) -> list[dict]:
+    """
+    让 provider 懒加载的 AsyncClient 走 MockTransport，并记录构造参数。
+    """
+    created: list[dict] = []
+    real_client = httpx.AsyncClient
+
+    def _client(**kwargs):
+        created.append(kwargs)
+        return real_client(transport=httpx.MockTransport(handler), **kwargs)
+
+    monkeypatch.setattr("services.ai.deepseek_client.httpx.AsyncClient", _client)
+    return created
+
+
+def test_request_body_headers_and_pool_config(monkeypatch):
+    requests: list[httpx.Request] = []
+
+    def _handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return _ok(" 雾港 ")
+
+    created = _patch_client(monkeypatch, _handler)
+    provider = AsyncDeepSeekProvider(CONFIG)
+
+    text = asyncio.run(
+        provider.complete_prompt("你好", system_prompt="规则", temperature=0, max_tokens=64)
+    )
+
+    assert text == "雾港"
+    assert len(requests) == 1
+    request = requests[0]
+    assert request.method == "POST"
+    assert str(request.url) == "http://deepseek.test/v1/chat/completions"
+    assert request.headers["Authorization"] == "Bearer sk-test"
+    assert json.loads(request.content) == {
+        "model": "deepseek-chat",
+        "messages": [
+            {"role": "system", "content": "规则"},
+            {"role": "user", "content": "你好"},
+        ],
+        "temperature": 0,
+        "max_tokens": 64,
+    }
+
+    assert len(created) == 1
+    assert created[0]["timeout"] == httpx.Timeout(7, connect=2.5)
+    assert created[0]["limits"] == httpx.Limits(
+        max_connections=12,
+        max_keepalive_connections=3,
+        keepalive_expiry=9.0,
+    )
+    assert created[0]["http2"] is False
+
+
+def test_request_retries_once(monkeypatch):
+    statuses = [500, 200]
+    calls: list[int] = []
+
+    def _handler(request: httpx.Request) -> httpx.Response:
+        status = statuses[len(calls)]
+        calls.append(status)
+        return _ok("ok") if status == 200 else httpx.Response(status)
+
+    _patch_client(monkeypatch, _handler)
+    provider = AsyncDeepSeekProvider(CONFIG)
+
+    assert asyncio.run(provider.complete_prompt("p", temperature=0)) == "ok"
+    assert calls == [500, 200]
+
+    # 第二次仍失败时不再重试，原样抛出
+    statuses[:] = [502, 503, 200]
+    calls.clear()
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(provider.complete_prompt("q", temperature=0))
+    assert calls == [502, 503]
+
+
+def test_aclose_releases_lazy_client(monkeypatch):
+    created = _patch_client(monkeypatch, lambda request: _ok("ok"))
+    provider = AsyncDeepSeekProvider(CONFIG)
+    assert provider._client is None
+
+    async def _run():
+        await provider.complete_prompt("p", temperature=0)
+        client = provider._client
+        await provider.complete_prompt("q", temperature=0)
+        # 多次调用共用同一个客户端
+        assert provider._client is client
+        await provider.aclose()
+        return client
+
+    client = asyncio.run(_run())
+
+    assert client.is_closed
+    assert provider._client is None
+    assert len(created) == 1
+
+    asyncio.run(provider.complete_prompt("r", temperature=0))
+    assert len(created) == 2
+    asyncio.run(provider.aclose())
@@ -0,0 +1,74 @@
+import json
+
+from fastapi.testclient import TestClient
+
+from main import app
+from prompts.init_prompt import INIT_SYSTEM_PROMPT
+from services.ai.completion_budget import CompletionBudget, get_completion_budget, template_version
+from services.ai.token_usage import TokenUsage, record_usage
+from test.test_invoke_stream import _build_init_request, _valid_init_output
+
+client = TestClient(app)
+
+
+def _usage(completion_tokens: int, calls: int = 1) -> TokenUsage:
+    return TokenUsage(completion_tokens=completion_tokens, calls=calls)
+
+
+def test_budget_uses_percentile_plus_margin_within_bounds():
+    budget = CompletionBudget(
+        enabled=True, percentile=0.9, margin=0.25, min_samples=10, window=100, floor=64
+    )
+
+    for tokens in range(100, 110):
+        assert budget.max_tokens("init", "v1", ceiling=1200) == 1200
+        budget.record("init", "v1", _usage(tokens))
+
+    # p90 = 108，× 1.25 = 135，按 64 取整为 192
+    assert budget.max_tokens("init", "v1", ceiling=1200) == 192
+    assert budget.max_tokens("init", "v1", ceiling=150) == 150
+    # 其他 prompt 版本单独统计
+    assert budget.max_tokens("init", "v2", ceiling=1200) == 1200
+
+    # 缓存命中 / 重试累加的用量不计入样本
+    budget.record("init", "v1", _usage(5000, calls=0))
+    budget.record("init", "v1", _usage(5000, calls=2))
+    assert budget.report()[0]["samples"] == 10
+
+    assert budget.retry_budget("init", 192, ceiling=1200) == 1200
+    assert budget.retry_budget("init", 1200, ceiling=1200) is None
+
+
+def test_truncated_output_retries_with_full_budget(monkeypatch):
+    calls: list[int] = []
+    output = json.dumps(_valid_init_output(), ensure_ascii=False)
+
+    async def fake_complete_prompt(self, prompt: str, **kwargs):
+        calls.append(kwargs["max_tokens"])
+        record_usage(TokenUsage(completion_tokens=100, calls=1))
+        if len(calls) == 1:
+            return output[: len(output) // 2]
+        return output
+
+    monkeypatch.setattr(
+        "services.ai.deepseek_client.AsyncDeepSeekProvider.complete_prompt",
+        fake_complete_prompt,
+    )
+    budget = get_completion_budget()
+    budget.clear()
+    for _ in range(200):
+        budget.record("init", template_version(INIT_SYSTEM_PROMPT), _usage(100))
+
+    body = _build_init_request()
+    body["session"]["session_id"] = "sess_budget_retry"
+    data = client.post("/invoke", json=body).json()
+
+    assert data["code"] == 0
+    assert calls == [128, 1200]
+    assert data["data"]["meta"]["max_tokens"] == 1200
+    assert data["data"]["meta"]["usage"]["calls"] == 2
+
+    report = client.get("/admin/max-tokens").json()["data"]
+    assert report["budgets"][0]["event_type"] == "init"
+    assert report["budgets"][0]["samples"] == 200
+    budget.clear()
@@ -0,0 +1,50 @@
+import asyncio
+
+from events.base import BaseEventHandler
+from events.dispatcher import EventDispatcher
+from events.handlers.decision_handler import DecisionEventHandler
+from events.handlers.init_handler import InitEventHandler
+from events.types import EventType
+from schemas.invoke import EventInfo, InvokeRequest, InvokeResponseData
+
+
+class _SyncOnlyHandler(BaseEventHandler):
+    def handle(self, request: InvokeRequest) -> InvokeResponseData:
+        return InvokeResponseData(
+            event=EventInfo(type=request.event_type),
+            payload={"handled_by": "sync"},
+        )
+
+
+def test_adispatch_falls_back_to_sync_handle():
+    dispatcher = EventDispatcher()
+    dispatcher.register(EventType.DECISION, _SyncOnlyHandler())
+
+    request = InvokeRequest(event=EventInfo(type=EventType.DECISION))
+    result = asyncio.run(dispatcher.adispatch(request))
+
+    assert result.event.type == EventType.DECISION
+    assert result.payload == {"handled_by": "sync"}
+
+
+def test_adispatch_unregistered_event_type():
+    dispatcher = EventDispatcher()
+    request = InvokeRequest(event=EventInfo(type=EventType.PUZZLE))
+
+    try:
+        asyncio.run(dispatcher.adispatch(request))
+    except ValueError as exc:
+        assert "No handler registered" in str(exc)
+    else:
+        raise AssertionError("expected ValueError")
+
+
+def test_register_injects_shared_state_repo():
+    dispatcher = EventDispatcher()
+    init_handler = InitEventHandler()
+    decision_handler = DecisionEventHandler()
+    dispatcher.register(EventType.INIT, init_handler)
+    dispatcher.register(EventType.DECISION, decision_handler)
+
+    assert init_handler.state_repo is dispatcher.state_repo
+    assert decision_handler.state_repo is dispatcher.state_repo
@@ -0,0 +1,57 @@
+import json
+
+from fastapi.testclient import TestClient
+
+from events.types import EventType
+from main import app
+from schemas.invoke import EventInfo, InvokeRequest
+from services.idempotency import IdempotencyStore
+from test.test_invoke_stream import _build_init_request, _valid_init_output
+
+client = TestClient(app)
+
+
+def _turn_request(option_id: int, scene: str) -> InvokeRequest:
+    return InvokeRequest(
+        event=EventInfo(type=EventType.DECISION),
+        session={"session_id": "sess_idem_001"},
+        payload={"selected_option_id": option_id},
+        context={"current_scene_summary": scene},
+    )
+
+
+def test_derived_key_identifies_the_turn():
+    key = IdempotencyStore.build_key(_turn_request(1, "码头"))
+
+    assert key == IdempotencyStore.build_key(_turn_request(1, "码头"))
+    assert key != IdempotencyStore.build_key(_turn_request(2, "码头"))
+    assert key != IdempotencyStore.build_key(_turn_request(1, "灯塔"))
+    assert IdempotencyStore.build_key(InvokeRequest(event=EventInfo(type=EventType.INIT))) is None
+
+
+def test_invoke_replays_stored_result_for_same_key(monkeypatch):
+    calls = []
+
+    async def fake_complete_prompt(self, prompt: str, **kwargs):
+        calls.append(prompt)
+        return json.dumps(_valid_init_output(), ensure_ascii=False)
+
+    monkeypatch.setattr(
+        "services.ai.deepseek_client.AsyncDeepSeekProvider.complete_prompt",
+        fake_complete_prompt,
+    )
+
+    body = _build_init_request()
+    body["session"]["session_id"] = "sess_idem_replay"
+    headers = {"Idempotency-Key": "turn-0001"}
+
+    first = client.post("/invoke", json=body, headers=headers).json()
+    second = client.post("/invoke", json=body, headers=headers).json()
+
+    assert first["code"] == 0
+    assert second["code"] == 0
+    assert len(calls) == 1
+    assert second["data"]["payload"] == first["data"]["payload"]
+    assert second["data"]["meta"]["trace_id"] == first["data"]["meta"]["trace_id"]
+    assert second["data"]["meta"]["idempotent_replay"] is True
+    assert "idempotent_replay" not in first["data"]["meta"]
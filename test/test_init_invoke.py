@@ -1,7 +1,7 @@
 from fastapi.testclient import TestClient
 
 from main import app
-from events.handlers.init_handler import InitEventHandler
+from api.invoke import dispatcher
 
 client = TestClient(app)
 
@@ -86,11 +86,11 @@ def _valid_init_output_json() -> str:
 
 
 def test_init_success(monkeypatch):
-    def fake_complete_prompt(self, prompt: str, **kwargs) -> str:
+    async def fake_complete_prompt(self, prompt: str, **kwargs) -> str:
         return _valid_init_output_json()
 
     monkeypatch.setattr(
-        "services.ai.deepseek_client.DeepSeekProvider.complete_prompt",
+        "services.ai.deepseek_client.AsyncDeepSeekProvider.complete_prompt",
         fake_complete_prompt,
     )
 
@@ -121,11 +121,11 @@ def test_init_missing_required_field():
 
 
 def test_init_non_json_model_output(monkeypatch):
-    def fake_complete_prompt(self, prompt: str, **kwargs) -> str:
+    async def fake_complete_prompt(self, prompt: str, **kwargs) -> str:
         return "hello world"
 
     monkeypatch.setattr(
-        "services.ai.deepseek_client.DeepSeekProvider.complete_prompt",
+        "services.ai.deepseek_client.AsyncDeepSeekProvider.complete_prompt",
         fake_complete_prompt,
     )
 
@@ -138,7 +138,7 @@ def test_init_non_json_model_output(monkeypatch):
 
 
 def test_init_invalid_options_length(monkeypatch):
-    def fake_complete_prompt(self, prompt: str, **kwargs) -> str:
+    async def fake_complete_prompt(self, prompt: str, **kwargs) -> str:
         return """
 {
   "event": { "type": "init" },
@@ -178,7 +178,7 @@ def test_init_invalid_options_length(monkeypatch):
 """.strip()
 
     monkeypatch.setattr(
-        "services.ai.deepseek_client.DeepSeekProvider.complete_prompt",
+        "services.ai.deepseek_client.AsyncDeepSeekProvider.complete_prompt",
         fake_complete_prompt,
     )
 
@@ -191,7 +191,7 @@ def test_init_invalid_options_length(monkeypatch):
 
 
 def test_init_invalid_next_event_type(monkeypatch):
-    def fake_complete_prompt(self, prompt: str, **kwargs) -> str:
+    async def fake_complete_prompt(self, prompt: str, **kwargs) -> str:
         return """
 {
   "event": { "type": "init" },
@@ -232,7 +232,7 @@ def test_init_invalid_next_event_type(monkeypatch):
 """.strip()
 
     monkeypatch.setattr(
-        "services.ai.deepseek_client.DeepSeekProvider.complete_prompt",
+        "services.ai.deepseek_client.AsyncDeepSeekProvider.complete_prompt",
         fake_complete_prompt,
     )
 
@@ -245,13 +245,13 @@ def test_init_invalid_next_event_type(monkeypatch):
 
 
 def test_init_state_saved(monkeypatch):
-    InitEventHandler._state_repo._store.clear()
+    dispatcher.state_repo.clear()
 
-    def fake_complete_prompt(self, prompt: str, **kwargs) -> str:
+    async def fake_complete_prompt(self, prompt: str, **kwargs) -> str:
         return _valid_init_output_json()
 
     monkeypatch.setattr(
-        "services.ai.deepseek_client.DeepSeekProvider.complete_prompt",
+        "services.ai.deepseek_client.AsyncDeepSeekProvider.complete_prompt",
         fake_complete_prompt,
     )
 
@@ -264,7 +264,7 @@ def test_init_state_saved(monkeypatch):
     body = response.json()
     assert body["code"] == 0
 
-    snapshot = InitEventHandler._state_repo.get_snapshot(session_id)
+    snapshot = dispatcher.state_repo.get_snapshot(session_id)
     assert snapshot is not None
     assert snapshot["session_id"] == session_id
     assert snapshot["event_type"] == "init"
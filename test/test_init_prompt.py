@@ -1,4 +1,4 @@
-from prompts.init_prompt import render_init_prompt
+from prompts.init_prompt import INIT_SYSTEM_PROMPT, render_init_prompt
 from schemas.init import (
     InitClientContext,
     InitConstraints,
@@ -59,4 +59,15 @@ def test_render_init_prompt_basic():
     assert "run_test_001" in prompt
     assert "NORMAL" in prompt
     assert "zh" in prompt
-    assert "温柔诡秘" in prompt
\ No newline at end of file
+    assert "温柔诡秘" in prompt
+
+
+def test_init_prompt_keeps_request_values_out_of_system_prompt():
+    request = _build_init_request()
+    prompt = render_init_prompt(request)
+
+    assert "run_test_001" not in INIT_SYSTEM_PROMPT
+    assert "{" + "language}" not in INIT_SYSTEM_PROMPT
+    assert '"type": "init"' in INIT_SYSTEM_PROMPT
+    assert prompt.startswith("All outputs must be in zh.")
+    assert "输出示例结构" not in prompt
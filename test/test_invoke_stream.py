@@ -0,0 +1,140 @@
+import json
+
+from fastapi.testclient import TestClient
+
+from main import app
+
+client = TestClient(app)
+
+
+def _build_init_request() -> dict:
+    return {
+        "event": {"type": "init"},
+        "session": {
+            "session_id": "sess_stream_001",
+            "player_count": 1,
+            "difficulty": "NORMAL",
+        },
+        "time": {
+            "hard_limit_seconds": 300,
+            "elapsed_active_seconds": 0,
+            "remaining_seconds": 300,
+        },
+        "seed": {"run_seed": "run_stream_001"},
+        "constraints": {
+            "language": "zh",
+            "max_chars_scene": 220,
+            "max_chars_option": 14,
+            "forbidden_terms": [],
+        },
+        "payload": {},
+        "context": {},
+    }
+
+
+def _valid_init_output() -> dict:
+    options = [{"id": 1, "text": "推门而入"}, {"id": 2, "text": "绕到后院"}]
+    return {
+        "event": {"type": "init"},
+        "ai_state": {
+            "world_seed": "seed",
+            "title": "雾港",
+            "tone": "悬疑",
+            "memory_summary": "你抵达雾港。",
+            "arc_progress": 0,
+        },
+        "payload": {
+            "mainline": {
+                "premise": "雾港失踪案",
+                "player_role": "侦探",
+                "primary_goal": "找到失踪者",
+                "stakes": "雾会吞没一切",
+            },
+            "opening": {"scene": "雾气漫过码头，\n灯塔忽明忽暗。", "npc_line": "你来晚了。"},
+            "start_hint": {"how_to_play_next": "选择一个行动。"},
+            "options": options,
+        },
+        "context": {
+            "current_scene_summary": "雾港码头",
+            "available_options": options,
+            "state_flags": {},
+        },
+        "routing": {"next_event_type": "decision", "should_end": False},
+        "meta": {"trace_id": "t_stream"},
+    }
+
+
+def _parse_frames(text: str) -> list[tuple[str, dict]]:
+    frames = []
+    for block in text.strip().split("\n\n"):
+        lines = block.split("\n")
+        event = lines[0].removeprefix("event: ")
+        data = json.loads(lines[1].removeprefix("data: "))
+        frames.append((event, data))
+    return frames
+
+
+def test_invoke_stream_sends_scene_then_result(monkeypatch):
+    raw = json.dumps(_valid_init_output(), ensure_ascii=False)
+
+    async def fake_stream_prompt(self, prompt: str, **kwargs):
+        for i in range(0, len(raw), 16):
+            yield raw[i : i + 16]
+
+    monkeypatch.setattr(
+        "services.ai.deepseek_client.AsyncDeepSeekProvider.stream_prompt",
+        fake_stream_prompt,
+    )
+
+    response = client.post("/invoke/stream", json=_build_init_request())
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+
+    frames = _parse_frames(response.text)
+    scene_text = "".join(data["delta"] for event, data in frames if event == "scene")
+    assert scene_text == "雾气漫过码头，\n灯塔忽明忽暗。"
+
+    event, data = frames[-1]
+    assert event == "result"
+    assert data["code"] == 0
+    assert data["data"]["payload"]["opening"]["scene"] == scene_text
+    assert data["data"]["routing"]["next_event_type"] == "decision"
+
+
+def test_invoke_stream_reports_errors_as_frame(monkeypatch):
+    async def fake_stream_prompt(self, prompt: str, **kwargs):
+        yield "hello world"
+
+    monkeypatch.setattr(
+        "services.ai.deepseek_client.AsyncDeepSeekProvider.stream_prompt",
+        fake_stream_prompt,
+    )
+
+    response = client.post("/invoke/stream", json=_build_init_request())
+    event, data = _parse_frames(response.text)[-1]
+
+    assert event == "error"
+    assert data["code"] == 1
+    assert "No JSON object found" in data["message"]
+
+
+def test_invoke_stream_stops_reading_after_top_level_object(monkeypatch):
+    raw = json.dumps(_valid_init_output(), ensure_ascii=False)
+    pulled: list[str] = []
+
+    async def fake_stream_prompt(self, prompt: str, **kwargs):
+        for chunk in (raw, "\n尾部多余的解释文字", "更多 token"):
+            pulled.append(chunk)
+            yield chunk
+
+    monkeypatch.setattr(
+        "services.ai.deepseek_client.AsyncDeepSeekProvider.stream_prompt",
+        fake_stream_prompt,
+    )
+
+    response = client.post("/invoke/stream", json=_build_init_request())
+    event, data = _parse_frames(response.text)[-1]
+
+    assert event == "result"
+    assert data["code"] == 0
+    assert pulled == [raw]
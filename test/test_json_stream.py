@@ -0,0 +1,92 @@
+import json
+
+import pytest
+
+from core.llm_exceptions import LLMJsonParseError
+from utils.json_parser import extract_first_json_object, parse_json_object
+from utils.json_stream import IncrementalJsonParser
+
+
+def _sample() -> dict:
+    return {
+        "event": {"type": "decision"},
+        "payload": {
+            "scene": {"summary": "雾气漫过码头，\n灯塔忽明忽暗。", "npc_line": "\"来晚了\""},
+            "options": [{"id": 1, "text": "推门"}, {"id": 2, "text": "后退"}],
+        },
+        "routing": {"next_event_type": "end", "should_end": True},
+        "meta": {"trace_id": "t1", "score": -1.5e3, "extra": None},
+    }
+
+
+def _feed_in_chunks(parser: IncrementalJsonParser, text: str, size: int) -> list:
+    events = []
+    for i in range(0, len(text), size):
+        events.extend(parser.feed(text[i : i + size]))
+    return events
+
+
+@pytest.mark.parametrize("size", [1, 3, 7, 64])
+def test_incremental_parser_matches_json_loads(size):
+    raw = "```json\n" + json.dumps(_sample(), ensure_ascii=False) + "\n```\n解释文字"
+    parser = IncrementalJsonParser()
+
+    events = _feed_in_chunks(parser, raw, size)
+
+    assert parser.done
+    assert parser.close() == _sample()
+    assert [e.kind for e in events] == ["done"]
+
+
+def test_incremental_parser_streams_text_and_completed_values():
+    raw = json.dumps(_sample(), ensure_ascii=False)
+    parser = IncrementalJsonParser(
+        text_paths=(("payload", "scene", "summary"),),
+        value_paths=(("payload", "options"),),
+    )
+
+    events = _feed_in_chunks(parser, raw, 5)
+
+    text_events = [e for e in events if e.kind == "text"]
+    assert len(text_events) > 1
+    assert "".join(e.data for e in text_events) == "雾气漫过码头，\n灯塔忽明忽暗。"
+
+    kinds = [e.kind for e in events]
+    options_index = kinds.index("value")
+    assert events[options_index].data == _sample()["payload"]["options"]
+    assert options_index < kinds.index("done")
+
+
+def test_incremental_parser_decodes_split_unicode_escapes():
+    raw = '{"a": {"b": "\\u96fe\\"\\ud83d\\ude00x"}}'
+    parser = IncrementalJsonParser(text_paths=(("a", "b"),))
+
+    events = _feed_in_chunks(parser, raw, 1)
+
+    assert "".join(e.data for e in events if e.kind == "text") == '雾"😀x'
+    assert parser.close() == {"a": {"b": '雾"😀x'}}
+
+
+def test_incremental_parser_reports_incomplete_and_invalid():
+    parser = IncrementalJsonParser()
+    parser.feed('{"a": [1, 2')
+    assert not parser.done
+    with pytest.raises(LLMJsonParseError, match="Incomplete JSON"):
+        parser.close()
+
+    with pytest.raises(LLMJsonParseError, match="Invalid JSON"):
+        IncrementalJsonParser().feed('{"a": tru3}')
+
+
+def test_parse_json_object_keeps_existing_error_messages():
+    with pytest.raises(LLMJsonParseError, match="No JSON object found"):
+        parse_json_object("hello world")
+    with pytest.raises(LLMJsonParseError, match="Incomplete JSON object"):
+        parse_json_object('{"a": {"b": 1}')
+    with pytest.raises(LLMJsonParseError, match="Invalid JSON"):
+        parse_json_object('{"a": }')
+
+
+def test_extract_first_json_object_ignores_surrounding_text():
+    text = '好的，结果如下：\n{"a": "}{", "b": [1, {"c": 2}]} 以上。{"x": 1}'
+    assert extract_first_json_object(text) == '{"a": "}{", "b": [1, {"c": 2}]}'
@@ -0,0 +1,27 @@
+import logging
+
+from core.logging import get_logger, log_sampled_debug
+
+
+def test_raw_output_is_truncated_at_debug(caplog):
+    logger = get_logger("test.raw_output")
+    caplog.set_level(logging.DEBUG, logger="test.raw_output")
+
+    log_sampled_debug(logger, "INIT LLM raw output", "雾" * 50, sample_rate=1, max_chars=10)
+
+    assert len(caplog.records) == 1
+    message = caplog.records[0].getMessage()
+    assert "雾" * 10 + "...(truncated, 50 chars)" in message
+    assert "雾" * 11 not in message
+
+
+def test_raw_output_skipped_when_not_sampled_or_not_debug(caplog):
+    logger = get_logger("test.raw_output_skip")
+
+    caplog.set_level(logging.INFO, logger="test.raw_output_skip")
+    log_sampled_debug(logger, "raw", "text", sample_rate=1)
+
+    caplog.set_level(logging.DEBUG, logger="test.raw_output_skip")
+    log_sampled_debug(logger, "raw", "text", sample_rate=0)
+
+    assert caplog.records == []
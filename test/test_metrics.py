@@ -0,0 +1,114 @@
+import asyncio
+import json
+import threading
+
+from fastapi.testclient import TestClient
+
+from core.config import settings
+from core.metrics import MetricsRegistry, registry, stage, timed, track_turn
+from events.handlers.init_handler import InitEventHandler
+from main import app
+from repositories.memory_state_repository import MemoryStateRepository
+from schemas.invoke import InvokeRequest
+from test.test_invoke_stream import _build_init_request, _valid_init_output
+
+client = TestClient(app)
+
+
+def test_histogram_buckets_are_cumulative():
+    metrics = MetricsRegistry(buckets=(0.01, 0.1))
+    for value in (0.005, 0.05, 0.05, 5.0):
+        metrics.observe("latency", value, stage="x")
+
+    (item,) = metrics.snapshot()
+    assert item["labels"] == {"stage": "x"}
+    assert item["buckets"] == {"0.01": 1, "0.1": 3, "+Inf": 4}
+    assert item["count"] == 4
+
+
+def test_handler_records_stage_latency(monkeypatch):
+    async def fake_complete_prompt(self, prompt: str, **kwargs):
+        return json.dumps(_valid_init_output(), ensure_ascii=False)
+
+    monkeypatch.setattr(
+        "services.ai.deepseek_client.AsyncDeepSeekProvider.complete_prompt",
+        fake_complete_prompt,
+    )
+    registry.clear()
+
+    handler = InitEventHandler(state_repo=MemoryStateRepository())
+    body = _build_init_request()
+    body["session"]["session_id"] = "sess_metrics"
+    asyncio.run(handler.ahandle(InvokeRequest.model_validate(body)))
+
+    stages = {
+        item["labels"]["stage"]
+        for item in registry.snapshot()
+        if item["name"] == "event_stage_seconds" and item["labels"]["event_type"] == "init"
+    }
+    assert stages == {
+        "from_invoke",
+        "normalize_time",
+        "build_prompt",
+        "complete_prompt",
+        "parse_json",
+        "normalize_output",
+        "model_validate",
+        "save_state",
+    }
+    assert any(item["name"] == "event_turn_seconds" for item in registry.snapshot())
+
+
+def test_disabled_metrics_record_nothing(monkeypatch):
+    monkeypatch.setattr(settings, "metrics_enabled", False)
+    registry.clear()
+
+    with track_turn("decision"):
+        with stage("build_prompt"):
+            pass
+        assert timed("parse_json", json.loads, "{}") == {}
+
+    assert registry.snapshot() == []
+
+
+def test_sharded_counter_sums_across_threads():
+    metrics = MetricsRegistry()
+
+    def work():
+        for _ in range(1000):
+            metrics.inc("hits_total", kind="x")
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert metrics.counter("hits_total", kind="x").value == 8000
+    assert 'hits_total{kind="x"} 8000' in metrics.render_prometheus()
+
+
+def test_metrics_endpoint_exposes_prometheus_text(monkeypatch):
+    async def fake_complete_prompt(self, prompt: str, **kwargs):
+        return json.dumps(_valid_init_output(), ensure_ascii=False)
+
+    monkeypatch.setattr(
+        "services.ai.deepseek_client.AsyncDeepSeekProvider.complete_prompt",
+        fake_complete_prompt,
+    )
+
+    body = _build_init_request()
+    body["session"]["session_id"] = "sess_metrics_endpoint"
+    assert client.post("/invoke", json=body).json()["code"] == 0
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+
+    text = response.text
+    assert "# TYPE invoke_requests_total counter" in text
+    assert 'invoke_requests_total{code="0",endpoint="invoke",event_type="init"}' in text
+    assert 'invoke_request_seconds_bucket{endpoint="invoke",event_type="init",le="+Inf"}' in text
+    assert 'invoke_in_flight{endpoint="invoke",event_type="init"} 0' in text
+    assert "session_store_sessions" in text
+    assert "idempotency_replays_total" in text
@@ -0,0 +1,39 @@
+from prompts.budget import estimate_tokens, fit_text
+from prompts.end_prompt import _format_history_events
+from prompts.helpers import format_state_flags
+
+
+def test_estimate_tokens_weights_cjk_higher():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("a" * 10) == 3
+    assert estimate_tokens("雾" * 10) == 6
+    assert estimate_tokens("雾港 fog") == 3
+
+
+def test_history_keeps_newest_events_within_budget():
+    history = [
+        {"event_type": "decision", "scene_summary": f"第{i}幕" + "雾" * 40}
+        for i in range(1, 21)
+    ]
+
+    text = _format_history_events(history, budget_tokens=120)
+    lines = text.split("\n")
+
+    assert estimate_tokens(text) + len(lines) <= 120
+    assert lines[0].startswith("- （更早的")
+    assert lines[-1].startswith("20. ")
+    assert "1. event_type" not in lines[1]
+    assert _format_history_events(history).count("\n") == 19
+
+
+def test_state_flags_and_context_are_trimmed():
+    flags = {f"flag_{i}": "x" * 500 for i in range(20)}
+
+    text = format_state_flags(flags, budget_tokens=100)
+    assert text.split("\n")[0].startswith('- "flag_0"')
+    assert text.endswith("项已省略）")
+    assert estimate_tokens(text) <= 100
+
+    assert format_state_flags(flags).count("\n") == 19
+    assert fit_text("雾" * 1000, 50).endswith("…")
+    assert estimate_tokens(fit_text("雾" * 1000, 50)) <= 50
@@ -0,0 +1,26 @@
+import pytest
+
+from prompts.engine import PromptTemplate
+from prompts.helpers import LOOP_FALLBACK_EVENTS, join_allowed_event_types
+
+
+def test_prompt_template_matches_str_format():
+    text = 'lang={language}\n{{ "id": {id} }}\n{language}!'
+    template = PromptTemplate(text)
+
+    assert template.fields == {"language", "id"}
+    assert template.render(language="zh", id=3) == text.format(language="zh", id=3)
+
+    with pytest.raises(KeyError):
+        template.render(language="zh")
+
+
+def test_prompt_template_rejects_format_spec():
+    with pytest.raises(ValueError):
+        PromptTemplate("{value:>4}")
+
+
+def test_allowed_event_types_follow_raw_setting():
+    assert join_allowed_event_types(None, "Decision, end,end", LOOP_FALLBACK_EVENTS) == "decision, end"
+    assert join_allowed_event_types(None, " , ", LOOP_FALLBACK_EVENTS) == "decision, combat, puzzle, end"
+    assert join_allowed_event_types(["COMBAT"], "decision", LOOP_FALLBACK_EVENTS) == "combat"
@@ -0,0 +1,122 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from core.deepseek_config import DeepSeekConfig
+from services.ai.deepseek_client import AsyncDeepSeekProvider
+from services.ai.response_cache import (
+    DiskCacheBackend,
+    MemoryCacheBackend,
+    ResponseCache,
+)
+
+
+def _key(prompt: str) -> str:
+    return ResponseCache.make_key(
+        prompt=prompt,
+        system_prompt=None,
+        model="deepseek-chat",
+    )
+
+
+def test_memory_backend_lru_eviction():
+    backend = MemoryCacheBackend(max_entries=2, ttl_seconds=60)
+    backend.set("a", "1")
+    backend.set("b", "2")
+    assert backend.get("a") == "1"
+
+    backend.set("c", "3")
+
+    assert backend.get("b") is None
+    assert backend.get("a") == "1"
+    assert backend.get("c") == "3"
+
+
+def test_memory_backend_ttl_expiry():
+    backend = MemoryCacheBackend(max_entries=8, ttl_seconds=0.01)
+    backend.set("a", "1")
+    time.sleep(0.02)
+
+    assert backend.get("a") is None
+    assert backend.size() == 0
+
+
+def test_disk_backend_roundtrip_and_prune(tmp_path):
+    backend = DiskCacheBackend(tmp_path, max_entries=2, ttl_seconds=60)
+    backend.set(_key("a"), "雾港")
+    assert backend.get(_key("a")) == "雾港"
+
+    backend.set(_key("b"), "2")
+    backend.set(_key("c"), "3")
+    assert backend.size() == 2
+
+    reopened = DiskCacheBackend(tmp_path, max_entries=2, ttl_seconds=60)
+    assert reopened.size() == 2
+
+
+def test_disk_backend_concurrent_writes_same_key(tmp_path):
+    backend = DiskCacheBackend(tmp_path, max_entries=8, ttl_seconds=60)
+    key = _key("a")
+    values = [str(i) * 4096 for i in range(10)]
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(lambda value: backend.set(key, value), values * 5))
+
+    assert backend.get(key) in values
+    assert not list(tmp_path.glob("*/*.tmp"))
+
+
+def test_key_depends_on_every_part():
+    base = _key("p")
+    assert base == _key("p")
+    assert base != _key("q")
+    assert base != ResponseCache.make_key(prompt="p", system_prompt="s", model="deepseek-chat")
+    assert base != ResponseCache.make_key(prompt="p", system_prompt=None, model="deepseek-reasoner")
+    # single-flight 的 key 带上 max_tokens
+    assert ResponseCache.make_key(
+        prompt="p", system_prompt=None, model="deepseek-chat", max_tokens=600
+    ) != ResponseCache.make_key(
+        prompt="p", system_prompt=None, model="deepseek-chat", max_tokens=1200
+    )
+
+
+def test_async_provider_serves_temperature_zero_from_cache(monkeypatch):
+    cache = ResponseCache(MemoryCacheBackend(max_entries=8, ttl_seconds=60))
+    provider = AsyncDeepSeekProvider(
+        DeepSeekConfig(api_key="x", base_url="http://test", model="deepseek-chat", timeout=5),
+        cache=cache,
+    )
+    calls = []
+
+    class _FakeResponse:
+        def raise_for_status(self):
+            return None
+
+        def json(self):
+            return {"choices": [{"message": {"content": f"reply-{len(calls)}"}}]}
+
+    class _FakeClient:
+        async def post(self, url, json):
+            calls.append(json)
+            return _FakeResponse()
+
+    monkeypatch.setattr(provider, "_get_client", lambda: _FakeClient())
+
+    async def _run():
+        # 未经调用方确认的输出不写缓存（可能是截断 / 非法 JSON）
+        unchecked = await provider.complete_prompt("p", temperature=0, max_tokens=32)
+        first = await provider.complete_prompt("p", temperature=0, max_tokens=32)
+        provider.remember_response("p", first, temperature=0)
+        # 缓存的是完整输出，换一个 max_tokens 也命中
+        second = await provider.complete_prompt("p", temperature=0, max_tokens=16)
+        warm = await provider.complete_prompt("p", temperature=0.7, max_tokens=32)
+        return unchecked, first, second, warm
+
+    unchecked, first, second, warm = asyncio.run(_run())
+
+    assert unchecked == "reply-1"
+    assert first == second == "reply-2"
+    assert warm == "reply-3"
+    assert len(calls) == 3
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 2
@@ -0,0 +1,63 @@
+from events.handlers.init_handler import InitEventHandler
+from repositories.duckdb_state_repository import DuckDBStateRepository
+from repositories.memory_state_repository import MemoryStateRepository
+from repositories.session_memory import SessionMemory
+from repositories.state_repository import EventRecord
+
+
+def _record(idx: int) -> EventRecord:
+    return EventRecord(
+        event_type="decision",
+        scene_summary=f"场景{idx}",
+        selected_option_text=f"选项{idx}",
+        result_summary=f"第{idx}回合：守门人让开了道路，雾气变得更浓",
+    )
+
+
+def test_memory_block_size_is_bounded():
+    medium = SessionMemory.from_events(_record(i) for i in range(1, 101))
+    long = SessionMemory.from_events(_record(i) for i in range(1, 501))
+
+    assert long.turns == 500
+    assert len(long.chapters) == len(medium.chapters) == 3
+    # 只有未成章的短句数量不同，长度与回合数无关
+    assert len(medium.render("梗概")) <= 900
+    assert len(long.render("梗概")) <= 900
+
+    block = long.render("你抵达雾港。")
+    assert block.startswith("剧情梗概：你抵达雾港。")
+    assert "第1-" in block
+    assert block.endswith("第500回合：守门人让开了道路，雾气变得更浓")
+
+
+def test_repositories_fold_memory_like_a_full_replay(tmp_path):
+    records = [_record(i) for i in range(1, 31)]
+    expected = SessionMemory.from_events(records)
+
+    memory_repo = MemoryStateRepository(max_events=4)
+    duck_repo = DuckDBStateRepository(path=str(tmp_path / "memory.duckdb"))
+    for record in records:
+        memory_repo.append_event("sess_mem", record)
+        duck_repo.append_event("sess_mem", record)
+
+    assert memory_repo.get_event_summary("sess_mem").memory == expected
+    assert duck_repo.get_event_summary("sess_mem").memory == expected
+    duck_repo.close()
+
+
+def test_handler_builds_memory_block_from_snapshot_and_log():
+    repo = MemoryStateRepository()
+    repo.save_snapshot(
+        session_id="sess_block",
+        event_type="decision",
+        ai_state={"memory_summary": "你在雾港追查失踪案。"},
+        last_output={},
+    )
+    for idx in range(1, 6):
+        repo.append_event("sess_block", _record(idx))
+
+    block = InitEventHandler(state_repo=repo)._build_session_memory("sess_block")
+
+    assert block.startswith("上一事件类型：decision\n【会话记忆】\n剧情梗概：你在雾港追查失踪案。")
+    assert "选择「选项5」" in block
+    assert "选择「选项2」" not in block
@@ -0,0 +1,98 @@
+import asyncio
+
+from core.exceptions import SessionBusyError
+from events.base import BaseEventHandler
+from events.dispatcher import EventDispatcher
+from events.types import EventType
+from schemas.invoke import EventInfo, InvokeRequest, InvokeResponseData
+from services.session_queue import SessionTurnQueue
+
+
+def test_turns_of_one_session_run_in_order():
+    queue = SessionTurnQueue(max_depth=4)
+    log: list[str] = []
+
+    async def turn(name: str):
+        async with queue.turn("sess_q"):
+            log.append(f"{name}:start")
+            await asyncio.sleep(0.01)
+            log.append(f"{name}:end")
+
+    async def main():
+        await asyncio.gather(turn("a"), turn("b"), turn("c"))
+
+    asyncio.run(main())
+
+    assert log == ["a:start", "a:end", "b:start", "b:end", "c:start", "c:end"]
+    assert queue.stats()["sessions"] == 0
+
+
+def test_different_sessions_run_in_parallel():
+    queue = SessionTurnQueue(max_depth=0)
+    active = 0
+    peak = 0
+
+    async def turn(session_id: str):
+        nonlocal active, peak
+        async with queue.turn(session_id):
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.01)
+            active -= 1
+
+    async def main():
+        await asyncio.gather(*(turn(f"sess_{i}") for i in range(8)))
+
+    asyncio.run(main())
+    assert peak == 8
+
+
+def test_queue_depth_limit_returns_busy():
+    queue = SessionTurnQueue(max_depth=1)
+
+    async def turn():
+        async with queue.turn("sess_busy"):
+            await asyncio.sleep(0.01)
+
+    async def main():
+        return await asyncio.gather(turn(), turn(), turn(), return_exceptions=True)
+
+    results = asyncio.run(main())
+
+    assert results[:2] == [None, None]
+    assert isinstance(results[2], SessionBusyError)
+    assert results[2].code == 429
+    assert queue.stats()["rejected"] == 1
+
+
+class _SlowHandler(BaseEventHandler):
+    def __init__(self) -> None:
+        self.running = 0
+        self.peak = 0
+
+    def handle(self, request: InvokeRequest) -> InvokeResponseData:
+        raise NotImplementedError
+
+    async def ahandle(self, request: InvokeRequest) -> InvokeResponseData:
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        await asyncio.sleep(0.01)
+        self.running -= 1
+        return InvokeResponseData(event=EventInfo(type=request.event_type))
+
+
+def test_dispatcher_serializes_same_session_turns():
+    handler = _SlowHandler()
+    dispatcher = EventDispatcher(session_queue=SessionTurnQueue(max_depth=4))
+    dispatcher.register(EventType.DECISION, handler)
+
+    request = InvokeRequest(
+        event=EventInfo(type=EventType.DECISION),
+        session={"session_id": "sess_dispatch"},
+    )
+
+    async def main():
+        await asyncio.gather(*(dispatcher.adispatch(request) for _ in range(3)))
+
+    asyncio.run(main())
+    assert handler.peak == 1
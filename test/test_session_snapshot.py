@@ -0,0 +1,57 @@
+from repositories.memory_state_repository import MemoryStateRepository
+from repositories.session_snapshot import SessionSnapshot, decode_blob, encode_blob
+
+
+def _last_output() -> dict:
+    return {
+        "event": {"type": "decision"},
+        "payload": {"scene": {"summary": "浓雾更重了，远处的蒸汽阀门发出尖啸。" * 10}},
+        "context": {"current_scene_summary": "钟楼工坊", "state_flags": {"clue": True}},
+    }
+
+
+def test_blob_roundtrip_small_and_compressed():
+    small = {"arc_progress": 1}
+    large = _last_output()
+
+    assert encode_blob(small)[:1] == b"j"
+    assert encode_blob(large)[:1] == b"z"
+    assert decode_blob(encode_blob(small)) == small
+    assert decode_blob(encode_blob(large)) == large
+
+
+def test_snapshot_behaves_like_a_mapping():
+    snapshot = SessionSnapshot.encode(
+        session_id="sess_snap",
+        event_type="decision",
+        ai_state={"memory_summary": "钟楼线索"},
+        last_output=_last_output(),
+    )
+
+    assert snapshot["session_id"] == "sess_snap"
+    assert snapshot.get("event_type") == "decision"
+    assert snapshot["ai_state"] == {"memory_summary": "钟楼线索"}
+    assert snapshot["last_output"]["context"]["current_scene_summary"] == "钟楼工坊"
+    assert "ai_state" in snapshot
+    assert snapshot.get("missing") is None
+    assert dict(snapshot)["last_output"] == _last_output()
+    assert snapshot.nbytes < len(str(_last_output()).encode("utf-8"))
+
+    # 每次读取都是新解码的 dict，调用方修改不会影响存储
+    snapshot["ai_state"]["memory_summary"] = "changed"
+    assert snapshot["ai_state"]["memory_summary"] == "钟楼线索"
+
+
+def test_memory_repository_stores_compact_snapshots():
+    repo = MemoryStateRepository(stripes=1)
+    repo.save_snapshot(
+        session_id="sess_compact",
+        event_type="decision",
+        ai_state={"arc_progress": 2},
+        last_output=_last_output(),
+    )
+
+    snapshot = repo.get_snapshot("sess_compact")
+    assert isinstance(snapshot, SessionSnapshot)
+    assert snapshot["ai_state"] == {"arc_progress": 2}
+    assert repo.stats()["approx_bytes"] == snapshot.nbytes
@@ -0,0 +1,110 @@
+import asyncio
+import threading
+import time
+
+from core.deepseek_config import DeepSeekConfig
+from services.ai.deepseek_client import AsyncDeepSeekProvider
+from services.ai.single_flight import SingleFlight
+
+
+def test_async_provider_coalesces_identical_in_flight_calls(monkeypatch):
+    provider = AsyncDeepSeekProvider(
+        DeepSeekConfig(api_key="x", base_url="http://test", model="deepseek-chat", timeout=5)
+    )
+    calls = []
+
+    async def _fake_request(prompt, system_prompt, temperature, max_tokens):
+        calls.append(prompt)
+        await asyncio.sleep(0.05)
+        return f"reply:{prompt}"
+
+    monkeypatch.setattr(provider, "_request", _fake_request)
+
+    async def _run():
+        return await asyncio.gather(
+            provider.complete_prompt("same", temperature=0),
+            provider.complete_prompt("same", temperature=0),
+            provider.complete_prompt("other", temperature=0),
+        )
+
+    results = asyncio.run(_run())
+
+    assert results == ["reply:same", "reply:same", "reply:other"]
+    assert sorted(calls) == ["other", "same"]
+    assert provider._flights.in_flight == 0
+
+
+def test_async_provider_does_not_coalesce_sampled_calls(monkeypatch):
+    provider = AsyncDeepSeekProvider(
+        DeepSeekConfig(api_key="x", base_url="http://test", model="deepseek-chat", timeout=5)
+    )
+    calls = []
+
+    async def _fake_request(prompt, system_prompt, temperature, max_tokens):
+        calls.append(prompt)
+        index = len(calls)
+        await asyncio.sleep(0.01)
+        return f"reply:{index}"
+
+    monkeypatch.setattr(provider, "_request", _fake_request)
+
+    async def _run():
+        return await asyncio.gather(
+            provider.complete_prompt("same", temperature=1.3),
+            provider.complete_prompt("same", temperature=1.3),
+        )
+
+    results = asyncio.run(_run())
+
+    assert len(calls) == 2
+    assert results[0] != results[1]
+
+
+def test_async_provider_shares_errors_with_waiters(monkeypatch):
+    provider = AsyncDeepSeekProvider(
+        DeepSeekConfig(api_key="x", base_url="http://test", model="deepseek-chat", timeout=5)
+    )
+    calls = []
+
+    async def _fake_request(prompt, system_prompt, temperature, max_tokens):
+        calls.append(prompt)
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream down")
+
+    monkeypatch.setattr(provider, "_request", _fake_request)
+
+    async def _run():
+        return await asyncio.gather(
+            provider.complete_prompt("p", temperature=0),
+            provider.complete_prompt("p", temperature=0),
+            return_exceptions=True,
+        )
+
+    results = asyncio.run(_run())
+
+    assert all(isinstance(item, RuntimeError) for item in results)
+    assert len(calls) == 1
+
+
+def test_thread_single_flight_runs_once():
+    flights = SingleFlight()
+    calls = []
+    results = []
+
+    def _slow():
+        calls.append(1)
+        time.sleep(0.05)
+        return "ok"
+
+    threads = [
+        threading.Thread(target=lambda: results.append(flights.do("k", _slow)))
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == ["ok"] * 4
+    assert len(calls) == 1
+    assert flights.in_flight == 0
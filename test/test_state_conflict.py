@@ -0,0 +1,92 @@
+import asyncio
+import json
+
+import pytest
+
+from core.exceptions import StateConflictError
+from events.handlers.init_handler import InitEventHandler
+from repositories.duckdb_state_repository import DuckDBStateRepository
+from repositories.memory_state_repository import MemoryStateRepository
+from repositories.state_repository import EventRecord
+from schemas.invoke import InvokeRequest
+from test.test_invoke_stream import _build_init_request, _valid_init_output
+
+
+def _save(repo, expected_version=None, arc_progress=0):
+    repo.save_snapshot(
+        session_id="sess_cas",
+        event_type="decision",
+        ai_state={"arc_progress": arc_progress},
+        last_output={"payload": {}},
+        expected_version=expected_version,
+    )
+
+
+def test_memory_repository_compare_and_swap():
+    repo = MemoryStateRepository()
+    assert repo.get_version("sess_cas") == 0
+
+    _save(repo, expected_version=0)
+    _save(repo, expected_version=1, arc_progress=1)
+    assert repo.get_snapshot("sess_cas")["version"] == 2
+
+    with pytest.raises(StateConflictError):
+        _save(repo, expected_version=1, arc_progress=99)
+
+    # 冲突的写入不生效；不校验版本的写入照常递增
+    assert repo.get_snapshot("sess_cas")["ai_state"] == {"arc_progress": 1}
+    _save(repo)
+    assert repo.get_version("sess_cas") == 3
+
+
+def test_duckdb_conflict_rolls_back_whole_batch():
+    repo = DuckDBStateRepository(":memory:")
+    _save(repo, expected_version=0)
+
+    with pytest.raises(StateConflictError):
+        with repo.batch():
+            _save(repo, expected_version=0, arc_progress=99)
+            repo.append_event("sess_cas", EventRecord(event_type="decision"))
+
+    assert repo.get_version("sess_cas") == 1
+    assert repo.get_snapshot("sess_cas")["ai_state"] == {"arc_progress": 0}
+    assert list(repo.iter_events("sess_cas")) == []
+    repo.close()
+
+
+def test_overlapping_turn_is_rejected_before_llm_call(monkeypatch):
+    calls = []
+
+    async def fake_complete_prompt(self, prompt: str, **kwargs):
+        calls.append(prompt)
+        await asyncio.sleep(0.05)
+        return json.dumps(_valid_init_output(), ensure_ascii=False)
+
+    monkeypatch.setattr(
+        "services.ai.deepseek_client.AsyncDeepSeekProvider.complete_prompt",
+        fake_complete_prompt,
+    )
+
+    handler = InitEventHandler(state_repo=MemoryStateRepository())
+    body = _build_init_request()
+    body["session"]["session_id"] = "sess_overlap"
+    request = InvokeRequest.model_validate(body)
+
+    async def run_both():
+        return await asyncio.gather(
+            handler.ahandle(request),
+            handler.ahandle(request),
+            return_exceptions=True,
+        )
+
+    first, second = asyncio.run(run_both())
+
+    assert first.event.type.value == "init"
+    assert isinstance(second, StateConflictError)
+    assert second.code == 409
+    assert len(calls) == 1
+    assert handler.state_repo.get_version("sess_overlap") == 1
+
+    # 回合结束后登记已释放，下一回合可以继续
+    asyncio.run(handler.ahandle(request))
+    assert handler.state_repo.get_version("sess_overlap") == 2
@@ -0,0 +1,417 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from core.exceptions import StateBackpressureError
+
+from repositories.duckdb_state_repository import DuckDBStateRepository
+from repositories.memory_state_repository import MemoryStateRepository
+from repositories.state_repository import EventRecord
+from repositories.write_behind_state_repository import WriteBehindStateRepository
+
+
+def _record(idx: int, choice: str = "") -> EventRecord:
+    return EventRecord(
+        event_type="decision",
+        scene_summary=f"场景{idx}",
+        selected_option_text=choice,
+        result_summary=f"结果{idx}",
+    )
+
+
+def test_event_log_keeps_order_and_limit():
+    repo = MemoryStateRepository(max_events=8)
+    for idx in range(5):
+        repo.append_event("sess_log", _record(idx))
+
+    events = list(repo.iter_events("sess_log"))
+    assert [item.scene_summary for item in events] == [f"场景{i}" for i in range(5)]
+
+    latest = list(repo.iter_events("sess_log", limit=2))
+    assert [item.scene_summary for item in latest] == ["场景3", "场景4"]
+
+    assert list(repo.iter_events("missing")) == []
+
+
+def test_event_log_ring_buffer_drops_oldest():
+    repo = MemoryStateRepository(max_events=3)
+    for idx in range(5):
+        repo.append_event("sess_ring", _record(idx))
+
+    events = list(repo.iter_events("sess_ring"))
+    assert [item.scene_summary for item in events] == ["场景2", "场景3", "场景4"]
+
+    summary = repo.get_event_summary("sess_ring")
+    assert summary.total_events == 5
+    assert summary.event_counts == {"decision": 5}
+
+
+def test_event_summary_is_maintained_on_append():
+    repo = MemoryStateRepository(max_events=8)
+    repo.append_event("sess_sum", EventRecord(event_type="init", scene_summary="雾港码头"))
+    repo.append_event("sess_sum", _record(1, choice="推门而入"))
+
+    summary = repo.get_event_summary("sess_sum")
+    assert summary.total_events == 2
+    assert summary.event_counts == {"init": 1, "decision": 1}
+    assert summary.choice_count == 1
+    assert summary.journey == "雾港码头；场景1，你做出了“推门而入”这一选择，结果1"
+    assert repo.get_event_summary("missing") is None
+
+
+def test_duckdb_repository_roundtrip(tmp_path):
+    path = str(tmp_path / "state.duckdb")
+    repo = DuckDBStateRepository(path, max_events=8)
+
+    with repo.batch():
+        repo.save_snapshot(
+            session_id="sess_db",
+            event_type="init",
+            ai_state={"arc_progress": 0},
+            last_output={"context": {"current_scene_summary": "雾港码头"}},
+        )
+        repo.append_event("sess_db", EventRecord(event_type="init", scene_summary="雾港码头"))
+        # 批次提交前不可见
+        assert repo.get_snapshot("sess_db") is None
+
+    repo.append_event("sess_db", _record(1, choice="推门而入"))
+    repo.close()
+
+    reopened = DuckDBStateRepository(path, max_events=8)
+    snapshot = reopened.get_snapshot("sess_db")
+    assert snapshot["event_type"] == "init"
+    assert snapshot["ai_state"] == {"arc_progress": 0}
+    assert snapshot["last_output"]["context"]["current_scene_summary"] == "雾港码头"
+
+    events = list(reopened.iter_events("sess_db"))
+    assert [item.event_type for item in events] == ["init", "decision"]
+
+    summary = reopened.get_event_summary("sess_db")
+    assert summary.total_events == 2
+    assert summary.choice_count == 1
+    assert summary.journey == "雾港码头；场景1，你做出了“推门而入”这一选择，结果1"
+    reopened.close()
+
+
+
+def test_duckdb_and_memory_summaries_match_beyond_max_events():
+    memory_repo = MemoryStateRepository(max_events=4, stripes=1)
+    duck_repo = DuckDBStateRepository(":memory:", max_events=4)
+
+    for idx in range(15):
+        record = _record(idx, choice="推门而入" if idx % 2 else "")
+        memory_repo.append_event("sess_parity", record)
+        with duck_repo.batch():
+            duck_repo.append_event("sess_parity", record)
+
+    expected = memory_repo.get_event_summary("sess_parity")
+    assert expected.total_events == 15
+    assert expected.memory.turns == 15
+    assert duck_repo.get_event_summary("sess_parity") == expected
+    assert list(duck_repo.iter_events("sess_parity")) == list(
+        memory_repo.iter_events("sess_parity")
+    )
+
+    # 没有摘要行（迁移前写入）的会话从完整日志重放，结果相同
+    with duck_repo.client.writer() as conn:
+        conn.execute("DELETE FROM session_summaries")
+    assert duck_repo.get_event_summary("sess_parity") == expected
+    duck_repo.append_event("sess_parity", _record(15))
+    memory_repo.append_event("sess_parity", _record(15))
+    assert duck_repo.get_event_summary("sess_parity") == memory_repo.get_event_summary(
+        "sess_parity"
+    )
+    duck_repo.close()
+
+
+def test_duckdb_batch_rolls_back_on_error():
+    repo = DuckDBStateRepository(":memory:")
+
+    try:
+        with repo.batch():
+            repo.append_event("sess_err", _record(1))
+            raise RuntimeError("boom")
+    except RuntimeError:
+        pass
+
+    assert list(repo.iter_events("sess_err")) == []
+    assert repo.get_event_summary("sess_err") is None
+    repo.close()
+
+
+def _save(repo: MemoryStateRepository, session_id: str, ttl_seconds: float | None = None):
+    repo.save_snapshot(
+        session_id=session_id,
+        event_type="decision",
+        ai_state={"memory_summary": "雾港" * 10},
+        last_output={"payload": {}},
+        ttl_seconds=ttl_seconds,
+    )
+
+
+def test_memory_repository_evicts_idle_sessions():
+    # 单分片：避免两个会话被哈希到同一分片时触发按容量淘汰
+    repo = MemoryStateRepository(max_sessions=8, stripes=1)
+    _save(repo, "sess_short", ttl_seconds=0.2)
+    repo.append_event("sess_short", _record(1))
+    _save(repo, "sess_long", ttl_seconds=60)
+    time.sleep(0.3)
+
+    assert repo.get_snapshot("sess_short") is None
+    assert list(repo.iter_events("sess_short")) == []
+    assert repo.get_snapshot("sess_long") is not None
+
+    stats = repo.stats()
+    assert stats["sessions"] == 1
+    assert stats["evicted_ttl"] == 1
+
+
+def test_memory_repository_lru_cap_and_byte_accounting():
+    repo = MemoryStateRepository(max_sessions=2, stripes=1)
+    _save(repo, "sess_a")
+    _save(repo, "sess_b")
+    repo.get_snapshot("sess_a")
+    _save(repo, "sess_c")
+
+    assert repo.get_snapshot("sess_b") is None
+    assert repo.get_snapshot("sess_a") is not None
+    assert repo.stats()["evicted_lru"] == 1
+
+    one_session = repo.stats()["approx_bytes"] // 2
+    _save(repo, "sess_a")
+    assert repo.stats()["approx_bytes"] == one_session * 2
+
+    capped = MemoryStateRepository(max_sessions=100, max_bytes=one_session * 3, stripes=1)
+    for idx in range(5):
+        _save(capped, f"sess_{idx}")
+    assert capped.stats()["sessions"] == 3
+    assert capped.stats()["approx_bytes"] <= one_session * 3
+
+
+
+def test_memory_repository_never_evicts_session_being_written():
+    # 每个分片只容纳 1 个会话；同分片的邻居刚被读过（referenced）
+    repo = MemoryStateRepository(max_sessions=4, stripes=4)
+    neighbour = "sess_neighbour"
+    same_stripe = [
+        f"sess_{idx}" for idx in range(200)
+        if repo._stripe(f"sess_{idx}") is repo._stripe(neighbour)
+    ][:2]
+
+    _save(repo, neighbour)
+    repo.get_snapshot(neighbour)
+    _save(repo, same_stripe[0])
+    assert repo.get_snapshot(same_stripe[0]) is not None
+    assert repo.get_snapshot(neighbour) is None
+
+    repo.append_event(same_stripe[1], _record(1))
+    assert [item.event_type for item in repo.iter_events(same_stripe[1])] == ["decision"]
+    assert repo.get_event_summary(same_stripe[1]).total_events == 1
+    assert repo.stats()["sessions"] == 1
+
+
+def test_striped_repository_concurrent_writes_keep_per_session_order():
+    repo = MemoryStateRepository(max_events=64, stripes=8)
+
+    def _worker(worker_id: int) -> None:
+        session_id = f"sess_thread_{worker_id}"
+        for idx in range(20):
+            repo.append_event(session_id, _record(idx))
+            _save(repo, session_id)
+
+    threads = [threading.Thread(target=_worker, args=(i,)) for i in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for worker_id in range(16):
+        events = list(repo.iter_events(f"sess_thread_{worker_id}"))
+        assert [item.scene_summary for item in events] == [f"场景{i}" for i in range(20)]
+
+    assert repo.stats()["sessions"] == 16
+
+
+def test_write_behind_coalesces_and_flushes_on_close(tmp_path):
+    path = str(tmp_path / "wb.duckdb")
+    repo = WriteBehindStateRepository(
+        DuckDBStateRepository(path),
+        flush_interval=60,
+    )
+
+    for idx in range(5):
+        repo.save_snapshot(
+            session_id="sess_wb",
+            event_type="decision",
+            ai_state={"arc_progress": idx},
+            last_output={},
+        )
+        repo.append_event("sess_wb", _record(idx))
+
+    # 读取走内存前端，不等落盘
+    assert repo.get_snapshot("sess_wb")["ai_state"] == {"arc_progress": 4}
+    assert repo.stats()["pending_snapshots"] == 1
+    assert repo.stats()["pending_events"] == 5
+
+    repo.close()
+
+    durable = DuckDBStateRepository(path)
+    assert durable.get_snapshot("sess_wb")["ai_state"] == {"arc_progress": 4}
+    assert [item.scene_summary for item in durable.iter_events("sess_wb")] == [
+        f"场景{i}" for i in range(5)
+    ]
+    durable.close()
+
+
+class _SlowBackend(MemoryStateRepository):
+    def append_event(self, session_id: str, event_record: EventRecord) -> None:
+        time.sleep(0.05)
+        super().append_event(session_id, event_record)
+
+
+def test_write_behind_applies_backpressure():
+    backend = _SlowBackend(stripes=1)
+    repo = WriteBehindStateRepository(backend, batch_size=1, max_pending=2)
+
+    for idx in range(6):
+        repo.append_event("sess_bp", _record(idx))
+
+    assert repo.stats()["backpressure_waits"] > 0
+    repo.close()
+
+    assert [item.scene_summary for item in backend.iter_events("sess_bp")] == [
+        f"场景{i}" for i in range(6)
+    ]
+
+
+class _FailingBackend(MemoryStateRepository):
+    failing = True
+
+    def append_event(self, session_id: str, event_record: EventRecord) -> None:
+        if self.failing:
+            raise RuntimeError("disk full")
+        super().append_event(session_id, event_record)
+
+
+def test_write_behind_rejects_on_event_loop_and_drops_after_retries():
+    backend = _FailingBackend(stripes=1)
+    repo = WriteBehindStateRepository(
+        backend, flush_interval=60, max_pending=1, max_retries=2, queue_wait_seconds=5
+    )
+    repo.append_event("sess_fail", _record(0))
+
+    async def _write_on_loop() -> float:
+        start = time.monotonic()
+        with pytest.raises(StateBackpressureError):
+            with repo.batch():
+                repo.append_event("sess_fail", _record(1))
+        return time.monotonic() - start
+
+    # 事件循环上不等待，队列满时立即拒绝，且被拒绝的回合不写前端
+    assert asyncio.run(_write_on_loop()) < 1
+    assert repo.stats()["rejected_writes"] == 1
+    assert len(list(repo.iter_events("sess_fail"))) == 1
+
+    for _ in range(3):
+        with pytest.raises(RuntimeError):
+            repo.flush()
+
+    stats = repo.stats()
+    assert stats["flush_errors"] == 3
+    assert stats["dropped_items"] == 1
+    assert stats["pending_events"] == 0
+
+    backend.failing = False
+    repo.close()
+
+
+def test_write_behind_backfills_evicted_session_with_matching_versions():
+    backend = DuckDBStateRepository(":memory:", max_events=4)
+    repo = WriteBehindStateRepository(
+        backend, front=MemoryStateRepository(max_events=4), flush_interval=60
+    )
+
+    for idx in range(6):
+        with repo.batch():
+            repo.save_snapshot(
+                session_id="sess_evict",
+                event_type="decision",
+                ai_state={"turn": idx},
+                last_output={},
+                expected_version=repo.get_version("sess_evict"),
+            )
+            repo.append_event("sess_evict", _record(idx))
+        if idx == 3:
+            repo.flush()
+
+    # 前端被清空（淘汰 / 重启），后两回合还在待刷队列里
+    repo.front.clear()
+    assert repo.get_version("sess_evict") == 6
+
+    repo.append_event("sess_evict", _record(6))
+    summary = repo.get_event_summary("sess_evict")
+    assert summary.total_events == 7
+    assert summary.memory.turns == 7
+    assert [item.scene_summary for item in repo.iter_events("sess_evict")] == [
+        f"场景{i}" for i in range(3, 7)
+    ]
+
+    repo.save_snapshot(
+        session_id="sess_evict",
+        event_type="decision",
+        ai_state={"turn": 7},
+        last_output={},
+        expected_version=6,
+    )
+    repo.flush()
+    assert backend.get_version("sess_evict") == repo.get_version("sess_evict") == 7
+    assert backend.get_event_summary("sess_evict") == repo.get_event_summary("sess_evict")
+    repo.close()
+
+
+class _CountingBackend(MemoryStateRepository):
+    def __init__(self, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.snapshot_reads = 0
+
+    def get_snapshot(self, session_id: str):
+        self.snapshot_reads += 1
+        return super().get_snapshot(session_id)
+
+
+def test_write_behind_looks_up_new_session_once():
+    backend = _CountingBackend(stripes=1)
+    repo = WriteBehindStateRepository(backend, flush_interval=60)
+
+    repo.preload("sess_new")
+    assert repo.get_version("sess_new") == 0
+    assert repo.get_snapshot("sess_new") is None
+    assert repo.get_event_summary("sess_new") is None
+    assert list(repo.iter_events("sess_new")) == []
+    assert backend.snapshot_reads == 1
+
+    repo.append_event("sess_new", _record(0))
+    assert repo.get_event_summary("sess_new").total_events == 1
+    repo.close()
+
+
+def test_write_behind_backfill_does_not_wait_for_flush_lock():
+    backend = DuckDBStateRepository(":memory:")
+    repo = WriteBehindStateRepository(backend, flush_interval=60)
+    for idx in range(3):
+        repo.append_event("sess_lock", _record(idx))
+    repo.flush()
+    repo.append_event("sess_lock", _record(3))
+    repo.front.clear()
+
+    # 刷盘锁被占用（例如慢批次正在写入）时，回填照常从后端读取并叠加队列
+    with repo._write_lock:
+        summary = repo.get_event_summary("sess_lock")
+
+    assert summary.total_events == 4
+    assert [item.scene_summary for item in repo.iter_events("sess_lock")] == [
+        f"场景{i}" for i in range(4)
+    ]
+    repo.close()
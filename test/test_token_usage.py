@@ -0,0 +1,89 @@
+import asyncio
+import json
+from contextlib import aclosing
+
+import httpx
+from fastapi.testclient import TestClient
+
+from core.deepseek_config import DeepSeekConfig
+from main import app
+from prompts.init_prompt import INIT_SYSTEM_PROMPT
+from services.ai.deepseek_client import AsyncDeepSeekProvider
+from services.ai.token_usage import TokenUsage, collect_usage, get_usage_ledger, record_usage
+from test.test_invoke_stream import _build_init_request, _valid_init_output
+
+client = TestClient(app)
+
+
+def test_invoke_reports_usage_in_meta_and_ledger(monkeypatch):
+    async def fake_complete_prompt(self, prompt: str, **kwargs):
+        assert kwargs["system_prompt"] == INIT_SYSTEM_PROMPT
+        record_usage(
+            TokenUsage.from_response(
+                {"prompt_tokens": 1000, "completion_tokens": 200, "prompt_cache_hit_tokens": 600}
+            )
+        )
+        return json.dumps(_valid_init_output(), ensure_ascii=False)
+
+    monkeypatch.setattr(
+        "services.ai.deepseek_client.AsyncDeepSeekProvider.complete_prompt",
+        fake_complete_prompt,
+    )
+    get_usage_ledger().clear()
+
+    body = _build_init_request()
+    body["session"]["session_id"] = "sess_usage"
+    data = client.post("/invoke", json=body).json()
+
+    assert data["code"] == 0
+    usage = data["data"]["meta"]["usage"]
+    assert usage["prompt_tokens"] == 1000
+    assert usage["cached_tokens"] == 600
+    assert usage["cache_hit_ratio"] == 0.6
+    assert usage["total_tokens"] == 1200
+    assert usage["calls"] == 1
+    assert usage["cost"] > 0
+    assert data["data"]["meta"]["prompt_tokens_estimate"] > 0
+
+    report = client.get("/admin/usage").json()["data"]
+    assert report["by_event_type"]["init"]["completion_tokens"] == 200
+    assert report["by_template"][0]["template"] == "init_prompt"
+    assert report["top_sessions"][0]["session_id"] == "sess_usage"
+
+    session = client.get("/admin/usage/sess_usage").json()
+    assert session["data"]["total_tokens"] == 1200
+    assert client.get("/admin/usage/sess_unknown").json()["code"] == 404
+
+
+def test_stream_records_usage_after_early_close():
+    raw = json.dumps(_valid_init_output(), ensure_ascii=False)
+    frames = [
+        {"choices": [{"delta": {"content": raw}}]},
+        {"choices": [{"delta": {}, "finish_reason": "stop"}]},
+        {"choices": [], "usage": {"prompt_tokens": 50, "completion_tokens": 30}},
+    ]
+    sse = "".join(f"data: {json.dumps(frame)}\n\n" for frame in frames) + "data: [DONE]\n\n"
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        assert json.loads(request.content)["stream_options"] == {"include_usage": True}
+        return httpx.Response(200, content=sse.encode())
+
+    async def run() -> TokenUsage:
+        provider = AsyncDeepSeekProvider(config=DeepSeekConfig(api_key="x"))
+        provider._client = httpx.AsyncClient(
+            base_url="https://example.test",
+            transport=httpx.MockTransport(handler),
+        )
+        with collect_usage() as usage:
+            stream = provider.stream_prompt("prompt", temperature=0)
+            async with aclosing(stream):
+                async for chunk in stream:
+                    assert chunk == raw
+                    break
+        await provider.aclose()
+        return usage
+
+    usage = asyncio.run(run())
+    assert usage.calls == 1
+    assert usage.prompt_tokens == 50
+    assert usage.completion_tokens == 30
@@ -0,0 +1,336 @@
+import json
+import re
+from dataclasses import dataclass
+from json.decoder import scanstring
+from typing import Any
+
+from core.llm_exceptions import LLMJsonParseError, LLMTruncatedOutputError
+
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_NUMBER = re.compile(r"-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][-+]?\d+)?")
+_NUMBER_CHARS = re.compile(r"[-+0-9.eE]+")
+_PARTIAL_UNICODE_ESCAPE = re.compile(r"\\u[0-9a-fA-F]{0,3}$")
+_DANGLING_HIGH_SURROGATE = re.compile(r"\\u[dD][89abAB][0-9a-fA-F]{2}$")
+_LITERALS = {"true": True, "false": False, "null": None}
+_DECODER = json.JSONDecoder()
+
+
+JsonPath = tuple[str | int, ...]
+
+
+@dataclass(frozen=True)
+class JsonStreamEvent:
+    """
+    增量解析过程中产生的事件。
+
+    - kind="text"：text_paths 上字符串字段的新增文本，data 为增量文本
+    - kind="value"：value_paths 上的值已完整闭合，data 为该值
+    - kind="done"：第一个顶层对象已闭合，data 为完整对象
+    """
+
+    kind: str
+    path: JsonPath
+    data: Any
+
+
+class IncrementalJsonParser:
+    """
+    面向模型输出的增量 JSON 解析器。
+
+    - feed() 可多次输入 token 块，返回本次产生的事件列表
+    - 跳过第一个 { 之前的任何内容（代码块标记、解释文字）
+    - 第一个顶层对象闭合后 done=True，调用方可据此提前结束流
+    - text_paths：字符串字段在闭合前即可逐块拿到解码后的文本
+    - value_paths：子对象 / 数组一旦闭合即可拿到完整值（如 payload.options）
+
+    字符串与数字交给 json 模块的 C 扫描器处理，不逐字符循环。
+    路径中对象用 key，数组用下标。
+    """
+
+    def __init__(
+        self,
+        *,
+        text_paths: tuple[JsonPath, ...] = (),
+        value_paths: tuple[JsonPath, ...] = (),
+    ) -> None:
+        self._text_paths = {tuple(path) for path in text_paths}
+        self._value_paths = {tuple(path) for path in value_paths}
+        self._track_paths = bool(self._text_paths or self._value_paths)
+
+        self._buf = ""
+        self._pos = 0
+        self._offset = 0
+
+        self._started = False
+        self._done = False
+        self._value: dict[str, Any] | None = None
+        self.start: int | None = None
+        self.end: int | None = None
+
+        # 每层：[容器, 当前 key, 容器自身路径]
+        self._stack: list[list[Any]] = []
+        self._expect = "value"
+        self._partial_emitted = 0
+        # 未闭合字符串已确认不含引号的位置（绝对偏移），避免每块都从头重扫
+        self._unterminated_hint = 0
+
+    @property
+    def done(self) -> bool:
+        return self._done
+
+    @property
+    def value(self) -> dict[str, Any] | None:
+        return self._value
+
+    def feed(self, chunk: str) -> list[JsonStreamEvent]:
+        if self._done or not chunk:
+            return []
+
+        if self._pos:
+            self._offset += self._pos
+            self._buf = self._buf[self._pos :]
+            self._pos = 0
+        self._buf += chunk
+
+        events: list[JsonStreamEvent] = []
+        self._run(events)
+        return events
+
+    def close(self) -> dict[str, Any]:
+        """
+        输入结束时调用：返回完整对象，或抛出对应的解析异常。
+        """
+        if not self._started:
+            raise LLMJsonParseError("No JSON object found in model output")
+        if not self._done:
+            raise LLMTruncatedOutputError("Incomplete JSON object in model output")
+        return self._value
+
+    @classmethod
+    def parse_document(cls, text: str) -> tuple[dict[str, Any], int, int]:
+        """
+        非流式入口：解析 text 中的第一个 JSON 对象。
+
+        完整输入时先走 C 实现的 raw_decode；只有失败时才用增量状态机
+        区分“不完整”与“非法”，保证两种模式的判定一致。
+        返回 (对象, 起始位置, 结束位置)。
+        """
+        start = text.find("{")
+        if start == -1:
+            raise LLMJsonParseError("No JSON object found in model output")
+
+        try:
+            data, end = _DECODER.raw_decode(text, start)
+            return data, start, end
+        except json.JSONDecodeError:
+            pass
+
+        parser = cls()
+        parser.feed(text[start:])
+        data = parser.close()
+        return data, start, start + parser.end
+
+    def _run(self, events: list[JsonStreamEvent]) -> None:
+        buf = self._buf
+        n = len(buf)
+        pos = self._pos
+
+        if not self._started:
+            idx = buf.find("{", pos)
+            if idx == -1:
+                self._pos = n
+                return
+            self._started = True
+            self.start = self._offset + idx
+            self._push({}, ())
+            self._expect = "key_or_close"
+            pos = idx + 1
+
+        while not self._done:
+            pos = _WHITESPACE.match(buf, pos).end()
+            if pos >= n:
+                break
+
+            ch = buf[pos]
+            expect = self._expect
+
+            if expect == "comma_or_close":
+                if ch == ",":
+                    pos += 1
+                    self._expect = "key" if isinstance(self._stack[-1][0], dict) else "value"
+                elif ch == "}" or ch == "]":
+                    pos = self._close(ch, pos, events)
+                else:
+                    self._invalid(f"expecting ',' or closing bracket, got {ch!r}", pos)
+
+            elif expect == "key" or expect == "key_or_close":
+                if ch == "}" and expect == "key_or_close":
+                    pos = self._close(ch, pos, events)
+                    continue
+                if ch != '"':
+                    self._invalid(f"expecting property name, got {ch!r}", pos)
+                key, end = self._scan_string(buf, pos)
+                if end < 0:
+                    break
+                self._stack[-1][1] = key
+                self._expect = "colon"
+                pos = end
+
+            elif expect == "colon":
+                if ch != ":":
+                    self._invalid(f"expecting ':', got {ch!r}", pos)
+                self._expect = "value"
+                pos += 1
+
+            else:
+                if ch == "]" and expect == "value_or_close":
+                    pos = self._close(ch, pos, events)
+                elif ch == "{":
+                    self._push({}, self._child_path())
+                    self._expect = "key_or_close"
+                    pos += 1
+                elif ch == "[":
+                    self._push([], self._child_path())
+                    self._expect = "value_or_close"
+                    pos += 1
+                elif ch == '"':
+                    path = self._child_path()
+                    watched = self._track_paths and path in self._text_paths
+                    value, end = self._scan_string(buf, pos)
+                    if end < 0:
+                        if watched:
+                            self._emit_partial_text(buf, pos, path, events)
+                        break
+                    if watched:
+                        self._emit_text(value, path, events)
+                    self._partial_emitted = 0
+                    self._add_value(value, path, events)
+                    pos = end
+                else:
+                    value, end = self._scan_scalar(buf, pos)
+                    if end < 0:
+                        break
+                    self._add_value(value, self._child_path(), events)
+                    pos = end
+
+        self._pos = pos
+
+    def _push(self, container: Any, path: JsonPath | None) -> None:
+        self._stack.append([container, None, path])
+
+    def _child_path(self) -> JsonPath | None:
+        if not self._track_paths:
+            return None
+        container, key, path = self._stack[-1]
+        if isinstance(container, dict):
+            return path + (key,)
+        return path + (len(container),)
+
+    def _close(self, ch: str, pos: int, events: list[JsonStreamEvent]) -> int:
+        container, _, path = self._stack[-1]
+        if (ch == "}") != isinstance(container, dict):
+            self._invalid(f"unexpected {ch!r}", pos)
+
+        self._stack.pop()
+        pos += 1
+
+        if not self._stack:
+            self._done = True
+            self._value = container
+            self.end = self._offset + pos
+            events.append(JsonStreamEvent("done", (), container))
+            return pos
+
+        self._add_value(container, path, events)
+        return pos
+
+    def _add_value(
+        self,
+        value: Any,
+        path: JsonPath | None,
+        events: list[JsonStreamEvent],
+    ) -> None:
+        container, key, _ = self._stack[-1]
+        if isinstance(container, dict):
+            container[key] = value
+        else:
+            container.append(value)
+
+        if self._track_paths and path in self._value_paths:
+            events.append(JsonStreamEvent("value", path, value))
+
+        self._expect = "comma_or_close"
+
+    def _scan_string(self, buf: str, pos: int) -> tuple[str, int]:
+        """
+        返回 (解码后的字符串, 结束位置)；字符串尚未闭合时结束位置为 -1。
+        """
+        hint = max(pos + 1, self._unterminated_hint - self._offset)
+        if buf.find('"', hint) == -1:
+            self._unterminated_hint = self._offset + len(buf)
+            return "", -1
+
+        try:
+            return scanstring(buf, pos + 1, True)
+        except json.JSONDecodeError as exc:
+            if exc.msg.startswith("Unterminated string"):
+                return "", -1
+            if exc.msg.startswith("Invalid \\uXXXX") and exc.pos + 6 > len(buf):
+                return "", -1
+            self._invalid(exc.msg, exc.pos)
+
+    def _scan_scalar(self, buf: str, pos: int) -> tuple[Any, int]:
+        match = _NUMBER_CHARS.match(buf, pos)
+        if match:
+            end = match.end()
+            if end >= len(buf):
+                # 数字可能还没输出完
+                return None, -1
+            text = match.group(0)
+            if not _NUMBER.fullmatch(text):
+                self._invalid(f"invalid number {text!r}", pos)
+            if "." in text or "e" in text or "E" in text:
+                return float(text), end
+            return int(text), end
+
+        for literal, value in _LITERALS.items():
+            if buf.startswith(literal, pos):
+                return value, pos + len(literal)
+            if literal.startswith(buf[pos:]):
+                return None, -1
+
+        self._invalid(f"unexpected character {buf[pos]!r}", pos)
+
+    def _emit_text(self, value: str, path: JsonPath, events: list[JsonStreamEvent]) -> None:
+        delta = value[self._partial_emitted :]
+        if delta:
+            events.append(JsonStreamEvent("text", path, delta))
+
+    def _emit_partial_text(
+        self,
+        buf: str,
+        pos: int,
+        path: JsonPath,
+        events: list[JsonStreamEvent],
+    ) -> None:
+        raw = buf[pos + 1 :]
+
+        trailing = len(raw) - len(raw.rstrip("\\"))
+        if trailing % 2:
+            raw = raw[:-1]
+        raw = _PARTIAL_UNICODE_ESCAPE.sub("", raw)
+        raw = _DANGLING_HIGH_SURROGATE.sub("", raw)
+
+        try:
+            decoded, _ = scanstring(raw + '"', 0, False)
+        except json.JSONDecodeError:
+            return
+
+        delta = decoded[self._partial_emitted :]
+        if delta:
+            events.append(JsonStreamEvent("text", path, delta))
+            self._partial_emitted = len(decoded)
+
+    def _invalid(self, message: str, pos: int) -> None:
+        raise LLMJsonParseError(f"Invalid JSON: {message} (char {self._offset + pos})")